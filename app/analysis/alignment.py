@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from app.model import get_group_by_aggregator, CIRCULAR_MEAN
+from app.utils import mean_angle_from_components
+
+LINEAR: str = "linear"
+CIRCULAR: str = "circular"
+ACCUMULATION: str = "accumulation"  # Amounts per time step, resampled through their cumulative sum
+
+# Period covered by a precipitation amount relative to its timestamp; sources not listed report the preceding step
+PRECIPITATION_PERIODS: dict[str, str] = {
+    "met_no": "following"  # next_1_hours
+}
+
+
+def get_alignment_methods() -> dict[str, str]:
+    methods: dict[str, str] = {}
+
+    for feature, function in get_group_by_aggregator().items():
+        if function == CIRCULAR_MEAN:
+            methods[feature] = CIRCULAR
+        elif feature == "precipitation":
+            methods[feature] = ACCUMULATION
+        else:
+            methods[feature] = LINEAR
+
+    return methods
+
+
+@dataclass
+class AlignedForecasts:
+    sources: list[str]
+    times: pd.DatetimeIndex
+    features: dict[str, np.ndarray]  # Feature name -> values with shape (source, time)
+
+    def get_feature(self, feature: str, source: Optional[str] = None) -> np.ndarray:
+        values: np.ndarray = self.features[feature]
+
+        if source is None:
+            return values
+
+        return values[self.sources.index(source)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        index: pd.MultiIndex = pd.MultiIndex.from_product([self.sources, self.times], names=["source", "time"])
+
+        return pd.DataFrame({feature: values.ravel() for feature, values in self.features.items()}, index=index)
+
+
+def _interpolate(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    present: np.ndarray = ~np.isnan(values)
+
+    if not present.any():
+        return np.full(len(grid), np.nan)
+
+    # No extrapolation: grid points outside the source's own range stay NaN
+    return np.interp(grid, times[present], values[present], left=np.nan, right=np.nan)
+
+
+def _interpolate_angles(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    radians: np.ndarray = np.deg2rad(values)
+
+    return mean_angle_from_components(_interpolate(times, np.sin(radians), grid),
+                                      _interpolate(times, np.cos(radians), grid))
+
+
+def _resample_amounts(times: np.ndarray, values: np.ndarray, grid: np.ndarray, step: int, period: str) -> np.ndarray:
+    # Amounts become a cumulative curve over period boundaries; each grid step takes the difference across it
+    steps: np.ndarray = np.diff(times)
+    first_step: int = int(steps[0]) if len(steps) > 0 else step
+    last_step: int = int(steps[-1]) if len(steps) > 0 else step
+
+    if period == "following":
+        boundaries: np.ndarray = np.append(times, times[-1] + last_step)
+    else:
+        boundaries = np.insert(times, 0, times[0] - first_step)
+
+    missing: np.ndarray = np.isnan(values)
+    cumulative: np.ndarray = np.insert(np.cumsum(np.where(missing, 0.0, values)), 0, 0.0)
+    cumulative_missing: np.ndarray = np.insert(np.cumsum(missing), 0, 0).astype(np.float64)
+
+    boundary_values: np.ndarray = np.interp(grid, boundaries, cumulative, left=np.nan, right=np.nan)
+    previous_values: np.ndarray = np.interp(grid - step, boundaries, cumulative, left=np.nan, right=np.nan)
+    missing_count: np.ndarray = (np.interp(grid, boundaries, cumulative_missing) -
+                                 np.interp(grid - step, boundaries, cumulative_missing))
+
+    # Grid steps overlapping a missing amount are unknown rather than dry
+    return np.where(missing_count > 0, np.nan, boundary_values - previous_values)
+
+
+def align_forecasts(dataframe: pd.DataFrame,
+                    start: Optional[Union[datetime, pd.Timestamp]] = None,
+                    end: Optional[Union[datetime, pd.Timestamp]] = None,
+                    step: str = "1h",
+                    time_column: str = "forecast_datetime",
+                    features: Optional[list[str]] = None,
+                    methods: Optional[dict[str, str]] = None
+                    ) -> AlignedForecasts:
+    # Expects one row per (source, time), as produced by group_forecasts and the rollups
+    methods = {**get_alignment_methods(), **(methods or {})}
+    features = features or list(get_group_by_aggregator())
+
+    times: np.ndarray = pd.to_datetime(dataframe[time_column]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    step_delta: pd.Timedelta = pd.Timedelta(step)
+
+    if start is None:
+        start = pd.Timestamp(times.min()).floor(step_delta) if len(times) > 0 else pd.Timestamp(0)
+    if end is None:
+        end = pd.Timestamp(times.max()).ceil(step_delta) if len(times) > 0 else pd.Timestamp(start)
+
+    grid_index: pd.DatetimeIndex = pd.date_range(start, end, freq=step_delta)
+    grid: np.ndarray = grid_index.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    source_codes, sources = pd.factorize(dataframe["source"], sort=False)
+    order: np.ndarray = np.lexsort((times, source_codes))
+    bounds: np.ndarray = np.searchsorted(source_codes[order], np.arange(len(sources) + 1))
+
+    aligned: dict[str, np.ndarray] = {feature: np.full((len(sources), len(grid)), np.nan) for feature in features}
+
+    for source_code, source in enumerate(sources):
+        rows: np.ndarray = order[bounds[source_code]:bounds[source_code + 1]]
+        source_times: np.ndarray = times[rows]
+
+        for feature in features:
+            values: np.ndarray = pd.to_numeric(dataframe[feature].iloc[rows], errors="coerce") \
+                .to_numpy(dtype=np.float64)
+            method: str = methods[feature]
+
+            if method == CIRCULAR:
+                aligned[feature][source_code] = _interpolate_angles(source_times, values, grid)
+            elif method == ACCUMULATION:
+                aligned[feature][source_code] = _resample_amounts(source_times, values, grid, step_delta.value,
+                                                                  PRECIPITATION_PERIODS.get(source, "preceding"))
+            else:
+                aligned[feature][source_code] = _interpolate(source_times, values, grid)
+
+    return AlignedForecasts(list(sources), grid_index, aligned)
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Optional
+
+import matplotlib
+import pandas as pd
+from matplotlib.figure import Figure
+
+from app.analysis.alignment import AlignedForecasts
+from app.analysis.forecast_sources_comparison import get_source_comparison, draw_source_comparison
+from app.analysis.functions import filter_forecasts, get_comparable_features, get_sources
+from app.analysis.single_day_forecast_plot import get_day_forecasts, draw_day_forecasts
+from app.analysis.single_month_forecast_plot import get_month_aggregates, draw_month_forecasts
+from app.storage import load_forecasts_into_dataframe
+
+MANIFEST_FILE_NAME: str = "_render_manifest.json"
+
+FIGURE_SIZE: tuple[int, int] = (12, 6)
+
+
+@dataclass
+class RenderJob:
+    view: str  # "day", "month" or "sources"
+    latitude: float
+    longitude: float
+    parameters: tuple  # (forecast_date, request_date), (forecast_year, forecast_month) or (date_start, date_end)
+    features: list[str]
+    sources: list[str]
+    formats: tuple[str, ...]
+    output_directory: str
+    dataframe: Optional[pd.DataFrame] = field(repr=False, default=None)  # Only the rows this job reads
+
+    @property
+    def key(self) -> str:
+        return f"{self.latitude}_{self.longitude}/{self.view}_{'_'.join(str(value) for value in self.parameters)}"
+
+
+def _select_job_dataframe(dataframe: pd.DataFrame, view: str, latitude: float, longitude: float,
+                          parameters: tuple) -> pd.DataFrame:
+    if view == "day":
+        forecast_date, request_date = parameters
+        return filter_forecasts(dataframe, latitude, longitude, forecast_date, forecast_date, request_date,
+                                request_date)
+
+    if view == "month":
+        forecast_year, forecast_month = parameters
+        month_start: pd.Timestamp = pd.Timestamp(forecast_year, forecast_month, 1)
+        month_end: pd.Timestamp = month_start + pd.offsets.MonthEnd(1)
+        return filter_forecasts(dataframe, latitude, longitude, month_start.date(), month_end.date())
+
+    date_start, date_end = parameters
+    return filter_forecasts(dataframe, latitude, longitude, request_date_start=date_start, request_date_end=date_end)
+
+
+def get_job_hash(job: RenderJob) -> str:
+    # Rendered files only change when the rows they read or the job itself change
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(job.dataframe, index=False).to_numpy().tobytes())
+    digest.update(repr((job.view, job.parameters, job.features, job.sources, job.formats)).encode())
+
+    return digest.hexdigest()
+
+
+def _save_figure(figure: Figure, path: Path, formats: tuple[str, ...]) -> list[str]:
+    paths: list[str] = []
+
+    for file_format in formats:
+        file_path: Path = path.with_name(f"{path.name}.{file_format}")
+        figure.savefig(file_path, format=file_format)
+        paths.append(str(file_path))
+
+    return paths
+
+
+def _new_axes() -> tuple[Figure, Any]:
+    # Figures are created without pyplot, so nothing is kept in global state between renders
+    figure: Figure = Figure(figsize=FIGURE_SIZE)
+
+    return figure, figure.add_subplot()
+
+
+def _init_worker() -> None:
+    # Workers render without a display; the importing process keeps its own backend
+    matplotlib.use("Agg")
+
+
+def render_job(job: RenderJob) -> list[str]:
+    directory: Path = Path(job.output_directory) / f"{job.latitude}_{job.longitude}"
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: list[str] = []
+
+    if job.view == "day":
+        forecast_date, request_date = job.parameters
+        aligned: AlignedForecasts = get_day_forecasts(job.dataframe, job.latitude, job.longitude, forecast_date,
+                                                      request_date)
+
+        for feature in job.features:
+            figure, ax = _new_axes()
+            draw_day_forecasts(ax, aligned, feature, forecast_date, request_date)
+            figure.tight_layout()
+            paths += _save_figure(figure, directory / f"day_{forecast_date}_from_{request_date}_{feature}",
+                                  job.formats)
+
+    elif job.view == "month":
+        forecast_year, forecast_month = job.parameters
+        grouped_dataframes: dict[str, pd.DataFrame] = get_month_aggregates(job.dataframe, job.latitude,
+                                                                           job.longitude, forecast_year,
+                                                                           forecast_month, job.features)
+
+        for feature in job.features:
+            figure, ax = _new_axes()
+            draw_month_forecasts(ax, grouped_dataframes[feature], feature, forecast_year, forecast_month)
+            figure.tight_layout()
+            paths += _save_figure(figure, directory / f"month_{forecast_year}-{forecast_month:02}_{feature}",
+                                  job.formats)
+
+    else:
+        date_start, date_end = job.parameters
+        aligned = get_source_comparison(job.dataframe, job.latitude, job.longitude, date_start, date_end,
+                                        job.features)
+
+        for feature in job.features:
+            for source_a, source_b in combinations(job.sources, 2):
+                figure, ax = _new_axes()
+                draw_source_comparison(ax, aligned, feature, source_a, source_b)
+                figure.tight_layout()
+                paths += _save_figure(
+                    figure, directory / f"sources_{date_start}_{date_end}_{feature}_{source_a}_vs_{source_b}",
+                    job.formats)
+
+    return paths
+
+
+def _read_manifest(output_directory: str) -> dict[str, dict[str, Any]]:
+    path: Path = Path(output_directory) / MANIFEST_FILE_NAME
+
+    if not path.exists():
+        return {}
+
+    return json.loads(path.read_text())
+
+
+def _write_manifest(output_directory: str, manifest: dict[str, dict[str, Any]]) -> None:
+    path: Path = Path(output_directory) / MANIFEST_FILE_NAME
+    temporary_path: Path = path.with_name(path.name + ".tmp")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path.write_text(json.dumps(manifest, indent=1))
+    os.replace(temporary_path, path)
+
+
+def _is_rendered(manifest: dict[str, dict[str, Any]], job: RenderJob, job_hash: str) -> bool:
+    entry: Optional[dict[str, Any]] = manifest.get(job.key)
+
+    return entry is not None and entry["hash"] == job_hash and all(Path(path).exists() for path in entry["files"])
+
+
+def render_reports(dataframe: pd.DataFrame,
+                   output_directory: str,
+                   forecast_day: Optional[tuple[date, date]] = None,
+                   forecast_month: Optional[tuple[int, int]] = None,
+                   date_range: Optional[tuple[date, date]] = None,
+                   locations: Optional[list[tuple[float, float]]] = None,
+                   features: Optional[list[str]] = None,
+                   formats: tuple[str, ...] = ("png",),
+                   max_workers: Optional[int] = None,
+                   force: bool = False
+                   ) -> tuple[int, int]:
+    features = features or get_comparable_features()
+    sources: list[str] = sorted(get_sources(dataframe))
+    views: list[tuple[str, tuple]] = [
+        (view, parameters) for view, parameters in
+        (("day", forecast_day), ("month", forecast_month), ("sources", date_range)) if parameters is not None
+    ]
+
+    manifest: dict[str, dict[str, Any]] = _read_manifest(output_directory)
+    jobs: list[tuple[RenderJob, str]] = []
+    skipped: int = 0
+
+    # Each job carries only the rows of its location and period, hashed before any work is sent out
+    for (latitude, longitude), location_dataframe in dataframe.groupby(["latitude", "longitude"], sort=False):
+        if locations is not None and (latitude, longitude) not in locations:
+            continue
+
+        for view, parameters in views:
+            job_dataframe: pd.DataFrame = _select_job_dataframe(location_dataframe, view, latitude, longitude,
+                                                                parameters)
+            if len(job_dataframe) == 0:
+                continue
+
+            job: RenderJob = RenderJob(view, latitude, longitude, tuple(parameters), features, sources, formats,
+                                       output_directory, job_dataframe)
+            job_hash: str = get_job_hash(job)
+
+            if not force and _is_rendered(manifest, job, job_hash):
+                skipped += 1
+                continue
+
+            jobs.append((job, job_hash))
+
+    rendered: int = 0
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures: dict[Future, tuple[RenderJob, str]] = {executor.submit(render_job, job): (job, job_hash)
+                                                        for job, job_hash in jobs}
+
+        for future in as_completed(futures):
+            job, job_hash = futures[future]
+
+            try:
+                manifest[job.key] = {"hash": job_hash, "files": future.result()}
+                rendered += 1
+            except Exception as exception:
+                print(f"Error rendering {job.key}: {exception}")
+
+    _write_manifest(output_directory, manifest)
+
+    return rendered, skipped
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Render analysis plots for every location")
+    parser.add_argument("file_path", nargs="?", default="../../data/forecasts.csv")
+    parser.add_argument("--output-directory", default="../../data/reports")
+    parser.add_argument("--day", nargs=2, type=date.fromisoformat, metavar=("FORECAST_DATE", "REQUEST_DATE"))
+    parser.add_argument("--month", nargs=2, type=int, metavar=("YEAR", "MONTH"))
+    parser.add_argument("--date-range", nargs=2, type=date.fromisoformat, metavar=("START", "END"))
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=["png", "svg"])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true")
+    arguments: argparse.Namespace = parser.parse_args()
+    matplotlib.use("Agg")
+
+    rendered_jobs, skipped_jobs = render_reports(load_forecasts_into_dataframe(arguments.file_path),
+                                                 arguments.output_directory,
+                                                 forecast_day=arguments.day,
+                                                 forecast_month=arguments.month,
+                                                 date_range=arguments.date_range,
+                                                 formats=tuple(arguments.formats),
+                                                 max_workers=arguments.workers,
+                                                 force=arguments.force)
+    print(f"Rendered {rendered_jobs} reports, skipped {skipped_jobs} unchanged")
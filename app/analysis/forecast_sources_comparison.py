@@ -1,70 +1,137 @@
 from datetime import date
 from itertools import combinations
-from typing import Optional
+from typing import Optional, Union
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-
-from app.analysis.functions import filter_forecasts_by_forecast_date_range, \
-    filter_forecasts_by_latitude_and_longitude, get_group_by_aggregator, get_comparable_features
-from app.storage import load_forecasts_into_dataframe
-
-
-def compare_forecast_sources(dataframe: pd.DataFrame,
+from matplotlib.axes import Axes
+from matplotlib.lines import Line2D
+
+from app.analysis.alignment import AlignedForecasts, align_forecasts, LINEAR
+from app.analysis.functions import filter_forecasts, group_forecasts, get_comparable_features, get_sources
+from app.analysis.query import ForecastQuery
+from app.analysis.streaming import StreamingSource, stream_get_sources, stream_group_forecasts
+from app.instrumentation import metrics
+from app.rollups import ForecastRollups
+from app.storage import get_store_rollups
+
+
+@metrics.timed("analyze", view="sources")
+def get_source_comparison(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
+                          latitude: float,
+                          longitude: float,
+                          date_range_start: date,
+                          date_range_end: date,
+                          features: Optional[list[str]] = None,
+                          radius_km: Optional[float] = None,
+                          rollups: Optional[ForecastRollups] = None
+                          ) -> AlignedForecasts:
+    if rollups is not None and radius_km is None:
+        # Daily means come straight from the rollups maintained at ingest
+        dataframe = rollups.group_by_forecast_date(latitude, longitude, date_range_start, date_range_end)
+    elif isinstance(dataframe, StreamingSource):
+        # Stores larger than memory are grouped chunk by chunk
+        dataframe = stream_group_forecasts(dataframe, ["source", "forecast_date"], latitude, longitude,
+                                           request_date_start=date_range_start, request_date_end=date_range_end,
+                                           radius_km=radius_km)
+    else:
+        # Filter by latitude, longitude and date range (of requests, as in filter_forecasts_by_forecast_date_range)
+        dataframe = filter_forecasts(dataframe, latitude, longitude,
+                                     request_date_start=date_range_start, request_date_end=date_range_end,
+                                     radius_km=radius_km)
+
+        # Drop time from "forecast datetime" field
+        dataframe["forecast_datetime"] = dataframe["forecast_datetime"].dt.date
+        dataframe.rename(columns={"forecast_datetime": "forecast_date"}, inplace=True)
+
+        # Group data by source and forecast date (calculate means)
+        dataframe = group_forecasts(dataframe, ["source", "forecast_date"])
+
+    # Daily means are aligned onto one daily grid once; precipitation is already a daily mean here, not an amount
+    return align_forecasts(dataframe.reset_index(), step="1D", time_column="forecast_date", features=features,
+                           methods={"precipitation": LINEAR})
+
+
+def _get_source_values(aligned: AlignedForecasts, feature: str, source: str) -> np.ndarray:
+    # Sources without data keep their line, drawn empty
+    if source not in aligned.sources:
+        return np.full(len(aligned.times), np.nan)
+
+    return aligned.get_feature(feature, source)
+
+
+def _set_comparison_labels(ax: Axes, feature: str, source_a: str, source_b: str) -> None:
+    feature_title: str = feature.replace("_", " ").title()
+
+    ax.set_xlabel("Forecast date")
+    ax.set_ylabel(feature_title)
+    ax.set_title(f"{feature_title} comparison: {source_a} vs {source_b}")
+
+
+def draw_source_comparison(ax: Axes, aligned: AlignedForecasts, feature: str, source_a: str,
+                           source_b: str) -> list[Line2D]:
+    lines: list[Line2D] = []
+
+    for source in (source_a, source_b):
+        line, = ax.plot(aligned.times, _get_source_values(aligned, feature, source), label=source)
+        lines.append(line)
+
+    _set_comparison_labels(ax, feature, source_a, source_b)
+    ax.figure.autofmt_xdate(rotation=45)
+    ax.legend()
+    ax.grid()
+
+    return lines
+
+
+def update_source_comparison(ax: Axes, lines: list[Line2D], aligned: AlignedForecasts, feature: str,
+                             source_a: str, source_b: str) -> None:
+    # Only the data and labels of the existing lines change, the axes are not rebuilt
+    for line, source in zip(lines, (source_a, source_b)):
+        line.set_ydata(_get_source_values(aligned, feature, source))
+        line.set_label(source)
+
+    _set_comparison_labels(ax, feature, source_a, source_b)
+    ax.legend()
+    ax.relim()
+    ax.autoscale_view()
+
+
+def compare_forecast_sources(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
                              latitude: float,
                              longitude: float,
                              date_range_start: date,
                              date_range_end: date,
                              sources_to_compare: Optional[list[str]] = None,
-                             features_to_compare: Optional[list[str]] = None
+                             features_to_compare: Optional[list[str]] = None,
+                             radius_km: Optional[float] = None,
+                             rollups: Optional[ForecastRollups] = None
                              ) -> None:
     # Use all sources if none or single is specified
     if sources_to_compare is None or len(sources_to_compare) < 2:
-        sources_to_compare = list(dataframe["source"].unique())
+        sources_to_compare = stream_get_sources(dataframe) if isinstance(dataframe, StreamingSource) else \
+            get_sources(dataframe)
 
     # Use all features if none are specified
     if features_to_compare is None:
         features_to_compare = get_comparable_features()
 
-    # Filter by latitude, longitude and date range
-    dataframe = filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude)
-    dataframe = filter_forecasts_by_forecast_date_range(dataframe, date_range_start, date_range_end)
-
-    # Drop time from "forecast datetime" field
-    dataframe["forecast_datetime"] = dataframe["forecast_datetime"].dt.date
-    dataframe.rename(columns={"forecast_datetime": "forecast_date"}, inplace=True)
-
-    # Group data by source and forecast date (calculate means)
-    dataframe = dataframe.groupby(["source", "forecast_date"]).agg(get_group_by_aggregator())
-    dataframe = dataframe.reset_index()
-
-    pivot_dataframe: pd.DataFrame = dataframe.pivot(index="forecast_date", columns="source",
-                                                    values=features_to_compare).sort_index()
+    aligned: AlignedForecasts = get_source_comparison(dataframe, latitude, longitude, date_range_start,
+                                                      date_range_end, features_to_compare, radius_km, rollups)
 
     source_pairs: list[tuple[str, str]] = list(combinations(sources_to_compare, 2))
     current_source_pair_index: int = 0
     current_feature_index: int = 0
 
     fig, ax = plt.subplots(figsize=(12, 6))
+    lines: list[Line2D] = draw_source_comparison(ax, aligned, features_to_compare[current_feature_index],
+                                                 *source_pairs[current_source_pair_index])
 
     def plot_feature() -> None:
-        ax.clear()
         source_a, source_b = source_pairs[current_source_pair_index]
-        feature: str = features_to_compare[current_feature_index]
-
-        for source in (source_a, source_b):
-            y = pivot_dataframe[(feature, source)].interpolate(method="linear")
-            ax.plot(pivot_dataframe.index, y, label=source)
-
-        feature_title: str = feature.replace("_", " ").title()
-
-        ax.set_xlabel("Forecast date")
-        ax.set_ylabel(feature_title)
-        ax.set_title(f"{feature_title} comparison: {source_a} vs {source_b}")
-        fig.autofmt_xdate(rotation=45)
-        ax.legend()
-        ax.grid()
-        fig.canvas.draw()
+        update_source_comparison(ax, lines, aligned, features_to_compare[current_feature_index], source_a, source_b)
+        fig.canvas.draw_idle()
 
     def on_key(event):
         nonlocal current_source_pair_index, current_feature_index
@@ -84,7 +151,6 @@ def compare_forecast_sources(dataframe: pd.DataFrame,
         plot_feature()
 
     fig.canvas.mpl_connect("key_press_event", on_key)
-    plot_feature()
     plt.show()
 
 
@@ -92,10 +158,12 @@ if __name__ == "__main__":
     pd.set_option("display.max_columns", None)
     pd.set_option("display.width", 400)
 
-    dataframe: pd.DataFrame = load_forecasts_into_dataframe("../../data/forecasts.csv")
+    file_path: str = "../../data/forecasts.csv"
     latitude: float = 52.23
     longitude: float = 21.01
     date_start: date = date(2025, 8, 29)
     date_end: date = date(2025, 9, 1)
 
-    compare_forecast_sources(dataframe, latitude, longitude, date_start, date_end)
+    # Daily means come from the rollups; only the source names are streamed from the store
+    compare_forecast_sources(StreamingSource(file_path), latitude, longitude, date_start, date_end,
+                             rollups=get_store_rollups(file_path))
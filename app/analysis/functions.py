@@ -1,9 +1,16 @@
+import weakref
+from dataclasses import dataclass
 from datetime import datetime, date
-from typing import Any
+from typing import Any, Optional, Union
 
+import numpy as np
 import pandas as pd
 
-from app.utils import mean_angle
+from app.analysis.query import ForecastQuery
+from app.analysis.spatial_index import LocationIndex
+from app.instrumentation import metrics
+from app.model import CIRCULAR_MEAN, get_group_by_aggregator
+from app.utils import mean_angle_from_components
 
 
 def get_comparable_features() -> list[str]:
@@ -20,23 +27,11 @@ def get_comparable_features() -> list[str]:
     ]
 
 
-def get_group_by_aggregator() -> dict[str, Any]:
-    return {
-        "temperature": "mean",
-        "wind_speed": "mean",
-        "wind_direction": lambda x: mean_angle(x),
-        "precipitation": "mean",
-        "humidity": "mean",
-        "cloud_cover": "mean",
-        "air_pressure": "mean",
-        "uv_index": "mean",
-        "dew_point": "mean",
-        "visibility": "mean",
-    }
-
-
 def filter_forecasts_by_latitude_and_longitude(dataframe: pd.DataFrame, latitude: float,
-                                               longitude: float) -> pd.DataFrame:
+                                               longitude: float, radius_km: Optional[float] = None) -> pd.DataFrame:
+    if radius_km is not None:
+        return filter_forecasts_near_location(dataframe, latitude, longitude, radius_km)
+
     filtered_dataframe: pd.DataFrame = dataframe[
         (dataframe["latitude"] == latitude) &
         (dataframe["longitude"] == longitude)
@@ -45,6 +40,53 @@ def filter_forecasts_by_latitude_and_longitude(dataframe: pd.DataFrame, latitude
     return filtered_dataframe
 
 
+@dataclass
+class _DataFrameLocations:
+    rows: int  # Length of the dataframe the index was built for
+    location_index: LocationIndex
+    order: np.ndarray  # Row positions sorted by location
+    bounds: np.ndarray  # order[bounds[i]:bounds[i + 1]] are the rows of location i
+
+
+_dataframe_locations_cache: dict[int, _DataFrameLocations] = {}
+
+
+def _get_dataframe_locations(dataframe: pd.DataFrame) -> _DataFrameLocations:
+    # Built once per dataframe, like ForecastQuery.location_index, and dropped together with the dataframe
+    data_id: int = id(dataframe)
+    locations: Optional[_DataFrameLocations] = _dataframe_locations_cache.get(data_id)
+
+    if locations is None or locations.rows != len(dataframe):
+        codes, unique_locations = pd.factorize(pd.MultiIndex.from_arrays([dataframe["latitude"],
+                                                                          dataframe["longitude"]]))
+        order: np.ndarray = np.argsort(codes, kind="stable")
+        bounds: np.ndarray = np.searchsorted(codes[order], np.arange(len(unique_locations) + 1))
+
+        if data_id not in _dataframe_locations_cache:
+            weakref.finalize(dataframe, _dataframe_locations_cache.pop, data_id, None)
+
+        locations = _DataFrameLocations(len(dataframe), LocationIndex(list(unique_locations)), order, bounds)
+        _dataframe_locations_cache[data_id] = locations
+
+    return locations
+
+
+def filter_forecasts_near_location(dataframe: pd.DataFrame, latitude: float, longitude: float,
+                                   radius_km: float) -> pd.DataFrame:
+    locations: _DataFrameLocations = _get_dataframe_locations(dataframe)
+    nearby_locations: list[int] = locations.location_index.within_radius(latitude, longitude, radius_km)
+
+    if len(nearby_locations) == 0:
+        return dataframe.iloc[0:0]
+
+    # Only the rows of nearby locations are touched; sorting keeps the original row order
+    rows: np.ndarray = np.sort(np.concatenate([
+        locations.order[locations.bounds[location]:locations.bounds[location + 1]] for location in nearby_locations
+    ]))
+
+    return dataframe.iloc[rows]
+
+
 def filter_forecasts_by_forecast_datetime(dataframe: pd.DataFrame, forecast_datetime: datetime) -> pd.DataFrame:
     filtered_dataframe: pd.DataFrame = dataframe[dataframe["forecast_datetime"] == forecast_datetime]
 
@@ -73,7 +115,66 @@ def filter_forecasts_by_forecast_date_range(dataframe: pd.DataFrame, forecast_da
     return filtered_dataframe
 
 
+def get_sources(dataframe: Union[pd.DataFrame, ForecastQuery]) -> list[str]:
+    if isinstance(dataframe, ForecastQuery):
+        return dataframe.sources
+
+    return list(dataframe["source"].unique())
+
+
+def filter_forecasts(dataframe: Union[pd.DataFrame, ForecastQuery],
+                     latitude: float,
+                     longitude: float,
+                     forecast_date_start: Optional[date] = None,
+                     forecast_date_end: Optional[date] = None,
+                     request_date_start: Optional[date] = None,
+                     request_date_end: Optional[date] = None,
+                     radius_km: Optional[float] = None
+                     ) -> pd.DataFrame:
+    # Indexed stores answer the combined filter with one binary-search slice per location
+    if isinstance(dataframe, ForecastQuery):
+        return dataframe.select(latitude, longitude, forecast_date_start, forecast_date_end, request_date_start,
+                                request_date_end, radius_km)
+
+    filtered_dataframe: pd.DataFrame = filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude,
+                                                                                   radius_km)
+
+    if forecast_date_start is not None:
+        filtered_dataframe = filtered_dataframe[filtered_dataframe["forecast_datetime"].dt.date >= forecast_date_start]
+    if forecast_date_end is not None:
+        filtered_dataframe = filtered_dataframe[filtered_dataframe["forecast_datetime"].dt.date <= forecast_date_end]
+    if request_date_start is not None:
+        filtered_dataframe = filtered_dataframe[filtered_dataframe["request_datetime"].dt.date >= request_date_start]
+    if request_date_end is not None:
+        filtered_dataframe = filtered_dataframe[filtered_dataframe["request_datetime"].dt.date <= request_date_end]
+
+    return filtered_dataframe
+
+
+@metrics.timed("analyze", step="group_forecasts")
 def group_forecasts(dataframe: pd.DataFrame, group_by_columns: list[str]) -> pd.DataFrame:
-    grouped_dataframe: pd.DataFrame = dataframe.groupby(group_by_columns).agg(get_group_by_aggregator())
+    aggregator: dict[str, Any] = get_group_by_aggregator()
+    circular_columns: list[str] = [column for column, function in aggregator.items() if function == CIRCULAR_MEAN]
+
+    # Circular means become plain means of sin and cos, so every column uses the cythonized groupby
+    vectorized_aggregator: dict[str, Any] = {
+        column: function for column, function in aggregator.items() if function != CIRCULAR_MEAN
+    }
+    components: dict[str, np.ndarray] = {}
+
+    for column in circular_columns:
+        radians: np.ndarray = np.deg2rad(dataframe[column].to_numpy(dtype=np.float64))
+        components[f"{column}_sin"] = np.sin(radians)
+        components[f"{column}_cos"] = np.cos(radians)
+        vectorized_aggregator[f"{column}_sin"] = "mean"
+        vectorized_aggregator[f"{column}_cos"] = "mean"
+
+    value_columns: list[str] = [column for column in vectorized_aggregator if column not in components]
+    component_dataframe: pd.DataFrame = dataframe[group_by_columns + value_columns].assign(**components)
+    grouped_dataframe: pd.DataFrame = component_dataframe.groupby(group_by_columns).agg(vectorized_aggregator)
+
+    for column in circular_columns:
+        grouped_dataframe[column] = mean_angle_from_components(grouped_dataframe.pop(f"{column}_sin").to_numpy(),
+                                                               grouped_dataframe.pop(f"{column}_cos").to_numpy())
 
-    return grouped_dataframe
+    return grouped_dataframe[list(aggregator)]
@@ -0,0 +1,262 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.model import get_group_by_aggregator, CIRCULAR_MEAN
+from app.storage import iterate_dataframe_chunks
+from app.utils import mean_angle_from_components
+
+# Lead time bucket edges in hours; bucket i holds leads in [edges[i], edges[i + 1])
+LEAD_TIME_BUCKET_EDGES: tuple[int, ...] = (0, 3, 6, 12, 24, 48, 72, 96, 120, 144, 168, 240)
+
+HOUR_GROWTH: int = 24 * 7  # Hours allocated at once when the cube grows along the forecast hour axis
+
+DEFAULT_MAX_HOURS: int = 24 * 90  # Forecast hours kept per cube, counted back from the newest one
+
+HOUR_NANOSECONDS: int = 3600 * 10 ** 9
+
+
+def get_lead_time_bucket_labels() -> list[str]:
+    edges: tuple[int, ...] = LEAD_TIME_BUCKET_EDGES
+
+    return [f"{start}-{end}h" for start, end in zip(edges[:-1], edges[1:])]
+
+
+def _to_hours(datetimes: pd.Series) -> np.ndarray:
+    return pd.to_datetime(datetimes).to_numpy(dtype="datetime64[ns]").view(np.int64) // HOUR_NANOSECONDS
+
+
+class LeadTimeCube:
+    def __init__(self, feature: str, max_hours: Optional[int] = DEFAULT_MAX_HOURS) -> None:
+        self.feature: str = feature
+        self.is_circular: bool = get_group_by_aggregator().get(feature) == CIRCULAR_MEAN
+        self.max_hours: Optional[int] = max_hours  # None keeps every forecast hour
+        self.sources: list[str] = []
+        self.start_hour: int = 0
+
+        # Sums (sin and cos sums for angles) and counts per (source, forecast hour, lead time bucket)
+        bucket_count: int = len(LEAD_TIME_BUCKET_EDGES) - 1
+        self._sums: np.ndarray = np.zeros((0, 0, bucket_count, 2 if self.is_circular else 1), dtype=np.float32)
+        self._counts: np.ndarray = np.zeros((0, 0, bucket_count), dtype=np.int32)
+        self._values: Optional[np.ndarray] = None
+        self._newest_hour: Optional[int] = None
+
+    @property
+    def hour_count(self) -> int:
+        return self._counts.shape[1]
+
+    def get_forecast_datetimes(self) -> pd.DatetimeIndex:
+        hours: np.ndarray = np.arange(self.start_hour, self.start_hour + self.hour_count, dtype=np.int64)
+
+        return pd.DatetimeIndex((hours * HOUR_NANOSECONDS).view("datetime64[ns]"))
+
+    def get_hour_index(self, forecast_datetime: datetime) -> int:
+        return int(pd.Timestamp(forecast_datetime).value // HOUR_NANOSECONDS) - self.start_hour
+
+    def _grow(self, source_count: int, first_hour: int, last_hour: int) -> None:
+        # Grow in whole blocks of hours, so regular updates rarely reallocate
+        start_hour: int = self.start_hour if self.hour_count > 0 else first_hour
+        end_hour: int = start_hour + self.hour_count
+
+        if first_hour < start_hour:
+            start_hour -= -(-(start_hour - first_hour) // HOUR_GROWTH) * HOUR_GROWTH
+        if last_hour >= end_hour:
+            end_hour += -(-(last_hour + 1 - end_hour) // HOUR_GROWTH) * HOUR_GROWTH
+
+        # Hours that left the retention window are dropped once they fill a whole block
+        if self.max_hours is not None and start_hour + HOUR_GROWTH <= self._newest_hour - self.max_hours + 1:
+            start_hour = self._newest_hour - self.max_hours + 1
+
+        if source_count == self._counts.shape[0] and start_hour == self.start_hour and \
+                end_hour == self.start_hour + self.hour_count:
+            return
+
+        sums: np.ndarray = np.zeros((source_count, end_hour - start_hour) + self._sums.shape[2:], dtype=np.float32)
+        counts: np.ndarray = np.zeros((source_count, end_hour - start_hour) + self._counts.shape[2:], dtype=np.int32)
+
+        # Copy the hours both the old and the new range cover
+        sources: int = self._counts.shape[0]
+        copy_start: int = max(start_hour, self.start_hour)
+        copy_end: int = min(end_hour, self.start_hour + self.hour_count)
+
+        if copy_end > copy_start:
+            sums[:sources, copy_start - start_hour:copy_end - start_hour] = \
+                self._sums[:, copy_start - self.start_hour:copy_end - self.start_hour]
+            counts[:sources, copy_start - start_hour:copy_end - start_hour] = \
+                self._counts[:, copy_start - self.start_hour:copy_end - self.start_hour]
+
+        self._sums, self._counts, self.start_hour = sums, counts, start_hour
+
+    def update(self, sources: np.ndarray, forecast_hours: np.ndarray, lead_hours: np.ndarray,
+               values: np.ndarray) -> None:
+        bucket: np.ndarray = np.searchsorted(LEAD_TIME_BUCKET_EDGES, lead_hours, side="right") - 1
+        keep: np.ndarray = (lead_hours >= 0) & (bucket < len(LEAD_TIME_BUCKET_EDGES) - 1) & ~np.isnan(values)
+
+        if not keep.any():
+            return
+
+        newest_hour: int = int(forecast_hours[keep].max())
+        self._newest_hour = newest_hour if self._newest_hour is None else max(self._newest_hour, newest_hour)
+
+        if self.max_hours is not None:
+            keep &= forecast_hours > self._newest_hour - self.max_hours
+
+            if not keep.any():
+                return
+
+        sources, forecast_hours, bucket, values = sources[keep], forecast_hours[keep], bucket[keep], values[keep]
+
+        for source in pd.unique(sources):
+            if source not in self.sources:
+                self.sources.append(source)
+
+        source_codes: np.ndarray = pd.Index(self.sources).get_indexer(sources)
+        self._grow(len(self.sources), int(forecast_hours.min()), int(forecast_hours.max()))
+        hour_index: np.ndarray = forecast_hours - self.start_hour
+
+        if self.is_circular:
+            radians: np.ndarray = np.deg2rad(values)
+            components: np.ndarray = np.column_stack([np.sin(radians), np.cos(radians)])
+        else:
+            components = values[:, np.newaxis]
+
+        np.add.at(self._sums, (source_codes, hour_index, bucket), components)
+        np.add.at(self._counts, (source_codes, hour_index, bucket), 1)
+        self._values = None
+
+    def get_values(self) -> np.ndarray:
+        # Mean forecast per (source, forecast hour, lead time bucket); NaN where no forecast was made
+        if self._values is None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means: np.ndarray = self._sums / self._counts[..., np.newaxis]
+
+            if self.is_circular:
+                self._values = mean_angle_from_components(means[..., 0], means[..., 1])
+            else:
+                self._values = means[..., 0]
+
+        return self._values
+
+    def get_counts(self) -> np.ndarray:
+        return self._counts
+
+    def _difference(self, values: np.ndarray, reference: np.ndarray) -> np.ndarray:
+        difference: np.ndarray = values - reference
+
+        if self.is_circular:
+            return (difference + 180) % 360 - 180
+
+        return difference
+
+    def get_latest(self) -> np.ndarray:
+        # The shortest lead time with a forecast holds the latest value of each (source, forecast hour)
+        values: np.ndarray = self.get_values()
+        present: np.ndarray = ~np.isnan(values)
+        latest_bucket: np.ndarray = np.argmax(present, axis=2)[..., np.newaxis]
+        latest: np.ndarray = np.take_along_axis(values, latest_bucket, axis=2)[..., 0]
+
+        return latest
+
+    def get_spread(self) -> np.ndarray:
+        # Largest difference between any two sources per (forecast hour, lead time bucket)
+        values: np.ndarray = self.get_values()
+        spread: np.ndarray = np.full(values.shape[1:], np.nan)
+
+        for first in range(len(self.sources)):
+            for second in range(first + 1, len(self.sources)):
+                difference: np.ndarray = np.abs(self._difference(values[first], values[second]))
+                spread = np.fmax(spread, difference)
+
+        return spread
+
+    def get_spread_by_lead_time(self) -> np.ndarray:
+        return _nanmean(self.get_spread(), axis=0)
+
+    def get_drift(self, forecast_datetime: datetime) -> np.ndarray:
+        # Change of each source's forecast for one hour, relative to its latest forecast, per lead time bucket
+        hour_index: int = self.get_hour_index(forecast_datetime)
+        bucket_count: int = len(LEAD_TIME_BUCKET_EDGES) - 1
+
+        if not 0 <= hour_index < self.hour_count:
+            return np.full((len(self.sources), bucket_count), np.nan)
+
+        values: np.ndarray = self.get_values()[:, hour_index]
+
+        return self._difference(values, self.get_latest()[:, hour_index, np.newaxis])
+
+    def get_agreement_with_latest(self) -> np.ndarray:
+        # Mean absolute difference from the latest value per (source, lead time bucket)
+        difference: np.ndarray = np.abs(self._difference(self.get_values(), self.get_latest()[..., np.newaxis]))
+
+        return _nanmean(difference, axis=1)
+
+    def to_dataframe(self, values: np.ndarray) -> pd.DataFrame:
+        # Labels a (source, lead time bucket) result
+        return pd.DataFrame(values, index=pd.Index(self.sources, name="source"),
+                            columns=get_lead_time_bucket_labels())
+
+
+def _nanmean(values: np.ndarray, axis: int) -> np.ndarray:
+    counts: np.ndarray = np.sum(~np.isnan(values), axis=axis)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nansum(values, axis=axis) / np.where(counts > 0, counts, np.nan)
+
+
+class LeadTimeSkill:
+    def __init__(self, features: Optional[list[str]] = None, max_hours: Optional[int] = DEFAULT_MAX_HOURS) -> None:
+        self.features: list[str] = features or list(get_group_by_aggregator())
+        self.max_hours: Optional[int] = max_hours
+        self._cubes: dict[tuple[float, float], dict[str, LeadTimeCube]] = {}
+
+    @property
+    def locations(self) -> list[tuple[float, float]]:
+        return list(self._cubes)
+
+    def get_cube(self, latitude: float, longitude: float, feature: str) -> Optional[LeadTimeCube]:
+        return self._cubes.get((latitude, longitude), {}).get(feature)
+
+    def update(self, dataframe: pd.DataFrame) -> None:
+        if len(dataframe) == 0:
+            return
+
+        locations: pd.MultiIndex = pd.MultiIndex.from_arrays([dataframe["latitude"], dataframe["longitude"]])
+        location_codes, unique_locations = locations.factorize()
+
+        # Rows are sorted by location once, so every location is a contiguous slice
+        order: np.ndarray = np.argsort(location_codes, kind="stable")
+        bounds: np.ndarray = np.searchsorted(location_codes[order], np.arange(len(unique_locations) + 1))
+
+        forecast_hours: np.ndarray = _to_hours(dataframe["forecast_datetime"])[order]
+        lead_hours: np.ndarray = forecast_hours - _to_hours(dataframe["request_datetime"])[order]
+        sources: np.ndarray = dataframe["source"].to_numpy()[order]
+        values: dict[str, np.ndarray] = {
+            feature: pd.to_numeric(dataframe[feature], errors="coerce").to_numpy(dtype=np.float64)[order]
+            for feature in self.features
+        }
+
+        for location_code, location in enumerate(unique_locations):
+            rows: slice = slice(bounds[location_code], bounds[location_code + 1])
+            cubes: dict[str, LeadTimeCube] = self._cubes.setdefault(
+                location, {feature: LeadTimeCube(feature, self.max_hours) for feature in self.features})
+
+            for feature in self.features:
+                cubes[feature].update(sources[rows], forecast_hours[rows], lead_hours[rows], values[feature][rows])
+
+
+def build_lead_time_skill(file_path: str,
+                          features: Optional[list[str]] = None,
+                          locations: Optional[list[tuple[float, float]]] = None,
+                          chunk_size: int = 100_000,
+                          max_hours: Optional[int] = DEFAULT_MAX_HOURS
+                          ) -> LeadTimeSkill:
+    skill: LeadTimeSkill = LeadTimeSkill(features, max_hours)
+    columns: list[str] = ["source", "latitude", "longitude", "request_datetime", "forecast_datetime"] + skill.features
+
+    # The store is read in bounded chunks; new forecasts can be added later with update
+    for chunk in iterate_dataframe_chunks(file_path, chunk_size, columns, locations):
+        skill.update(chunk)
+
+    return skill
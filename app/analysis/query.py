@@ -0,0 +1,198 @@
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.analysis.spatial_index import LocationIndex
+
+
+def _to_day_numbers(datetimes: pd.Series) -> np.ndarray:
+    days: np.ndarray = datetimes.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    days[datetimes.isna().to_numpy()] = np.iinfo(np.int64).min
+
+    return days
+
+
+class ForecastQuery:
+    def __init__(self, dataframe: pd.DataFrame) -> None:
+        self.dataframe: pd.DataFrame = dataframe
+        self.sources: list[str] = list(dataframe["source"].unique())
+
+        location_codes, locations = pd.MultiIndex.from_arrays(
+            [dataframe["latitude"], dataframe["longitude"]]).factorize()
+        self.locations: list[tuple[float, float]] = list(locations)
+        self._location_codes: dict[tuple[float, float], int] = {
+            location: code for code, location in enumerate(self.locations)
+        }
+
+        forecast_days: np.ndarray = _to_day_numbers(dataframe["forecast_datetime"])
+        request_days: np.ndarray = _to_day_numbers(dataframe["request_datetime"])
+
+        # Day offsets start at 1, offset 0 is reserved for missing dates so they never match a date filter
+        valid_days: np.ndarray = np.concatenate([forecast_days[forecast_days != np.iinfo(np.int64).min],
+                                                 request_days[request_days != np.iinfo(np.int64).min]])
+        self._first_day: int = int(valid_days.min()) if len(valid_days) > 0 else 0
+        self._max_offset: int = int(valid_days.max()) - self._first_day + 1 if len(valid_days) > 0 else 0
+        self._day_bits: int = max(1, self._max_offset.bit_length())
+
+        forecast_offsets: np.ndarray = self._to_offsets(forecast_days)
+        request_offsets: np.ndarray = self._to_offsets(request_days)
+        location_codes = location_codes.astype(np.int64)
+
+        # Sorted by (location, forecast day, request day) and by (location, request day)
+        forecast_keys: np.ndarray = self._compose(location_codes, forecast_offsets, request_offsets)
+        self._forecast_order: np.ndarray = np.argsort(forecast_keys, kind="stable")
+        self._forecast_keys: np.ndarray = forecast_keys[self._forecast_order]
+        self._forecast_request_offsets: np.ndarray = request_offsets[self._forecast_order]
+
+        request_keys: np.ndarray = self._compose(location_codes, np.zeros_like(request_offsets), request_offsets)
+        self._request_order: np.ndarray = np.argsort(request_keys, kind="stable")
+        self._request_keys: np.ndarray = request_keys[self._request_order]
+
+        self._location_index: Optional[LocationIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.dataframe)
+
+    def _to_offsets(self, days: np.ndarray) -> np.ndarray:
+        offsets: np.ndarray = days - self._first_day + 1
+        offsets[days == np.iinfo(np.int64).min] = 0
+
+        return offsets
+
+    def _to_offset(self, day: date) -> int:
+        return date.toordinal(day) - date(1970, 1, 1).toordinal() - self._first_day + 1
+
+    def _compose(self, location: np.ndarray, forecast_offset: np.ndarray, request_offset: np.ndarray) -> np.ndarray:
+        return (location << (2 * self._day_bits)) | (forecast_offset << self._day_bits) | request_offset
+
+    def _clamp_range(self, start: Optional[date], end: Optional[date]) -> Optional[tuple[int, int]]:
+        low: int = max(1, self._to_offset(start)) if start is not None else 1
+        high: int = min(self._max_offset, self._to_offset(end)) if end is not None else self._max_offset
+
+        if low > high:
+            return None
+
+        return low, high
+
+    def _search(self, keys: np.ndarray, low: tuple[int, int, int], high: tuple[int, int, int]) -> tuple[int, int]:
+        low_key: int = int(self._compose(*(np.array([value], dtype=np.int64) for value in low))[0])
+        high_key: int = int(self._compose(*(np.array([value], dtype=np.int64) for value in high))[0])
+
+        return int(np.searchsorted(keys, low_key, side="left")), int(np.searchsorted(keys, high_key, side="right"))
+
+    @property
+    def location_index(self) -> LocationIndex:
+        if self._location_index is None:
+            self._location_index = LocationIndex(self.locations)
+
+        return self._location_index
+
+    def get_location_row_range(self, location: int) -> tuple[int, int]:
+        # Rows of one location are contiguous in the (location, forecast day, request day) order
+        any_day: int = (1 << self._day_bits) - 1
+
+        return self._search(self._forecast_keys, (location, 0, 0), (location, any_day, any_day))
+
+    def get_row_range_positions(self, row_range: tuple[int, int]) -> np.ndarray:
+        start, end = row_range
+
+        return np.sort(self._forecast_order[start:end])
+
+    def find_locations(self,
+                       latitude: float,
+                       longitude: float,
+                       radius_km: Optional[float] = None,
+                       k: Optional[int] = None
+                       ) -> list[tuple[tuple[float, float], tuple[int, int]]]:
+        if k is not None:
+            location_ids: list[int] = self.location_index.nearest(latitude, longitude, k, radius_km)
+        elif radius_km is not None:
+            location_ids = self.location_index.within_radius(latitude, longitude, radius_km)
+        else:
+            exact: Optional[int] = self._location_codes.get((latitude, longitude))
+            location_ids = [exact] if exact is not None else []
+
+        return [(self.locations[location], self.get_location_row_range(location)) for location in location_ids]
+
+    def select_positions(self,
+                         latitude: float,
+                         longitude: float,
+                         forecast_date_start: Optional[date] = None,
+                         forecast_date_end: Optional[date] = None,
+                         request_date_start: Optional[date] = None,
+                         request_date_end: Optional[date] = None,
+                         radius_km: Optional[float] = None
+                         ) -> np.ndarray:
+        if radius_km is None:
+            location: Optional[int] = self._location_codes.get((latitude, longitude))
+            locations: list[int] = [location] if location is not None else []
+        else:
+            locations = self.location_index.within_radius(latitude, longitude, radius_km)
+
+        positions: list[np.ndarray] = [
+            self._select_location_positions(location, forecast_date_start, forecast_date_end, request_date_start,
+                                            request_date_end)
+            for location in locations
+        ]
+
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return np.sort(np.concatenate(positions))
+
+    def _select_location_positions(self,
+                                   location: int,
+                                   forecast_date_start: Optional[date],
+                                   forecast_date_end: Optional[date],
+                                   request_date_start: Optional[date],
+                                   request_date_end: Optional[date]
+                                   ) -> np.ndarray:
+        empty: np.ndarray = np.empty(0, dtype=np.int64)
+
+        has_forecast_filter: bool = forecast_date_start is not None or forecast_date_end is not None
+        has_request_filter: bool = request_date_start is not None or request_date_end is not None
+        any_day: tuple[int, int] = (0, (1 << self._day_bits) - 1)
+
+        forecast_range: Optional[tuple[int, int]] = any_day
+        if has_forecast_filter:
+            forecast_range = self._clamp_range(forecast_date_start, forecast_date_end)
+
+        request_range: Optional[tuple[int, int]] = any_day
+        if has_request_filter:
+            request_range = self._clamp_range(request_date_start, request_date_end)
+
+        if forecast_range is None or request_range is None:
+            return empty
+
+        if has_request_filter and not has_forecast_filter:
+            start, end = self._search(self._request_keys, (location, 0, request_range[0]),
+                                      (location, 0, request_range[1]))
+
+            return self._request_order[start:end]
+
+        start, end = self._search(self._forecast_keys, (location, forecast_range[0], request_range[0]),
+                                  (location, forecast_range[1], request_range[1]))
+        positions: np.ndarray = self._forecast_order[start:end]
+
+        # Several forecast days hold several request-day runs, so the request range is trimmed row by row
+        if has_request_filter and forecast_range[0] != forecast_range[1]:
+            request_offsets: np.ndarray = self._forecast_request_offsets[start:end]
+            positions = positions[(request_offsets >= request_range[0]) & (request_offsets <= request_range[1])]
+
+        return positions
+
+    def select(self,
+               latitude: float,
+               longitude: float,
+               forecast_date_start: Optional[date] = None,
+               forecast_date_end: Optional[date] = None,
+               request_date_start: Optional[date] = None,
+               request_date_end: Optional[date] = None,
+               radius_km: Optional[float] = None
+               ) -> pd.DataFrame:
+        positions: np.ndarray = self.select_positions(latitude, longitude, forecast_date_start, forecast_date_end,
+                                                      request_date_start, request_date_end, radius_km)
+
+        return self.dataframe.iloc[positions]
@@ -1,75 +1,125 @@
 from datetime import date
-from typing import Optional
+from typing import Optional, Union
 
 import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.lines import Line2D
+
+from app.analysis.alignment import AlignedForecasts, align_forecasts
+from app.analysis.functions import filter_forecasts, group_forecasts, get_comparable_features, get_sources
+from app.analysis.query import ForecastQuery
+from app.analysis.streaming import StreamingSource, stream_get_sources, stream_group_forecasts
+from app.instrumentation import metrics
+from app.rollups import ForecastRollups
+from app.storage import get_store_rollups
+
+
+@metrics.timed("analyze", view="day")
+def get_day_forecasts(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
+                      latitude: float,
+                      longitude: float,
+                      forecast_date: date,
+                      request_date: date,
+                      radius_km: Optional[float] = None,
+                      rollups: Optional[ForecastRollups] = None
+                      ) -> AlignedForecasts:
+    if rollups is not None and radius_km is None:
+        # Hourly means come straight from the rollups maintained at ingest
+        dataframe = rollups.group_by_forecast_hour(latitude, longitude, forecast_date, request_date)
+    elif isinstance(dataframe, StreamingSource):
+        # Stores larger than memory are grouped chunk by chunk
+        dataframe = stream_group_forecasts(dataframe, ["source", "forecast_datetime"], latitude, longitude,
+                                           forecast_date_start=forecast_date, forecast_date_end=forecast_date,
+                                           request_date_start=request_date, request_date_end=request_date,
+                                           radius_km=radius_km)
+    else:
+        # Filter by latitude, longitude, forecast_date and request_date
+        dataframe = filter_forecasts(dataframe, latitude, longitude,
+                                     forecast_date_start=forecast_date, forecast_date_end=forecast_date,
+                                     request_date_start=request_date, request_date_end=request_date,
+                                     radius_km=radius_km)
+
+        # Group data by source and forecast_datetime
+        dataframe = group_forecasts(dataframe, ["source", "forecast_datetime"])
+
+    # Resample every source onto the same hourly grid once, instead of interpolating on every redraw
+    day_start: pd.Timestamp = pd.Timestamp(forecast_date)
+
+    return align_forecasts(dataframe.reset_index(), start=day_start, end=day_start + pd.Timedelta(hours=23), step="1h")
+
+
+def _set_day_labels(ax: Axes, variable: str, forecast_date: date, request_date: date) -> None:
+    variable_title: str = variable.replace("_", " ").title()
+
+    ax.set_xlabel("Forecast time [UTC]")
+    ax.set_ylabel(variable_title)
+    ax.set_title(
+        f"{variable_title} forecasts for {forecast_date} from {request_date}"
+    )
+
+
+def draw_day_forecasts(ax: Axes, aligned: AlignedForecasts, variable: str, forecast_date: date,
+                       request_date: date) -> list[Line2D]:
+    forecast_times: list[str] = list(aligned.times.strftime("%H:%M"))
+    lines: list[Line2D] = []
+
+    for source in aligned.sources:
+        line, = ax.plot(
+            forecast_times,
+            aligned.get_feature(variable, source),
+            label=source
+        )
+        lines.append(line)
+
+    _set_day_labels(ax, variable, forecast_date, request_date)
+    ax.legend()
+    ax.grid()
+
+    return lines
+
+
+def update_day_forecasts(ax: Axes, lines: list[Line2D], aligned: AlignedForecasts, variable: str,
+                         forecast_date: date, request_date: date) -> None:
+    # Only the y data of the existing lines changes, the axes are not rebuilt
+    for line, source in zip(lines, aligned.sources):
+        line.set_ydata(aligned.get_feature(variable, source))
 
-from app.analysis.functions import filter_forecasts_by_latitude_and_longitude, filter_forecasts_by_forecast_date, \
-    filter_forecasts_by_request_date, group_forecasts, get_comparable_features
-from app.storage import load_forecasts_into_dataframe
+    _set_day_labels(ax, variable, forecast_date, request_date)
+    ax.relim()
+    ax.autoscale_view()
 
 
-def compare_forecasts_for_day(dataframe: pd.DataFrame,
+def compare_forecasts_for_day(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
                               latitude: float,
                               longitude: float,
                               forecast_date: date,
                               request_date: date,
                               sources: Optional[list[str]] = None,
-                              features: Optional[list[str]] = None
+                              features: Optional[list[str]] = None,
+                              radius_km: Optional[float] = None,
+                              rollups: Optional[ForecastRollups] = None
                               ) -> None:
     # Use all sources if none is specified
     if sources is None:
-        sources = list(dataframe["source"].unique())
+        sources = stream_get_sources(dataframe) if isinstance(dataframe, StreamingSource) else get_sources(dataframe)
 
     # Use all features if none are specified
     if features is None:
         features = get_comparable_features()
 
-    # Filter by latitude, longitude, forecast_date and request_date
-    dataframe = filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude)
-    dataframe = filter_forecasts_by_forecast_date(dataframe, forecast_date)
-    dataframe = filter_forecasts_by_request_date(dataframe, request_date)
-
-    # Group data by source and forecast_datetime
-    dataframe = group_forecasts(dataframe, ["source", "forecast_datetime"])
-    dataframe = dataframe.reset_index()
-
-    # Drop date from forecast_datetime
-    dataframe["forecast_datetime"] = dataframe["forecast_datetime"].dt.strftime("%H:%M")
-    dataframe.rename(columns={"forecast_datetime": "forecast_time"}, inplace=True)
+    aligned: AlignedForecasts = get_day_forecasts(dataframe, latitude, longitude, forecast_date, request_date,
+                                                  radius_km, rollups)
 
     current_feature_index: int = 0
 
     fig, ax = plt.subplots(figsize=(12, 6))
+    lines: list[Line2D] = draw_day_forecasts(ax, aligned, features[current_feature_index], forecast_date,
+                                             request_date)
+    fig.tight_layout()
 
     def plot_single_feature() -> None:
-        ax.clear()
-        variable: str = features[current_feature_index]
-
-        pivot_dataframe: pd.DataFrame = dataframe.pivot(
-            index="forecast_time",
-            columns="source",
-            values=variable
-        ).sort_index()
-
-        for source in pivot_dataframe.columns:
-            ax.plot(
-                pivot_dataframe.index,
-                pivot_dataframe[source].interpolate(method="linear"),
-                label=source
-            )
-
-        variable_title: str = variable.replace("_", " ").title()
-
-        ax.set_xlabel("Forecast time [UTC]")
-        ax.set_ylabel(variable_title)
-        ax.set_title(
-            f"{variable_title} forecasts for {forecast_date} from {request_date}"
-        )
-
-        ax.legend()
-        ax.grid()
-        fig.tight_layout()
+        update_day_forecasts(ax, lines, aligned, features[current_feature_index], forecast_date, request_date)
         fig.canvas.draw_idle()
 
     def on_key(event):
@@ -85,8 +135,6 @@ def compare_forecasts_for_day(dataframe: pd.DataFrame,
 
     fig.canvas.mpl_connect("key_press_event", on_key)
 
-    plot_single_feature()
-
     plt.show()
 
 
@@ -94,10 +142,12 @@ if __name__ == "__main__":
     pd.set_option("display.max_columns", None)
     pd.set_option("display.width", 400)
 
-    dataframe: pd.DataFrame = load_forecasts_into_dataframe("../../data/forecasts.csv")
+    file_path: str = "../../data/forecasts.csv"
     latitude: float = 52.23
     longitude: float = 21.01
     forecast_date: date = date(2025, 8, 31)
     request_date: date = date(2025, 8, 31)
 
-    compare_forecasts_for_day(dataframe, latitude, longitude, forecast_date, request_date)
+    # Hourly means come from the rollups; only the source names are streamed from the store
+    compare_forecasts_for_day(StreamingSource(file_path), latitude, longitude, forecast_date, request_date,
+                              rollups=get_store_rollups(file_path))
@@ -1,47 +1,157 @@
-from typing import Optional
+import calendar
+import weakref
+from datetime import date
+from typing import Optional, Union
 
 import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.axes import Axes
 from matplotlib.ticker import MaxNLocator
 
-from app.analysis.functions import filter_forecasts_by_latitude_and_longitude, get_comparable_features
-from app.storage import load_forecasts_into_dataframe
+from app.analysis.functions import filter_forecasts, get_comparable_features, get_sources
+from app.analysis.query import ForecastQuery
+from app.analysis.streaming import StreamingSource, stream_filter_forecasts, stream_get_sources
+from app.instrumentation import metrics
 
 
-def compare_forecasts_for_month(dataframe: pd.DataFrame,
+MONTH_PERCENTILES: tuple[float, float] = (0.1, 0.9)
+
+# Month aggregates per data object, dropped when the object is garbage collected.
+# The cache assumes the data is not modified in place after the first view.
+_month_aggregate_cache: dict[int, dict[tuple, dict[str, pd.DataFrame]]] = {}
+
+
+def aggregate_forecasts_by_day(dataframe: pd.DataFrame, features: list[str]) -> pd.DataFrame:
+    forecast_datetimes: pd.Series = dataframe["forecast_datetime"]
+    day_dataframe: pd.DataFrame = dataframe[["source"] + features].assign(
+        forecast_year=forecast_datetimes.dt.year,
+        forecast_month=forecast_datetimes.dt.month,
+        forecast_day=forecast_datetimes.dt.day
+    )
+
+    # One grouping for every feature and statistic
+    grouped = day_dataframe.groupby(["forecast_year", "forecast_month", "source", "forecast_day"])[features]
+    statistics: pd.DataFrame = grouped.agg(["min", "max", "mean"])
+
+    low, high = MONTH_PERCENTILES
+    percentiles: pd.DataFrame = grouped.quantile([low, high]).unstack(level=-1)
+    percentiles.columns = pd.MultiIndex.from_tuples(
+        [(feature, f"p{round(quantile * 100)}") for feature, quantile in percentiles.columns])
+
+    return pd.concat([statistics, percentiles], axis=1)
+
+
+def _split_by_feature(aggregates: pd.DataFrame, features: list[str]) -> dict[str, pd.DataFrame]:
+    low, high = (f"p{round(quantile * 100)}" for quantile in MONTH_PERCENTILES)
+    grouped_dataframes: dict[str, pd.DataFrame] = {}
+
+    for feature in features:
+        feature_dataframe: pd.DataFrame = aggregates[feature].rename(columns={
+            "min": "min_val", "max": "max_val", "mean": "mean_val", low: "low_val", high: "high_val"
+        })
+        grouped_dataframes[feature] = feature_dataframe.reset_index()
+
+    return grouped_dataframes
+
+
+@metrics.timed("analyze", view="month")
+def get_month_aggregates(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
+                         latitude: float,
+                         longitude: float,
+                         forecast_year: int,
+                         forecast_month: int,
+                         features: list[str],
+                         radius_km: Optional[float] = None
+                         ) -> dict[str, pd.DataFrame]:
+    data_id: int = id(dataframe)
+
+    if data_id not in _month_aggregate_cache:
+        _month_aggregate_cache[data_id] = {}
+        weakref.finalize(dataframe, _month_aggregate_cache.pop, data_id, None)
+
+    cache: dict[tuple, dict[str, pd.DataFrame]] = _month_aggregate_cache[data_id]
+    location_key: tuple = (latitude, longitude, radius_km, tuple(features))
+
+    if (location_key, forecast_year, forecast_month) not in cache:
+        location_dataframe: pd.DataFrame
+        if isinstance(dataframe, StreamingSource):
+            # Percentiles need the raw values, so only the requested month is streamed in
+            month_end: date = date(forecast_year, forecast_month, calendar.monthrange(forecast_year, forecast_month)[1])
+            location_dataframe = stream_filter_forecasts(dataframe, latitude, longitude,
+                                                         forecast_date_start=date(forecast_year, forecast_month, 1),
+                                                         forecast_date_end=month_end, radius_km=radius_km)
+        else:
+            # Aggregate every month of the location at once, so other months are served from the cache too
+            location_dataframe = filter_forecasts(dataframe, latitude, longitude, radius_km=radius_km)
+
+        aggregates: pd.DataFrame = aggregate_forecasts_by_day(location_dataframe, features)
+
+        for (year, month), month_aggregates in aggregates.groupby(level=["forecast_year", "forecast_month"]):
+            cache[(location_key, year, month)] = _split_by_feature(
+                month_aggregates.droplevel(["forecast_year", "forecast_month"]), features)
+
+        if (location_key, forecast_year, forecast_month) not in cache:
+            cache[(location_key, forecast_year, forecast_month)] = _split_by_feature(
+                aggregates.iloc[0:0].droplevel(["forecast_year", "forecast_month"]), features)
+
+    return cache[(location_key, forecast_year, forecast_month)]
+
+
+def draw_month_forecasts(ax: Axes, dataframe: pd.DataFrame, variable: str, forecast_year: int,
+                         forecast_month: int) -> None:
+    for source in dataframe["source"].unique():
+        source_dataframe: pd.DataFrame = dataframe[dataframe["source"] == source]
+
+        line, = ax.plot(
+            source_dataframe["forecast_day"],
+            source_dataframe["mean_val"],
+            label=source
+        )
+        ax.fill_between(
+            source_dataframe["forecast_day"],
+            source_dataframe["low_val"],
+            source_dataframe["high_val"],
+            color=line.get_color(),
+            alpha=0.3
+        )
+        ax.fill_between(
+            source_dataframe["forecast_day"],
+            source_dataframe["min_val"],
+            source_dataframe["max_val"],
+            color=line.get_color(),
+            alpha=0.1
+        )
+
+    variable_title: str = variable.replace("_", " ").title()
+
+    ax.set_xlabel("Forecast day")
+    ax.set_ylabel(f"{variable_title}")
+    ax.set_title(f"{variable_title} forecasts for {forecast_year}-{forecast_month:02}")
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.legend()
+    ax.grid()
+
+
+def compare_forecasts_for_month(dataframe: Union[pd.DataFrame, ForecastQuery, StreamingSource],
                                 latitude: float,
                                 longitude: float,
                                 forecast_year: int,
                                 forecast_month: int,
                                 sources: Optional[list[str]] = None,
-                                features: Optional[list[str]] = None
+                                features: Optional[list[str]] = None,
+                                radius_km: Optional[float] = None
                                 ) -> None:
     # Use all sources if none is specified
     if sources is None:
-        sources = list(dataframe["source"].unique())
+        sources = stream_get_sources(dataframe) if isinstance(dataframe, StreamingSource) else get_sources(dataframe)
 
     # Use all features if none are specified
     if features is None:
         features = get_comparable_features()
 
-    # Filter by latitude, longitude, year and month
-    dataframe = filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude)
-    dataframe = dataframe[
-        (dataframe["forecast_datetime"].dt.year == forecast_year) &
-        (dataframe["forecast_datetime"].dt.month == forecast_month)
-        ]
-
-    # Add forecast_day column for grouping
-    dataframe["forecast_day"] = dataframe["forecast_datetime"].dt.day
-
-    grouped_dataframes: dict[str, pd.DataFrame] = {}
-    for feature in features:
-        dt: pd.DataFrame = dataframe.groupby(["source", "forecast_day"]).agg(
-            min_val=(feature, "min"),
-            max_val=(feature, "max")
-        ).reset_index()
-
-        grouped_dataframes[feature] = dt
+    # Min, max, mean and percentile bands per source and forecast day, for every feature
+    grouped_dataframes: dict[str, pd.DataFrame] = get_month_aggregates(dataframe, latitude, longitude, forecast_year,
+                                                                       forecast_month, features, radius_km)
 
     current_feature_index: int = 0
 
@@ -51,27 +161,7 @@ def compare_forecasts_for_month(dataframe: pd.DataFrame,
     def plot_single_variable() -> None:
         ax.clear()
         variable: str = features[current_feature_index]
-        dataframe: pd.DataFrame = grouped_dataframes[variable]
-
-        for source in dataframe["source"].unique():
-            source_dataframe: pd.DataFrame = dataframe[dataframe["source"] == source]
-
-            ax.fill_between(
-                source_dataframe["forecast_day"],
-                source_dataframe["min_val"],
-                source_dataframe["max_val"],
-                alpha=0.3,
-                label=source
-            )
-
-        variable_title: str = variable.replace("_", " ").title()
-
-        ax.set_xlabel("Forecast day")
-        ax.set_ylabel(f"{variable_title}")
-        ax.set_title(f"{variable_title} forecasts for {forecast_year}-{forecast_month:02}")
-        ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-        ax.legend()
-        ax.grid()
+        draw_month_forecasts(ax, grouped_dataframes[variable], variable, forecast_year, forecast_month)
 
     def on_key(event):
         nonlocal current_feature_index
@@ -98,10 +188,11 @@ if __name__ == "__main__":
     pd.set_option("display.max_columns", None)
     pd.set_option("display.width", 400)
 
-    dataframe: pd.DataFrame = load_forecasts_into_dataframe("../../data/forecasts.csv")
     latitude: float = 52.23
     longitude: float = 21.01
     forecast_year: int = 2025
     forecast_month: int = 8
 
-    compare_forecasts_for_month(dataframe, latitude, longitude, forecast_year, forecast_month)
+    # Percentiles need the raw values, which the rollups do not keep, so only the month is streamed in
+    compare_forecasts_for_month(StreamingSource("../../data/forecasts.csv"), latitude, longitude, forecast_year,
+                                forecast_month)
@@ -0,0 +1,106 @@
+import math
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM: float = 6371.0088
+KM_PER_DEGREE: float = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    latitude_rad, longitude_rad = np.deg2rad(latitude), np.deg2rad(longitude)
+    latitudes_rad, longitudes_rad = np.deg2rad(latitudes), np.deg2rad(longitudes)
+
+    a: np.ndarray = (np.sin((latitudes_rad - latitude_rad) / 2) ** 2 +
+                     np.cos(latitude_rad) * np.cos(latitudes_rad) * np.sin((longitudes_rad - longitude_rad) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class LocationIndex:
+    def __init__(self, locations: list[tuple[float, float]], cell_size: float = 0.25) -> None:
+        self.locations: list[tuple[float, float]] = locations
+        self.cell_size: float = cell_size
+
+        self.latitudes: np.ndarray = np.array([location[0] for location in locations], dtype=np.float64)
+        self.longitudes: np.ndarray = np.array([location[1] for location in locations], dtype=np.float64)
+
+        self._columns: int = math.ceil(360 / cell_size)
+
+        cell_rows: np.ndarray = self._get_rows(self.latitudes)
+        cell_columns: np.ndarray = self._get_columns(self.longitudes)
+        cell_ids: dict[tuple[int, int], list[int]] = {}
+
+        for location_id, cell in enumerate(zip(cell_rows.tolist(), cell_columns.tolist())):
+            cell_ids.setdefault(cell, []).append(location_id)
+
+        self._cells: dict[tuple[int, int], np.ndarray] = {
+            cell: np.array(ids, dtype=np.int64) for cell, ids in cell_ids.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _get_rows(self, latitudes: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(latitudes) + 90) / self.cell_size).astype(np.int64)
+
+    def _get_columns(self, longitudes: np.ndarray) -> np.ndarray:
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_size).astype(np.int64) % self._columns
+
+    def _get_candidates(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        latitude_span: float = radius_km / KM_PER_DEGREE
+        row_start, row_end = self._get_rows(np.array([latitude - latitude_span, latitude + latitude_span]))
+
+        # Longitude degrees shrink towards the poles; near them every column is a candidate
+        widest_latitude: float = min(89.9, abs(latitude) + latitude_span)
+        longitude_span: float = latitude_span / math.cos(math.radians(widest_latitude))
+
+        if longitude_span >= 180:
+            columns: range = range(self._columns)
+        else:
+            column_start: int = int(self._get_columns(np.array([longitude - longitude_span]))[0])
+            column_count: int = int(math.ceil(2 * longitude_span / self.cell_size)) + 1
+            columns = range(column_start, column_start + min(column_count, self._columns))
+
+        candidates: list[np.ndarray] = [
+            self._cells[(row, column % self._columns)]
+            for row in range(row_start, row_end + 1) for column in columns
+            if (row, column % self._columns) in self._cells
+        ]
+
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        return np.unique(np.concatenate(candidates))
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> list[int]:
+        candidates: np.ndarray = self._get_candidates(latitude, longitude, radius_km)
+        distances: np.ndarray = haversine_km(latitude, longitude, self.latitudes[candidates],
+                                             self.longitudes[candidates])
+
+        # Sorted from the closest location
+        order: np.ndarray = np.argsort(distances, kind="stable")
+        order = order[distances[order] <= radius_km]
+
+        return candidates[order].tolist()
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1,
+                max_radius_km: Optional[float] = None) -> list[int]:
+        if len(self.locations) == 0:
+            return []
+
+        radius_km: float = self.cell_size * KM_PER_DEGREE
+        limit_km: float = max_radius_km if max_radius_km is not None else math.pi * EARTH_RADIUS_KM
+
+        # Grow the search radius until it holds k locations; the k nearest are then all inside it
+        while True:
+            radius_km = min(radius_km, limit_km)
+            found: list[int] = self.within_radius(latitude, longitude, radius_km)
+
+            if len(found) >= k or radius_km >= limit_km:
+                return found[:k]
+
+            radius_km *= 2
+
+    def get_distances(self, latitude: float, longitude: float, location_ids: list[int]) -> np.ndarray:
+        return haversine_km(latitude, longitude, self.latitudes[location_ids], self.longitudes[location_ids])
@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.analysis.functions import filter_forecasts
+from app.model import get_group_by_aggregator, CIRCULAR_MEAN
+from app.rollups import finalize_rollup
+from app.storage import iterate_dataframe_chunks
+
+
+@dataclass
+class StreamingSource:
+    file_path: str
+    chunk_size: int = 100_000
+
+
+def stream_forecasts(source: StreamingSource,
+                     latitude: float,
+                     longitude: float,
+                     forecast_date_start: Optional[date] = None,
+                     forecast_date_end: Optional[date] = None,
+                     request_date_start: Optional[date] = None,
+                     request_date_end: Optional[date] = None,
+                     radius_km: Optional[float] = None,
+                     columns: Optional[list[str]] = None
+                     ) -> Iterator[pd.DataFrame]:
+    # Exact locations are pushed down into the read; a radius is resolved per chunk
+    locations: Optional[list[tuple[float, float]]] = [(latitude, longitude)] if radius_km is None else None
+    read_columns: Optional[list[str]] = None
+    if columns is not None:
+        filter_columns: list[str] = ["latitude", "longitude", "request_datetime", "forecast_datetime"]
+        read_columns = list(dict.fromkeys(columns + filter_columns))
+
+    for chunk in iterate_dataframe_chunks(source.file_path, source.chunk_size, read_columns, locations,
+                                          request_date_start, request_date_end):
+        filtered_chunk: pd.DataFrame = filter_forecasts(chunk, latitude, longitude, forecast_date_start,
+                                                        forecast_date_end, request_date_start, request_date_end,
+                                                        radius_km)
+
+        if len(filtered_chunk) > 0:
+            yield filtered_chunk if columns is None else filtered_chunk[columns]
+
+
+def stream_filter_forecasts(source: StreamingSource,
+                            latitude: float,
+                            longitude: float,
+                            forecast_date_start: Optional[date] = None,
+                            forecast_date_end: Optional[date] = None,
+                            request_date_start: Optional[date] = None,
+                            request_date_end: Optional[date] = None,
+                            radius_km: Optional[float] = None
+                            ) -> pd.DataFrame:
+    # Only the matching rows are kept, so memory follows the size of the selection
+    chunks: list[pd.DataFrame] = list(stream_forecasts(source, latitude, longitude, forecast_date_start,
+                                                       forecast_date_end, request_date_start, request_date_end,
+                                                       radius_km))
+
+    if len(chunks) == 0:
+        return next(iterate_dataframe_chunks(source.file_path, 1), pd.DataFrame()).iloc[0:0]
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def stream_get_sources(source: StreamingSource) -> list[str]:
+    sources: dict[str, None] = {}
+
+    for chunk in iterate_dataframe_chunks(source.file_path, source.chunk_size, columns=["source"]):
+        sources.update(dict.fromkeys(chunk["source"].unique()))
+
+    return list(sources)
+
+
+class StreamingGroupAggregator:
+    def __init__(self, group_by_columns: list[str], max_partials: int = 16) -> None:
+        self.group_by_columns: list[str] = group_by_columns
+        self.max_partials: int = max_partials
+
+        aggregator: dict[str, Any] = get_group_by_aggregator()
+        self._features: list[str] = list(aggregator)
+        self._circular_features: list[str] = [
+            feature for feature, function in aggregator.items() if function == CIRCULAR_MEAN
+        ]
+        self._partials: list[pd.DataFrame] = []
+
+    def _get_state_functions(self) -> dict[str, str]:
+        # Sums and counts add up across chunks, minimums and maximums combine with themselves
+        functions: dict[str, str] = {}
+
+        for feature in self._features:
+            if feature in self._circular_features:
+                functions[f"{feature}_sin_sum"] = "sum"
+                functions[f"{feature}_cos_sum"] = "sum"
+            else:
+                functions[f"{feature}_sum"] = "sum"
+                functions[f"{feature}_min"] = "min"
+                functions[f"{feature}_max"] = "max"
+
+            functions[f"{feature}_count"] = "sum"
+
+        return functions
+
+    def _get_group_values(self, dataframe: pd.DataFrame) -> dict[str, np.ndarray]:
+        group_values: dict[str, np.ndarray] = {}
+
+        for column in self.group_by_columns:
+            if column == "forecast_date" and column not in dataframe.columns:
+                group_values[column] = dataframe["forecast_datetime"].dt.date.to_numpy()
+            else:
+                group_values[column] = dataframe[column].to_numpy()
+
+        return group_values
+
+    def update(self, dataframe: pd.DataFrame) -> None:
+        if len(dataframe) == 0:
+            return
+
+        state: dict[str, np.ndarray] = self._get_group_values(dataframe)
+
+        for feature in self._features:
+            values: np.ndarray = pd.to_numeric(dataframe[feature], errors="coerce").to_numpy(dtype=np.float64)
+            present: np.ndarray = ~np.isnan(values)
+
+            if feature in self._circular_features:
+                radians: np.ndarray = np.deg2rad(values)
+                state[f"{feature}_sin_sum"] = np.where(present, np.sin(radians), 0.0)
+                state[f"{feature}_cos_sum"] = np.where(present, np.cos(radians), 0.0)
+            else:
+                state[f"{feature}_sum"] = np.where(present, values, 0.0)
+                state[f"{feature}_min"] = values
+                state[f"{feature}_max"] = values
+
+            state[f"{feature}_count"] = present.astype(np.int64)
+
+        partial: pd.DataFrame = pd.DataFrame(state).groupby(self.group_by_columns).agg(self._get_state_functions())
+        self._partials.append(partial)
+
+        # Partial states are bounded by the number of groups, and merged before they pile up
+        if len(self._partials) >= self.max_partials:
+            self._partials = [self.get_state()]
+
+    def get_state(self) -> pd.DataFrame:
+        if len(self._partials) == 0:
+            return pd.DataFrame(columns=self.group_by_columns + list(self._get_state_functions())) \
+                .set_index(self.group_by_columns)
+
+        if len(self._partials) == 1:
+            return self._partials[0]
+
+        return pd.concat(self._partials).groupby(level=self.group_by_columns).agg(self._get_state_functions())
+
+    def get_means(self) -> pd.DataFrame:
+        means: pd.DataFrame = finalize_rollup(self.get_state().reset_index(), self.group_by_columns)
+
+        return means[self._features]
+
+    def get_min_max(self) -> pd.DataFrame:
+        state: pd.DataFrame = self.get_state()
+        features: list[str] = [feature for feature in self._features if feature not in self._circular_features]
+
+        return pd.concat({
+            "min": state[[f"{feature}_min" for feature in features]].set_axis(features, axis=1),
+            "max": state[[f"{feature}_max" for feature in features]].set_axis(features, axis=1)
+        }, axis=1).swaplevel(axis=1)[features]
+
+
+def stream_group_forecasts(source: StreamingSource,
+                           group_by_columns: list[str],
+                           latitude: float,
+                           longitude: float,
+                           forecast_date_start: Optional[date] = None,
+                           forecast_date_end: Optional[date] = None,
+                           request_date_start: Optional[date] = None,
+                           request_date_end: Optional[date] = None,
+                           radius_km: Optional[float] = None
+                           ) -> pd.DataFrame:
+    aggregator: StreamingGroupAggregator = StreamingGroupAggregator(group_by_columns)
+    # Forecast dates are derived from the forecast datetimes of each chunk
+    columns: list[str] = [
+        "forecast_datetime" if column == "forecast_date" else column for column in group_by_columns
+    ] + list(get_group_by_aggregator())
+
+    for chunk in stream_forecasts(source, latitude, longitude, forecast_date_start, forecast_date_end,
+                                  request_date_start, request_date_end, radius_km, columns):
+        aggregator.update(chunk)
+
+    return aggregator.get_means()
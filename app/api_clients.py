@@ -1,133 +1,236 @@
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Any
 
-import requests
-from requests import Response
+import numpy as np
+import pandas as pd
 
-from app.model import WeatherForecast
-from app.utils import mps_to_kmph, convert_local_datetime_to_utc, get_utc_time_without_offset, km_to_m
+from app.http_client import http_client
+from app.instrumentation import metrics
+from app.model import WeatherForecast, ForecastBatch
+from app.response_cache import CachedFetch
+from app.utils import mps_to_kmph, convert_local_datetimes_to_utc, get_utc_time_without_offset, km_to_m
 
+provider_urls: dict[str, str] = {
+    "wttr": "https://wttr.in",
+    "open_meteo": "https://api.open-meteo.com/v1/forecast",
+    "met_no": "https://api.met.no/weatherapi/locationforecast/2.0/compact"
+}
 
-def fetch_wttr_forecast(latitude: float, longitude: float) -> list[WeatherForecast]:
-    url: str = f"https://wttr.in/{latitude},{longitude}?format=j1&num_of_days=7"
-    response: Response = requests.get(url)
-    response.raise_for_status()
 
-    days: list = response.json()["weather"]
+@dataclass
+class ProviderRequest:
+    url: str
+    params: dict[str, Any] = field(default_factory=dict)
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+def _get_provider_response(provider: str, request: ProviderRequest, latitude: float, longitude: float) -> CachedFetch:
+    # Unchanged responses were already parsed and stored when they were first downloaded
+    return http_client.get_cached(request.url, params=request.params, headers=request.headers,
+                                  cache_key=(provider, latitude, longitude))
+
+
+def _to_float_array(values: list[Any]) -> np.ndarray:
+    # None and missing values become NaN; numeric strings are converted in the same pass
+    return np.array(values, dtype=np.float64)
+
+
+def get_wttr_request(latitude: float, longitude: float) -> ProviderRequest:
+    return ProviderRequest(
+        url=f"{provider_urls['wttr']}/{latitude},{longitude}",
+        params={
+            "format": "j1",
+            "num_of_days": 7
+        }
+    )
+
+
+def parse_wttr_forecast_batch(payload: dict[str, Any], latitude: float, longitude: float) -> ForecastBatch:
+    days: list = payload["weather"]
     request_datetime = get_utc_time_without_offset()
 
-    result: list[WeatherForecast] = []
+    hours: list[dict[str, Any]] = [hour for day in days for hour in day["hourly"]]
+    local_datetimes: list[str] = [
+        f"{day['date']} {hour['time'].zfill(4)}" for day in days for hour in day["hourly"]
+    ]
+
+    # Convert all timestamps at once, so the timezone is resolved once per location
+    forecast_datetimes_utc: list[datetime] = convert_local_datetimes_to_utc(latitude, longitude, local_datetimes)
+
+    features: dict[str, np.ndarray] = {
+        "temperature": _to_float_array([hour["tempC"] for hour in hours]),
+        "wind_speed": _to_float_array([hour["windspeedKmph"] for hour in hours]),
+        "wind_direction": _to_float_array([hour["winddirDegree"] for hour in hours]),
+        "precipitation": _to_float_array([hour["precipMM"] for hour in hours]),
+        "humidity": _to_float_array([hour["humidity"] for hour in hours]),
+        "air_pressure": _to_float_array([hour["pressure"] for hour in hours]),
+        "visibility": km_to_m(_to_float_array([hour["visibility"] for hour in hours]))
+    }
+
+    return ForecastBatch(
+        source="wttr",
+        request_datetime=request_datetime,
+        latitude=latitude,
+        longitude=longitude,
+        forecast_datetimes=np.array(forecast_datetimes_utc, dtype="datetime64[ns]"),
+        features=features
+    )
 
-    for day in days:
-        for hour in day["hourly"]:
-            forecast_datetime: str = f"{day['date']} {hour['time'].zfill(4)}"
 
-            forecast_datetime_utc = convert_local_datetime_to_utc(latitude, longitude, forecast_datetime)
+def parse_wttr_forecast(payload: dict[str, Any], latitude: float, longitude: float) -> list[WeatherForecast]:
+    return parse_wttr_forecast_batch(payload, latitude, longitude).to_models()
 
-            weather_forecast: WeatherForecast = WeatherForecast(
-                source="wttr",
-                request_datetime=request_datetime,
-                forecast_datetime=forecast_datetime_utc,
-                latitude=latitude,
-                longitude=longitude,
-                temperature=float(hour["tempC"]),
-                wind_speed=float(hour["windspeedKmph"]),
-                wind_direction=float(hour["winddirDegree"]),
-                precipitation=float(hour["precipMM"]),
-                humidity=float(hour["humidity"]),
-                air_pressure=float(hour["pressure"]),
-                visibility=km_to_m(float(hour["visibility"]))
-            )
 
-            result.append(weather_forecast)
+def fetch_wttr_forecast(latitude: float, longitude: float) -> list[WeatherForecast]:
+    return fetch_wttr_forecast_batch(latitude, longitude).to_models()
 
-    return result
 
+def fetch_wttr_forecast_batch(latitude: float, longitude: float) -> ForecastBatch:
+    request: ProviderRequest = get_wttr_request(latitude, longitude)
+    result: CachedFetch = _get_provider_response("wttr", request, latitude, longitude)
 
-def fetch_open_meteo_forecast(latitude: float, longitude: float) -> list[WeatherForecast]:
-    url: str = "https://api.open-meteo.com/v1/forecast"
-    parameters: dict[str, Any] = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": "temperature_2m,precipitation,relative_humidity_2m,windspeed_10m,winddirection_10m,cloudcover,surface_pressure,dew_point_2m,uv_index,visibility",
-        "forecast_days": 7,
-        "timezone": "UTC"
+    if not result.modified:
+        return ForecastBatch.empty("wttr", get_utc_time_without_offset(), latitude, longitude)
+
+    with metrics.timer("json_decode", provider="wttr"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="wttr"):
+        return parse_wttr_forecast_batch(payload, latitude, longitude)
+
+
+def get_open_meteo_request(latitude: float, longitude: float) -> ProviderRequest:
+    return ProviderRequest(
+        url=provider_urls["open_meteo"],
+        params={
+            "latitude": latitude,
+            "longitude": longitude,
+            "hourly": "temperature_2m,precipitation,relative_humidity_2m,windspeed_10m,winddirection_10m,cloudcover,surface_pressure,dew_point_2m,uv_index,visibility",
+            "forecast_days": 7,
+            "timezone": "UTC"
+        }
+    )
+
+
+def parse_open_meteo_forecast_batch(payload: dict[str, Any], latitude: float, longitude: float) -> ForecastBatch:
+    data: dict[str, Any] = payload["hourly"]
+    request_datetime = get_utc_time_without_offset()
+
+    # Open-Meteo already returns one array per variable
+    features: dict[str, np.ndarray] = {
+        "temperature": _to_float_array(data["temperature_2m"]),
+        "wind_speed": _to_float_array(data["windspeed_10m"]),
+        "wind_direction": _to_float_array(data["winddirection_10m"]),
+        "precipitation": _to_float_array(data["precipitation"]),
+        "humidity": _to_float_array(data["relative_humidity_2m"]),
+        "cloud_cover": _to_float_array(data["cloudcover"]),
+        "air_pressure": _to_float_array(data["surface_pressure"]),
+        "dew_point": _to_float_array(data["dew_point_2m"]),
+        "uv_index": _to_float_array(data["uv_index"]),
+        "visibility": _to_float_array(data["visibility"])
     }
-    response: Response = requests.get(url, params=parameters)
-    response.raise_for_status()
 
-    data: dict[str, Any] = response.json()["hourly"]
-    times: dict[str, Any] = data["time"]
+    return ForecastBatch(
+        source="open_meteo",
+        request_datetime=request_datetime,
+        latitude=latitude,
+        longitude=longitude,
+        forecast_datetimes=np.array(data["time"], dtype="datetime64[ns]"),
+        features=features
+    )
+
+
+def parse_open_meteo_forecast(payload: dict[str, Any], latitude: float, longitude: float) -> list[WeatherForecast]:
+    return parse_open_meteo_forecast_batch(payload, latitude, longitude).to_models()
+
+
+def fetch_open_meteo_forecast(latitude: float, longitude: float) -> list[WeatherForecast]:
+    return fetch_open_meteo_forecast_batch(latitude, longitude).to_models()
+
+
+def fetch_open_meteo_forecast_batch(latitude: float, longitude: float) -> ForecastBatch:
+    request: ProviderRequest = get_open_meteo_request(latitude, longitude)
+    result: CachedFetch = _get_provider_response("open_meteo", request, latitude, longitude)
+
+    if not result.modified:
+        return ForecastBatch.empty("open_meteo", get_utc_time_without_offset(), latitude, longitude)
+
+    with metrics.timer("json_decode", provider="open_meteo"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="open_meteo"):
+        return parse_open_meteo_forecast_batch(payload, latitude, longitude)
+
+
+def get_met_no_request(latitude: float, longitude: float) -> ProviderRequest:
+    return ProviderRequest(
+        url=provider_urls["met_no"],
+        params={
+            "lat": latitude,
+            "lon": longitude
+        },
+        headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:116.0) Gecko/20100101 Firefox/116.0"
+        }
+    )
+
+
+def parse_met_no_forecast_batch(payload: dict[str, Any], latitude: float, longitude: float) -> ForecastBatch:
+    data: list = payload["properties"]["timeseries"]
     request_datetime = get_utc_time_without_offset()
 
-    result: list[WeatherForecast] = []
+    details: list[dict[str, Any]] = [entry["data"]["instant"]["details"] for entry in data]
+    precipitation: list[Any] = [
+        entry["data"]["next_1_hours"]["details"]["precipitation_amount"] if "next_1_hours" in entry["data"] else None
+        for entry in data
+    ]
+
+    def get_detail(name: str) -> np.ndarray:
+        return _to_float_array([entry_details.get(name) for entry_details in details])
+
+    features: dict[str, np.ndarray] = {
+        "temperature": get_detail("air_temperature"),
+        "wind_speed": mps_to_kmph(get_detail("wind_speed")),
+        "wind_direction": get_detail("wind_from_direction"),
+        "precipitation": _to_float_array(precipitation),
+        "humidity": get_detail("relative_humidity"),
+        "air_pressure": get_detail("air_pressure_at_sea_level"),
+        "dew_point": get_detail("dew_point_temperature"),
+        "cloud_cover": get_detail("cloud_area_fraction"),
+        "visibility": get_detail("visibility")
+    }
 
-    for i, iso_datetime in enumerate(times):
-        weather_forecast: WeatherForecast = WeatherForecast(
-            source="open_meteo",
-            request_datetime=request_datetime,
-            forecast_datetime=datetime.fromisoformat(iso_datetime),
-            latitude=latitude,
-            longitude=longitude,
-            temperature=data["temperature_2m"][i],
-            wind_speed=data["windspeed_10m"][i],
-            wind_direction=data["winddirection_10m"][i],
-            precipitation=data["precipitation"][i],
-            humidity=data["relative_humidity_2m"][i],
-            cloud_cover=data["cloudcover"][i],
-            air_pressure=data["surface_pressure"][i],
-            dew_point=data["dew_point_2m"][i],
-            uv_index=data["uv_index"][i],
-            visibility=data["visibility"][i]
-        )
+    forecast_datetimes: pd.DatetimeIndex = pd.to_datetime([entry["time"] for entry in data], format="ISO8601",
+                                                          utc=True)
 
-        result.append(weather_forecast)
+    return ForecastBatch(
+        source="met_no",
+        request_datetime=request_datetime,
+        latitude=latitude,
+        longitude=longitude,
+        forecast_datetimes=forecast_datetimes.tz_localize(None).to_numpy(dtype="datetime64[ns]"),
+        features=features
+    )
 
-    return result
+
+def parse_met_no_forecast(payload: dict[str, Any], latitude: float, longitude: float) -> list[WeatherForecast]:
+    return parse_met_no_forecast_batch(payload, latitude, longitude).to_models()
 
 
 def fetch_met_no_forecast(latitude: float, longitude: float) -> list[WeatherForecast]:
-    url: str = "https://api.met.no/weatherapi/locationforecast/2.0/compact"
-    headers: dict[str, str] = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:116.0) Gecko/20100101 Firefox/116.0"
-    }
-    parameters: dict[str, float] = {
-        "lat": latitude,
-        "lon": longitude
-    }
-    response: Response = requests.get(url, headers=headers, params=parameters)
-    response.raise_for_status()
+    return fetch_met_no_forecast_batch(latitude, longitude).to_models()
 
-    data: list = response.json()["properties"]["timeseries"]
-    request_datetime = get_utc_time_without_offset()
 
-    result: list[WeatherForecast] = []
-
-    for entry in data:
-        forecast_datetime: datetime = datetime.fromisoformat(entry["time"]).replace(tzinfo=None)
-        details = entry["data"]["instant"]["details"]
-
-        precipitation = None
-        if "next_1_hours" in entry["data"]:
-            precipitation = entry["data"]["next_1_hours"]["details"]["precipitation_amount"]
-
-        weather_forecast: WeatherForecast = WeatherForecast(
-            source="met_no",
-            request_datetime=request_datetime,
-            forecast_datetime=forecast_datetime,
-            latitude=latitude,
-            longitude=longitude,
-            temperature=details.get("air_temperature"),
-            wind_speed=mps_to_kmph(details.get("wind_speed")),
-            wind_direction=details.get("wind_from_direction"),
-            precipitation=precipitation,
-            humidity=details.get("relative_humidity"),
-            air_pressure=details.get("air_pressure_at_sea_level"),
-            dew_point=details.get("dew_point_temperature"),
-            cloud_cover=details.get("cloud_area_fraction"),
-            visibility=details.get("visibility")
-        )
-
-        result.append(weather_forecast)
-
-    return result
+def fetch_met_no_forecast_batch(latitude: float, longitude: float) -> ForecastBatch:
+    request: ProviderRequest = get_met_no_request(latitude, longitude)
+    result: CachedFetch = _get_provider_response("met_no", request, latitude, longitude)
+
+    if not result.modified:
+        return ForecastBatch.empty("met_no", get_utc_time_without_offset(), latitude, longitude)
+
+    with metrics.timer("json_decode", provider="met_no"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="met_no"):
+        return parse_met_no_forecast_batch(payload, latitude, longitude)
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from app.api_clients import ProviderRequest, get_wttr_request, parse_wttr_forecast, get_open_meteo_request, \
+    parse_open_meteo_forecast, get_met_no_request, parse_met_no_forecast
+from app.http_client import RETRY_STATUS_CODES
+from app.instrumentation import metrics
+from app.model import WeatherForecast
+from app.response_cache import ResponseCache, CacheKey, CachedFetch, CacheEntry
+
+
+class AsyncHttpClient:
+    def __init__(self,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 15.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 10.0,
+                 per_host_limit: int = 16,
+                 latency_window: int = 1000,
+                 response_cache: Optional[ResponseCache] = None
+                 ) -> None:
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: float = read_timeout
+        self.max_retries: int = max_retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.per_host_limit: int = per_host_limit
+        self.latency_window: int = latency_window
+        self.response_cache: Optional[ResponseCache] = response_cache
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._latencies: dict[str, deque[float]] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        # Sessions and semaphores are bound to the event loop that created them
+        if self._session is None or self._session.closed or self._loop is not loop:
+            timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                                                   sock_read=self.read_timeout)
+            connector: aiohttp.TCPConnector = aiohttp.TCPConnector(limit=0, limit_per_host=self.per_host_limit)
+
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=connector, raise_for_status=False)
+            self._loop = loop
+            self._semaphores = {}
+
+        return self._session
+
+    def _get_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore: Optional[asyncio.Semaphore] = self._semaphores.get(host)
+
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._semaphores[host] = semaphore
+
+        return semaphore
+
+    async def _get(self,
+                   url: str,
+                   params: Optional[dict[str, Any]] = None,
+                   headers: Optional[dict[str, str]] = None
+                   ) -> tuple[int, dict[str, str], bytes]:
+        session: aiohttp.ClientSession = self._get_session()
+        host: str = urlsplit(url).netloc
+        query: dict[str, str] = {key: str(value) for key, value in (params or {}).items()}
+
+        attempt: int = 0
+
+        while True:
+            async with self._get_semaphore(host):
+                start: float = time.perf_counter()
+
+                async with session.get(url, params=query, headers=headers) as response:
+                    if response.status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        response.raise_for_status()
+                        body: bytes = await response.read()
+                        self._record_latency(host, time.perf_counter() - start)
+
+                        return response.status, dict(response.headers), body
+
+                    retry_after: Optional[str] = response.headers.get("Retry-After")
+                    self._record_latency(host, time.perf_counter() - start)
+
+            # Back off outside the semaphore, so waiting retries do not hold a host slot
+            metrics.increment("http_retries", host=host, status=response.status)
+            await asyncio.sleep(self.get_backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def get_json(self,
+                       url: str,
+                       params: Optional[dict[str, Any]] = None,
+                       headers: Optional[dict[str, str]] = None
+                       ) -> Any:
+        _, _, body = await self._get(url, params=params, headers=headers)
+
+        return json.loads(body)
+
+    async def get_cached(self,
+                         url: str,
+                         params: Optional[dict[str, Any]] = None,
+                         headers: Optional[dict[str, str]] = None,
+                         cache_key: Optional[CacheKey] = None
+                         ) -> CachedFetch:
+        cache: Optional[ResponseCache] = self.response_cache
+        cached: Optional[tuple[CacheEntry, bytes]] = None
+        request_headers: dict[str, str] = dict(headers or {})
+
+        if cache is not None and cache_key is not None:
+            cached = cache.get(cache_key)
+
+            if cached is not None:
+                entry, body = cached
+
+                if entry.is_fresh():
+                    metrics.increment("response_cache", result="fresh")
+                    return CachedFetch(body, modified=False)
+
+                request_headers.update(entry.get_conditional_headers())
+
+        status, response_headers, body = await self._get(url, params=params, headers=request_headers)
+
+        if status == 304 and cached is not None:
+            cache.refresh(cache_key, response_headers)
+            metrics.increment("response_cache", result="not_modified")
+            return CachedFetch(cached[1], modified=False)
+
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, body, response_headers)
+
+        metrics.increment("response_cache", result="downloaded")
+        return CachedFetch(body, modified=True)
+
+    def get_backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay: float = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+
+        return delay
+
+    def _record_latency(self, host: str, seconds: float) -> None:
+        metrics.observe("http_request", seconds, host=host)
+        self._latencies.setdefault(host, deque(maxlen=self.latency_window)).append(seconds)
+
+    def get_latencies(self, host: str) -> list[float]:
+        return list(self._latencies.get(host, ()))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+        self._loop = None
+
+
+async_http_client: AsyncHttpClient = AsyncHttpClient()
+
+
+async def _get_provider_response(provider: str, request: ProviderRequest, latitude: float,
+                                 longitude: float) -> CachedFetch:
+    return await async_http_client.get_cached(request.url, params=request.params, headers=request.headers,
+                                              cache_key=(provider, latitude, longitude))
+
+
+async def fetch_wttr_forecast_async(latitude: float, longitude: float) -> list[WeatherForecast]:
+    result: CachedFetch = await _get_provider_response("wttr", get_wttr_request(latitude, longitude),
+                                                       latitude, longitude)
+
+    if not result.modified:
+        return []
+
+    with metrics.timer("json_decode", provider="wttr"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="wttr"):
+        return parse_wttr_forecast(payload, latitude, longitude)
+
+
+async def fetch_open_meteo_forecast_async(latitude: float, longitude: float) -> list[WeatherForecast]:
+    result: CachedFetch = await _get_provider_response("open_meteo", get_open_meteo_request(latitude, longitude),
+                                                       latitude, longitude)
+
+    if not result.modified:
+        return []
+
+    with metrics.timer("json_decode", provider="open_meteo"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="open_meteo"):
+        return parse_open_meteo_forecast(payload, latitude, longitude)
+
+
+async def fetch_met_no_forecast_async(latitude: float, longitude: float) -> list[WeatherForecast]:
+    result: CachedFetch = await _get_provider_response("met_no", get_met_no_request(latitude, longitude),
+                                                       latitude, longitude)
+
+    if not result.modified:
+        return []
+
+    with metrics.timer("json_decode", provider="met_no"):
+        payload: dict[str, Any] = result.json()
+
+    with metrics.timer("parse", provider="met_no"):
+        return parse_met_no_forecast(payload, latitude, longitude)
@@ -0,0 +1,314 @@
+import argparse
+import heapq
+import random
+import signal
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Lock
+from typing import Optional
+
+from app.api_clients import fetch_wttr_forecast_batch, fetch_open_meteo_forecast_batch, fetch_met_no_forecast_batch
+from app.forecast_service import FetchFunction, ForecastResult, fetch_provider_forecasts
+from app.forecast_writer import ForecastWriter
+from app.http_client import http_client
+from app.instrumentation import metrics
+from app.model import Location
+from app.response_cache import ResponseCache
+
+
+@dataclass
+class ProviderSchedule:
+    fetch_function: FetchFunction
+    interval: float  # Seconds between two fetches of the same location
+    rate: float  # Requests per second allowed by the token bucket
+    burst: int  # Token bucket capacity
+
+
+def get_default_provider_schedules() -> dict[str, ProviderSchedule]:
+    return {
+        "wttr": ProviderSchedule(fetch_wttr_forecast_batch, interval=3600, rate=1, burst=5),
+        "open_meteo": ProviderSchedule(fetch_open_meteo_forecast_batch, interval=3600, rate=5, burst=10),
+        "met_no": ProviderSchedule(fetch_met_no_forecast_batch, interval=3600, rate=5, burst=10)
+    }
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate: float = rate
+        self.capacity: int = capacity
+
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+        self._lock: Lock = Lock()
+
+    def try_acquire(self) -> float:
+        # Takes a token and returns 0, or returns the seconds until the next token is available
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+
+            return (1 - self._tokens) / self.rate
+
+
+def read_locations(file_path: str) -> list[Location]:
+    # One "latitude,longitude" pair per line; empty lines and lines starting with # are ignored
+    locations: list[Location] = []
+
+    for line in Path(file_path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        latitude, longitude = line.split(",")[:2]
+        locations.append(Location(latitude=float(latitude), longitude=float(longitude)))
+
+    return locations
+
+
+class ForecastCollector:
+    def __init__(self,
+                 locations_path: str,
+                 file_path: str,
+                 provider_schedules: Optional[dict[str, ProviderSchedule]] = None,
+                 max_workers: int = 8,
+                 jitter: float = 0.1,
+                 metrics_path: Optional[str] = None,
+                 metrics_interval: float = 15.0,
+                 profile_path: str = "../data/collector.prof"
+                 ) -> None:
+        self.locations_path: str = locations_path
+        self.file_path: str = file_path
+        self.provider_schedules: dict[str, ProviderSchedule] = provider_schedules or get_default_provider_schedules()
+        self.max_workers: int = max_workers
+        self.jitter: float = jitter
+        self.metrics_path: Optional[str] = metrics_path
+        self.metrics_interval: float = metrics_interval
+        self.profile_path: str = profile_path
+
+        self.buckets: dict[str, TokenBucket] = {
+            provider: TokenBucket(schedule.rate, schedule.burst)
+            for provider, schedule in self.provider_schedules.items()
+        }
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._schedule: list[tuple[float, int, Location, str]] = []
+        self._sequence: int = 0
+        self._jobs: set[tuple[Location, str]] = set()
+        self._in_flight: set[tuple[Location, str]] = set()
+        self._in_flight_lock: Lock = Lock()
+        self._writer: Optional[ForecastWriter] = None
+        self._stop: Event = Event()
+        self._locations_modified: Optional[float] = None
+        self._locations_error: Optional[str] = None
+        self._next_metrics_export: float = 0.0
+        self._profile_requested: Event = Event()
+        self._profile_pending: Optional[set[tuple[Location, str]]] = None
+        self._profile_running: int = 0
+
+    def _push(self, run_at: float, location: Location, provider: str) -> None:
+        self._sequence += 1
+        heapq.heappush(self._schedule, (run_at, self._sequence, location, provider))
+
+    def _get_next_run(self, scheduled_at: float, provider: str) -> float:
+        interval: float = self.provider_schedules[provider].interval
+        next_run: float = scheduled_at + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+        # A job that fell behind is not run back to back, it is spread over the next jitter window
+        return max(next_run, time.monotonic() + random.uniform(0, self.jitter * interval))
+
+    def get_cache_ttls(self) -> dict[str, float]:
+        # A cached body must go stale before the earliest next fetch of its location, or that fetch is served from
+        # the cache and stores nothing; half of the shortest interval leaves room for queueing and slow responses
+        return {provider: schedule.interval * (1 - self.jitter) / 2
+                for provider, schedule in self.provider_schedules.items()}
+
+    def reload_locations(self) -> None:
+        try:
+            modified: float = Path(self.locations_path).stat().st_mtime
+
+            if modified == self._locations_modified:
+                return
+
+            self._locations_modified = modified
+            locations: list[Location] = read_locations(self.locations_path)
+        except (OSError, ValueError) as e:
+            # Missing during a rename-on-save or malformed: the previous jobs keep running until a readable version
+            error: str = f"Cannot read {self.locations_path}, keeping {len(self._jobs)} jobs: {e}"
+            if error != self._locations_error:
+                print(error)
+                self._locations_error = error
+            return
+
+        self._locations_error = None
+        jobs: set[tuple[Location, str]] = {
+            (location, provider) for location in locations for provider in self.provider_schedules
+        }
+
+        # New jobs start at a random point of their interval, so sites do not fire at the same instant
+        now: float = time.monotonic()
+        for location, provider in jobs - self._jobs:
+            self._push(now + random.uniform(0, self.provider_schedules[provider].interval), location, provider)
+
+        print(f"Collecting {len(jobs) // max(1, len(self.provider_schedules))} locations "
+              f"({len(jobs - self._jobs)} jobs added, {len(self._jobs - jobs)} removed)")
+        self._jobs = jobs
+
+    def _run_job(self, location: Location, provider: str, profiled: bool = False) -> None:
+        try:
+            fetch_function: FetchFunction = self.provider_schedules[provider].fetch_function
+            result: Optional[ForecastResult] = fetch_provider_forecasts(location.latitude, location.longitude,
+                                                                        fetch_function)
+            # The writer only buffers the result, so fetch workers never wait for the disk
+            if result:
+                self._writer.submit(result)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard((location, provider))
+                if profiled:
+                    self._profile_running -= 1
+
+    @staticmethod
+    def _report_job_error(future: Future, location: Location, provider: str) -> None:
+        # Fetch errors are recorded in provider_health; anything else would otherwise vanish with the future
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Job {provider} at {location.latitude},{location.longitude} failed: {future.exception()!r}")
+
+    def _dispatch_due_jobs(self) -> None:
+        now: float = time.monotonic()
+
+        while self._schedule and self._schedule[0][0] <= now:
+            run_at, _, location, provider = heapq.heappop(self._schedule)
+
+            if (location, provider) not in self._jobs:
+                continue  # Removed from the location list
+
+            with self._in_flight_lock:
+                running: bool = (location, provider) in self._in_flight
+
+            # A fetch still running from the previous cycle is not doubled; the job waits for its next turn
+            if running:
+                self._push(self._get_next_run(run_at, provider), location, provider)
+                continue
+
+            wait_time: float = self.buckets[provider].try_acquire()
+            if wait_time > 0:
+                self._push(now + wait_time, location, provider)
+                continue
+
+            # Only the first run of each job counts towards the profiled cycle
+            profiled: bool = self._profile_pending is not None and (location, provider) in self._profile_pending
+
+            with self._in_flight_lock:
+                self._in_flight.add((location, provider))
+                if profiled:
+                    self._profile_pending.discard((location, provider))
+                    self._profile_running += 1
+
+            future: Future = self._executor.submit(self._run_job, location, provider, profiled)
+            future.add_done_callback(lambda done, job=(location, provider): self._report_job_error(done, *job))
+            self._push(self._get_next_run(run_at, provider), location, provider)
+
+    def _get_wait_time(self) -> float:
+        if not self._schedule:
+            return 1.0
+
+        return min(1.0, max(0.0, self._schedule[0][0] - time.monotonic()))
+
+    def request_profile(self) -> None:
+        # Safe to call from a signal handler; the profile starts in the main loop
+        self._profile_requested.set()
+
+    def _update_profile(self) -> None:
+        if self._profile_requested.is_set() and self._profile_pending is None:
+            self._profile_requested.clear()
+            self._profile_pending = set(self._jobs)
+            metrics.profiler.start()
+            print(f"Profiling the next collection cycle ({len(self._profile_pending)} jobs)")
+
+        if self._profile_pending is None:
+            return
+
+        # The cycle ends once every job known at the request ran once and finished
+        self._profile_pending &= self._jobs
+
+        with self._in_flight_lock:
+            done: bool = len(self._profile_pending) == 0 and self._profile_running == 0
+
+        if done:
+            self._writer.flush()
+            sections: int = metrics.profiler.stop(self.profile_path)
+            self._profile_pending = None
+            print(f"Wrote the profile of {sections} fetch and write sections to {self.profile_path}")
+
+    def _export_metrics(self, force: bool = False) -> None:
+        if self.metrics_path is None or (not force and time.monotonic() < self._next_metrics_export):
+            return
+
+        self._next_metrics_export = time.monotonic() + self.metrics_interval
+        metrics.write_prometheus(self.metrics_path)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        # Sessions, the response cache, the timezone finder and the key index stay warm for the whole run
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="collector")
+        self._writer = ForecastWriter(self.file_path)
+
+        try:
+            while not self._stop.is_set():
+                self.reload_locations()
+                self._dispatch_due_jobs()
+                self._update_profile()
+                self._export_metrics()
+                self._stop.wait(self._get_wait_time())
+        finally:
+            # Jobs not started yet are dropped, running ones finish and their results are written
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._writer.close()
+            http_client.close()
+
+            if metrics.enabled:
+                self._export_metrics(force=True)
+                metrics.print_summary()
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Collect forecasts continuously")
+    parser.add_argument("locations_path", nargs="?", default="../data/locations.csv")
+    parser.add_argument("--file-path", default="../data/forecasts.csv")
+    parser.add_argument("--cache-directory", default="../data/http_cache")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--metrics", action="store_true", help="Time every stage and print a summary on exit")
+    parser.add_argument("--metrics-path", default=None, help="Prometheus text file, rewritten periodically")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on /metrics")
+    parser.add_argument("--profile-path", default="../data/collector.prof",
+                        help="Where SIGUSR1 writes a cProfile of one collection cycle")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    metrics.enabled = arguments.metrics or arguments.metrics_path is not None or arguments.metrics_port is not None
+    if arguments.metrics_port is not None:
+        metrics.serve(arguments.metrics_port)
+
+    collector: ForecastCollector = ForecastCollector(arguments.locations_path, arguments.file_path,
+                                                     max_workers=arguments.workers, jitter=arguments.jitter,
+                                                     metrics_path=arguments.metrics_path,
+                                                     profile_path=arguments.profile_path)
+
+    # Open-Meteo and wttr send no freshness headers, so their entries expire on the collector's schedule
+    http_client.response_cache = ResponseCache(arguments.cache_directory, default_ttls=collector.get_cache_ttls())
+
+    signal.signal(signal.SIGINT, lambda *_: collector.stop())
+    signal.signal(signal.SIGTERM, lambda *_: collector.stop())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: collector.request_profile())
+
+    collector.run()
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+from datetime import date
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.model import FEATURE_FIELDS, FORECAST_FIELDS
+
+FEATURE_COLUMNS: list[str] = FEATURE_FIELDS
+
+COLUMNS: list[str] = FORECAST_FIELDS
+
+TIMESTAMP_COLUMNS: list[str] = ["request_datetime", "forecast_datetime"]
+
+META_FILE_NAME: str = "_meta.json"
+
+_write_lock: Lock = Lock()
+
+
+def is_columnar_store(file_path: str) -> bool:
+    # An existing directory, or a new path without a suffix; any file name with a suffix is a CSV
+    path: Path = Path(file_path)
+
+    return path.is_dir() or (not path.exists() and path.suffix == "")
+
+
+def get_partition_path(store_path: Path, latitude: float, longitude: float, request_month: str) -> Path:
+    return store_path / f"{latitude}_{longitude}" / request_month
+
+
+def _get_column_files(column: str) -> list[tuple[str, np.dtype]]:
+    if column == "source":
+        return [("source.bin", np.dtype(np.uint8))]
+    if column in TIMESTAMP_COLUMNS:
+        return [(f"{column}.bin", np.dtype(np.int64))]
+
+    return [(f"{column}.bin", np.dtype(np.float32)), (f"{column}.mask.bin", np.dtype(np.bool_))]
+
+
+def _read_meta(partition_path: Path) -> Optional[dict[str, Any]]:
+    meta_path: Path = partition_path / META_FILE_NAME
+
+    if not meta_path.exists():
+        return None
+
+    return json.loads(meta_path.read_text())
+
+
+def _write_meta(partition_path: Path, meta: dict[str, Any]) -> None:
+    temporary_path: Path = partition_path / (META_FILE_NAME + ".tmp")
+    temporary_path.write_text(json.dumps(meta))
+    os.replace(temporary_path, partition_path / META_FILE_NAME)
+
+
+def _append_partition(partition_path: Path, latitude: float, longitude: float, dataframe: pd.DataFrame) -> None:
+    partition_path.mkdir(parents=True, exist_ok=True)
+
+    meta: dict[str, Any] = _read_meta(partition_path) or {
+        "latitude": latitude,
+        "longitude": longitude,
+        "rows": 0,
+        "sources": []
+    }
+
+    # Sources are stored as one byte codes into the partition's source list
+    sources: list[str] = meta["sources"]
+    for source in dataframe["source"].unique():
+        if source not in sources:
+            sources.append(source)
+
+    source_codes: dict[str, int] = {source: code for code, source in enumerate(sources)}
+
+    column_data: dict[str, np.ndarray] = {
+        "source.bin": dataframe["source"].map(source_codes).to_numpy(dtype=np.uint8)
+    }
+
+    for column in TIMESTAMP_COLUMNS:
+        column_data[f"{column}.bin"] = pd.to_datetime(dataframe[column]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+    for column in FEATURE_COLUMNS:
+        values: np.ndarray = pd.to_numeric(dataframe[column], errors="coerce").to_numpy(dtype=np.float32,
+                                                                                         na_value=np.nan)
+        column_data[f"{column}.bin"] = values
+        column_data[f"{column}.mask.bin"] = np.isnan(values)
+
+    for file_name, values in column_data.items():
+        file_path: Path = partition_path / file_name
+        itemsize: int = values.dtype.itemsize
+
+        with open(file_path, "ab") as file:
+            # Drop bytes past the committed row count, left behind by an interrupted write
+            file.truncate(meta["rows"] * itemsize)
+            file.seek(meta["rows"] * itemsize)
+            file.write(np.ascontiguousarray(values).tobytes())
+
+    # Rows become visible to readers only once the row count is committed
+    meta["rows"] += len(dataframe)
+    _write_meta(partition_path, meta)
+
+
+def save_dataframe_to_columnar(dataframe: pd.DataFrame, store_path: str) -> None:
+    if len(dataframe) == 0:
+        return
+
+    path: Path = Path(store_path)
+    request_months: pd.Series = pd.to_datetime(dataframe["request_datetime"]).dt.strftime("%Y-%m")
+
+    with _write_lock:
+        for (latitude, longitude, request_month), partition in dataframe.groupby(
+                [dataframe["latitude"], dataframe["longitude"], request_months], sort=False):
+            partition_path: Path = get_partition_path(path, latitude, longitude, request_month)
+            _append_partition(partition_path, latitude, longitude, partition)
+
+
+def iterate_partitions(store_path: str,
+                       locations: Optional[list[tuple[float, float]]] = None,
+                       request_date_start: Optional[date] = None,
+                       request_date_end: Optional[date] = None
+                       ) -> Iterator[tuple[Path, dict[str, Any]]]:
+    path: Path = Path(store_path)
+
+    if not path.exists():
+        return
+
+    month_start: Optional[str] = request_date_start.strftime("%Y-%m") if request_date_start is not None else None
+    month_end: Optional[str] = request_date_end.strftime("%Y-%m") if request_date_end is not None else None
+    location_set: Optional[set[tuple[float, float]]] = set(locations) if locations is not None else None
+
+    for meta_path in sorted(path.glob(f"*/*/{META_FILE_NAME}")):
+        partition_path: Path = meta_path.parent
+        request_month: str = partition_path.name
+
+        # Prune partitions using only the directory name and metadata
+        if month_start is not None and request_month < month_start:
+            continue
+        if month_end is not None and request_month > month_end:
+            continue
+
+        meta: dict[str, Any] = json.loads(meta_path.read_text())
+
+        if location_set is not None and (meta["latitude"], meta["longitude"]) not in location_set:
+            continue
+        if meta["rows"] == 0:
+            continue
+
+        yield partition_path, meta
+
+
+def read_partition(partition_path: Path,
+                   meta: dict[str, Any],
+                   columns: Optional[list[str]] = None,
+                   start: int = 0,
+                   stop: Optional[int] = None,
+                   request_date_start: Optional[date] = None,
+                   request_date_end: Optional[date] = None
+                   ) -> pd.DataFrame:
+    columns = columns or COLUMNS
+    rows: int = meta["rows"]
+    stop = rows if stop is None else min(stop, rows)
+    size: int = max(0, stop - start)
+    data: dict[str, Any] = {}
+    selected: Optional[np.ndarray] = None
+
+    if request_date_start is not None or request_date_end is not None:
+        # Partitions cover whole request months, so rows outside the requested days are dropped here
+        file_name, dtype = _get_column_files("request_datetime")[0]
+        request_dates: np.ndarray = np.memmap(partition_path / file_name, dtype=dtype, mode="r", shape=(rows,))[
+            start:stop].view("datetime64[ns]").astype("datetime64[D]")
+        selected = np.ones(size, dtype=bool)
+
+        if request_date_start is not None:
+            selected &= request_dates >= np.datetime64(request_date_start, "D")
+        if request_date_end is not None:
+            selected &= request_dates <= np.datetime64(request_date_end, "D")
+
+    for column in columns:
+        if column in ("latitude", "longitude"):
+            data[column] = np.full(size if selected is None else int(selected.sum()), meta[column], dtype=np.float64)
+            continue
+
+        # Only the requested row range of the mapped file is read
+        files: list[tuple[str, np.dtype]] = _get_column_files(column)
+        arrays: list[np.ndarray] = [
+            np.memmap(partition_path / file_name, dtype=dtype, mode="r", shape=(rows,))[start:stop]
+            for file_name, dtype in files
+        ]
+
+        if column == "source":
+            data[column] = np.asarray(meta["sources"], dtype=object)[arrays[0]]
+        elif column in TIMESTAMP_COLUMNS:
+            data[column] = np.array(arrays[0]).view("datetime64[ns]")
+        else:
+            # Stored as float32 but read as float64, so both store formats give the same dtypes
+            values, mask = arrays
+            data[column] = np.where(mask, np.nan, values.astype(np.float64))
+
+        if selected is not None:
+            data[column] = data[column][selected]
+
+    return pd.DataFrame(data, columns=columns)
+
+
+def load_columnar_into_dataframe(store_path: str,
+                                 columns: Optional[list[str]] = None,
+                                 locations: Optional[list[tuple[float, float]]] = None,
+                                 request_date_start: Optional[date] = None,
+                                 request_date_end: Optional[date] = None
+                                 ) -> pd.DataFrame:
+    dataframes: list[pd.DataFrame] = [
+        read_partition(partition_path, meta, columns, request_date_start=request_date_start,
+                       request_date_end=request_date_end)
+        for partition_path, meta in iterate_partitions(store_path, locations, request_date_start, request_date_end)
+    ]
+
+    if len(dataframes) == 0:
+        empty: pd.DataFrame = pd.DataFrame(columns=columns or COLUMNS)
+        for column in TIMESTAMP_COLUMNS:
+            if column in empty.columns:
+                empty[column] = empty[column].astype("datetime64[ns]")
+
+        return empty
+
+    return pd.concat(dataframes, ignore_index=True)
+
+
+def migrate_csv_to_columnar(csv_path: str, store_path: str, chunk_size: int = 500_000) -> int:
+    row_count: int = 0
+
+    for chunk in pd.read_csv(csv_path, parse_dates=TIMESTAMP_COLUMNS, chunksize=chunk_size):
+        save_dataframe_to_columnar(chunk, store_path)
+        row_count += len(chunk)
+
+    return row_count
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Migrate forecasts CSV to a columnar store")
+    parser.add_argument("csv_path")
+    parser.add_argument("store_path")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    migrated_rows: int = migrate_csv_to_columnar(arguments.csv_path, arguments.store_path)
+    print(f"Migrated {migrated_rows} rows into {arguments.store_path}")
@@ -0,0 +1,11 @@
+import argparse
+
+from app.storage import compact_forecasts
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Remove duplicate forecasts from a store")
+    parser.add_argument("file_path", nargs="?", default="../data/forecasts.csv")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    removed_rows: int = compact_forecasts(arguments.file_path)
+    print(f"Removed {removed_rows} duplicate rows from {arguments.file_path}")
@@ -1,9 +1,38 @@
-from app.api_clients import fetch_wttr_forecast, fetch_open_meteo_forecast, fetch_met_no_forecast
-from app.forecast_service import fetch_forecasts
-from app.storage import save_forecasts
-
-latitude = 50.049683
-longitude = 19.944544
-forecasts = fetch_forecasts(latitude, longitude,
-                            [fetch_wttr_forecast, fetch_open_meteo_forecast, fetch_met_no_forecast])
-save_forecasts(forecasts, "../data/forecasts.csv")
+import argparse
+
+from app.api_clients import fetch_wttr_forecast_batch, fetch_open_meteo_forecast_batch, fetch_met_no_forecast_batch
+from app.forecast_service import fetch_forecasts_for_locations
+from app.forecast_writer import ForecastWriter
+from app.http_client import http_client
+from app.instrumentation import metrics
+from app.model import Location
+from app.response_cache import ResponseCache
+
+parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Fetch forecasts for the configured locations")
+parser.add_argument("--metrics-path", default=None, help="Also write the metrics as a Prometheus text file")
+parser.add_argument("--profile-path", default=None, help="Write a cProfile of the fetch and write sections")
+arguments: argparse.Namespace = parser.parse_args()
+
+# Open-Meteo and wttr send no freshness headers; entries expire well before the next hourly run
+http_client.response_cache = ResponseCache("../data/http_cache", default_ttls={"open_meteo": 1800, "wttr": 1800})
+
+metrics.enabled = True
+if arguments.profile_path is not None:
+    metrics.profiler.start()
+
+locations: list[Location] = [
+    Location(latitude=50.049683, longitude=19.944544)
+]
+
+fetch_functions = [fetch_wttr_forecast_batch, fetch_open_meteo_forecast_batch, fetch_met_no_forecast_batch]
+
+with ForecastWriter("../data/forecasts.csv") as writer:
+    for location, forecasts in fetch_forecasts_for_locations(locations, fetch_functions):
+        writer.submit(forecasts)
+
+if arguments.profile_path is not None:
+    metrics.profiler.stop(arguments.profile_path)
+if arguments.metrics_path is not None:
+    metrics.write_prometheus(arguments.metrics_path)
+
+metrics.print_summary()
@@ -1,31 +1,310 @@
-from concurrent.futures import Future, as_completed
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import Callable
+from json import JSONDecodeError
+from typing import Callable, Iterable, Iterator, Optional, Awaitable, AsyncIterator, Union
 
+from aiohttp import ClientError
 from requests import RequestException
 
-from app.model import WeatherForecast
+from app.instrumentation import metrics
+from app.model import WeatherForecast, Location, ForecastBatch
+from app.provider_health import ProviderHealth, provider_health, get_provider_name
+
+ForecastResult = Union[list[WeatherForecast], ForecastBatch]
+FetchFunction = Callable[[float, float], ForecastResult]
+AsyncFetchFunction = Callable[[float, float], Awaitable[ForecastResult]]
+FetchErrors = (RequestException, ClientError, TimeoutError, KeyError, TypeError, AttributeError, ValueError,
+               IndexError)
+
+
+def get_error_category(error: Exception) -> str:
+    match error:
+        case JSONDecodeError():
+            return "json"
+        case RequestException() | ClientError() | TimeoutError():
+            return "http"
+        case KeyError() | TypeError() | AttributeError() | ValueError():
+            return "json"
+        case IndexError():
+            return "incomplete_data"
+
+    return "other"
+
+
+def _as_models(result: ForecastResult) -> list[WeatherForecast]:
+    if isinstance(result, ForecastBatch):
+        return result.to_models()
+
+    return result
+
+
+def fetch_provider_forecasts(latitude: float,
+                             longitude: float,
+                             fetch_function: FetchFunction
+                             ) -> Optional[ForecastResult]:
+    # Failures are counted per provider instead of printed; an open breaker skips the provider without a request
+    health: ProviderHealth = provider_health.get(get_provider_name(fetch_function))
+
+    if not health.allow_request():
+        return None
+
+    start: float = time.perf_counter()
+
+    try:
+        with metrics.profiler.section(), metrics.timer("fetch", provider=health.name,
+                                                       location=f"{latitude},{longitude}"):
+            result: ForecastResult = fetch_function(latitude, longitude)
+    except FetchErrors as e:
+        health.record_failure(get_error_category(e), e)
+        return None
+    except Exception as e:
+        health.record_failure("other", e)
+        raise
+    except BaseException:
+        health.abort_trial()  # Cancelled or interrupted, so a half-open breaker would otherwise never retry
+        raise
+
+    health.record_success(time.perf_counter() - start)
+    metrics.increment("fetched_rows", len(result), provider=health.name)
+
+    return result
 
 
 def fetch_forecasts(latitude: float,
                     longitude: float,
-                    fetch_functions: list[Callable[[float, float], list[WeatherForecast]]]
+                    fetch_functions: list[FetchFunction],
+                    hedge_percentile: Optional[float] = None
                     ) -> list[WeatherForecast]:
     all_forecasts: list[WeatherForecast] = []
 
-    with ThreadPoolExecutor(max_workers=len(fetch_functions)) as executor:
-        futures: list[Future] = [executor.submit(fetch_function, latitude, longitude) for fetch_function in
-                                 fetch_functions]
-
-        for future in as_completed(futures):
-            try:
-                hourly_forecasts: list[WeatherForecast] = future.result()
-                all_forecasts.extend(hourly_forecasts)
-            except RequestException as e:
-                print(f"Problem with HTTP request: {e}")
-            except (KeyError, TypeError, AttributeError) as e:
-                print(f"Problem with received JSON: {e}")
-            except IndexError as e:
-                print(f"Problem with incomplete data: {e}")
+    # Losing attempts of hedged requests finish in the background instead of being waited for
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(
+        max_workers=len(fetch_functions) * (2 if hedge_percentile is not None else 1))
+    attempts: dict[Future, FetchFunction] = {}
+    hedges: set[Future] = set()
+    hedge_deadlines: dict[FetchFunction, float] = {}
+    waiting: set[FetchFunction] = set(fetch_functions)
+    started: float = time.monotonic()
+
+    try:
+        for fetch_function in fetch_functions:
+            attempts[executor.submit(fetch_provider_forecasts, latitude, longitude, fetch_function)] = fetch_function
+
+            if hedge_percentile is not None:
+                # A second request goes out once the first one is slower than the provider's usual latency
+                delay: Optional[float] = provider_health.get(get_provider_name(fetch_function)) \
+                    .get_latency_percentile(hedge_percentile)
+                if delay is not None:
+                    hedge_deadlines[fetch_function] = started + delay
+
+        while waiting:
+            timeout: Optional[float] = None
+            if hedge_deadlines:
+                timeout = max(0.0, min(hedge_deadlines.values()) - time.monotonic())
+
+            done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                fetch_function = attempts.pop(future)
+
+                if fetch_function not in waiting:
+                    continue  # The other attempt already answered
+
+                hourly_forecasts: Optional[ForecastResult] = future.result()
+                other_attempt_running: bool = fetch_function in attempts.values()
+
+                if hourly_forecasts is None and (other_attempt_running or fetch_function in hedge_deadlines):
+                    continue  # Failed, but the hedge may still answer
+
+                waiting.discard(fetch_function)
+                hedge_deadlines.pop(fetch_function, None)
+
+                if other_attempt_running or future in hedges:
+                    provider_health.get(get_provider_name(fetch_function)).record_hedge(
+                        won=future in hedges and hourly_forecasts is not None)
+
+                if hourly_forecasts is not None:
+                    all_forecasts.extend(_as_models(hourly_forecasts))
+
+            now: float = time.monotonic()
+            for fetch_function, deadline in list(hedge_deadlines.items()):
+                if deadline <= now:
+                    del hedge_deadlines[fetch_function]
+                    hedge: Future = executor.submit(fetch_provider_forecasts, latitude, longitude, fetch_function)
+                    attempts[hedge] = fetch_function
+                    hedges.add(hedge)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
     return all_forecasts
+
+
+class BatchForecastFetcher:
+    def __init__(self,
+                 max_workers: int = 16,
+                 provider_concurrency: Optional[dict[FetchFunction, int]] = None,
+                 default_provider_concurrency: int = 4
+                 ) -> None:
+        self.max_workers: int = max_workers
+        self.provider_concurrency: dict[FetchFunction, int] = provider_concurrency or {}
+        self.default_provider_concurrency: int = default_provider_concurrency
+
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers,
+                                                                thread_name_prefix="forecast-fetch")
+
+    def get_provider_limit(self, fetch_function: FetchFunction) -> int:
+        limit: int = self.provider_concurrency.get(fetch_function, self.default_provider_concurrency)
+
+        return max(1, min(limit, self.max_workers))
+
+    def fetch(self,
+              locations: Iterable[Location],
+              fetch_functions: list[FetchFunction]
+              ) -> Iterator[tuple[Location, FetchFunction, ForecastResult]]:
+        # One queue of pending locations per provider, drained as that provider gets free slots
+        locations = list(locations)
+        pending: dict[FetchFunction, deque[Location]] = {
+            fetch_function: deque(locations) for fetch_function in fetch_functions
+        }
+
+        in_flight: dict[FetchFunction, int] = {fetch_function: 0 for fetch_function in fetch_functions}
+        running: dict[Future, tuple[Location, FetchFunction]] = {}
+
+        def submit_ready() -> None:
+            for fetch_function, queue in pending.items():
+                while (queue and len(running) < self.max_workers and
+                       in_flight[fetch_function] < self.get_provider_limit(fetch_function)):
+                    location: Location = queue.popleft()
+                    future: Future = self._executor.submit(fetch_provider_forecasts, location.latitude,
+                                                           location.longitude, fetch_function)
+
+                    running[future] = (location, fetch_function)
+                    in_flight[fetch_function] += 1
+
+        submit_ready()
+
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    location, fetch_function = running.pop(future)
+                    in_flight[fetch_function] -= 1
+
+                    try:
+                        hourly_forecasts: Optional[ForecastResult] = future.result()
+                    finally:
+                        submit_ready()
+
+                    if hourly_forecasts is None:
+                        continue  # Failed or skipped by an open breaker, recorded in provider_health
+
+                    yield location, fetch_function, hourly_forecasts
+        finally:
+            # Consumer stopped early: drop the jobs that have not started yet
+            for future in running:
+                future.cancel()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "BatchForecastFetcher":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+def fetch_forecasts_for_locations(locations: Iterable[Location],
+                                  fetch_functions: list[FetchFunction],
+                                  max_workers: int = 16,
+                                  provider_concurrency: Optional[dict[FetchFunction, int]] = None
+                                  ) -> Iterator[tuple[Location, ForecastResult]]:
+    with BatchForecastFetcher(max_workers, provider_concurrency) as fetcher:
+        for location, _, hourly_forecasts in fetcher.fetch(locations, fetch_functions):
+            yield location, hourly_forecasts
+
+
+async def fetch_provider_forecasts_async(latitude: float,
+                                         longitude: float,
+                                         fetch_function: AsyncFetchFunction
+                                         ) -> Optional[ForecastResult]:
+    health: ProviderHealth = provider_health.get(get_provider_name(fetch_function))
+
+    if not health.allow_request():
+        return None
+
+    start: float = time.perf_counter()
+
+    try:
+        with metrics.timer("fetch", provider=health.name, location=f"{latitude},{longitude}"):
+            result: ForecastResult = await fetch_function(latitude, longitude)
+    except FetchErrors as e:
+        health.record_failure(get_error_category(e), e)
+        return None
+    except Exception as e:
+        health.record_failure("other", e)
+        raise
+    except BaseException:
+        health.abort_trial()  # Cancelled or interrupted, so a half-open breaker would otherwise never retry
+        raise
+
+    health.record_success(time.perf_counter() - start)
+    metrics.increment("fetched_rows", len(result), provider=health.name)
+
+    return result
+
+
+async def fetch_forecasts_async(latitude: float,
+                                longitude: float,
+                                fetch_functions: list[AsyncFetchFunction]
+                                ) -> list[WeatherForecast]:
+    all_forecasts: list[WeatherForecast] = []
+
+    results: list[Optional[ForecastResult]] = await asyncio.gather(
+        *(fetch_provider_forecasts_async(latitude, longitude, fetch_function) for fetch_function in fetch_functions))
+
+    for result in results:
+        if result is not None:
+            all_forecasts.extend(_as_models(result))
+
+    return all_forecasts
+
+
+async def fetch_forecasts_for_locations_async(locations: Iterable[Location],
+                                              fetch_functions: list[AsyncFetchFunction],
+                                              provider_concurrency: Optional[dict[AsyncFetchFunction, int]] = None,
+                                              default_provider_concurrency: int = 16
+                                              ) -> AsyncIterator[tuple[Location, ForecastResult]]:
+    provider_concurrency = provider_concurrency or {}
+    semaphores: dict[AsyncFetchFunction, asyncio.Semaphore] = {
+        fetch_function: asyncio.Semaphore(provider_concurrency.get(fetch_function, default_provider_concurrency))
+        for fetch_function in fetch_functions
+    }
+
+    async def run(location: Location,
+                  fetch_function: AsyncFetchFunction
+                  ) -> tuple[Location, Optional[ForecastResult]]:
+        async with semaphores[fetch_function]:
+            return location, await fetch_provider_forecasts_async(location.latitude, location.longitude,
+                                                                  fetch_function)
+
+    tasks: list[asyncio.Task] = [
+        asyncio.create_task(run(location, fetch_function))
+        for location in locations for fetch_function in fetch_functions
+    ]
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            location, hourly_forecasts = await task
+
+            if hourly_forecasts is None:
+                continue
+
+            yield location, hourly_forecasts
+    finally:
+        for task in tasks:
+            task.cancel()
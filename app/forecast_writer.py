@@ -0,0 +1,262 @@
+import os
+import time
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Optional, Union
+
+import pandas as pd
+
+from app.instrumentation import metrics
+from app.model import WeatherForecast, ForecastBatch
+from app.storage import convert_forecasts_into_dataframe, save_dataframe, repair_forecasts_file, rebuild_indexes, \
+    get_store_size
+
+Forecasts = Union[WeatherForecast, list[WeatherForecast], ForecastBatch, list[ForecastBatch]]
+
+
+def get_segment_directory(file_path: str) -> Path:
+    path: Path = Path(file_path)
+
+    return path.with_name(path.name + ".wal")
+
+
+class ForecastWriter:
+    def __init__(self,
+                 file_path: str,
+                 max_rows: int = 50_000,
+                 max_delay: float = 5.0,
+                 deduplicate: bool = True,
+                 retry_delay: float = 30.0
+                 ) -> None:
+        self.file_path: str = file_path
+        self.max_rows: int = max_rows
+        self.max_delay: float = max_delay
+        self.deduplicate: bool = deduplicate
+        self.retry_delay: float = retry_delay
+        self.segment_directory: Path = get_segment_directory(file_path)
+
+        self._condition: Condition = Condition()
+        self._buffer: list[Forecasts] = []
+        self._buffered_rows: int = 0
+        self._oldest: Optional[float] = None
+        self._submitted: int = 0
+        self._written: int = 0
+        self._flush_requested: bool = False
+        self._closed: bool = False
+        self._unsaved_dataframes: list[pd.DataFrame] = []  # Converted rows whose segment could not be written
+        self._unsaved_segments: list[tuple[Path, pd.DataFrame]] = []  # Segments not yet saved into the store
+        self._indexes_stale: bool = False  # A failed save changed the store, so it is repaired before the next one
+        self._next_retry: float = 0.0
+
+        self.recover()
+
+        self._thread: Thread = Thread(target=self._run, name="forecast-writer", daemon=True)
+        self._thread.start()
+
+    def recover(self) -> int:
+        # Complete segments were never confirmed as written, so they are replayed; deduplication makes that idempotent
+        repaired_bytes: int = repair_forecasts_file(self.file_path)
+        segments: list[Path] = sorted(self.segment_directory.glob("*.csv")) if self.segment_directory.exists() else []
+
+        for temporary_path in self.segment_directory.glob("*.tmp") if self.segment_directory.exists() else []:
+            temporary_path.unlink()
+
+        if repaired_bytes > 0:
+            print(f"Removed {repaired_bytes} bytes of a partial write from {self.file_path}")
+
+        if repaired_bytes == 0 and len(segments) == 0:
+            return 0
+
+        # A crash between writing rows and recording their keys leaves the index behind the store
+        if Path(self.file_path).exists():
+            rebuild_indexes(self.file_path)
+
+        replayed_rows: int = 0
+        for segment_path in segments:
+            replayed_rows += save_dataframe(_read_segment(segment_path), self.file_path, self.deduplicate)
+            segment_path.unlink()
+
+        print(f"Replayed {len(segments)} write-ahead segments ({replayed_rows} new rows) into {self.file_path}")
+
+        return replayed_rows
+
+    def submit(self, forecasts: Forecasts) -> None:
+        rows: int = len(forecasts) if isinstance(forecasts, (list, ForecastBatch)) else 1
+
+        if rows == 0:
+            return
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot submit forecasts to a closed writer")
+            if not self._thread.is_alive():
+                raise RuntimeError("The writer thread has stopped, forecasts would not be written")
+
+            self._buffer.append(forecasts)
+            self._buffered_rows += rows
+            self._submitted += 1
+
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._condition.notify_all()
+
+            if self._buffered_rows >= self.max_rows:
+                self._condition.notify_all()
+
+    def flush(self) -> None:
+        # Returns once everything submitted before the call went through one write attempt
+        with self._condition:
+            target: int = self._submitted
+            self._flush_requested = True
+            self._condition.notify_all()
+
+            while self._written < target and self._thread.is_alive():
+                self._condition.wait()
+
+            if self._written < target:
+                raise RuntimeError("The writer thread has stopped before the forecasts were written")
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        self._thread.join()
+
+    def __enter__(self) -> "ForecastWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _is_due(self) -> bool:
+        if (self._unsaved_dataframes or self._unsaved_segments) and time.monotonic() >= self._next_retry:
+            return True
+
+        if not self._buffer:
+            return False
+
+        return (self._flush_requested or self._buffered_rows >= self.max_rows or
+                time.monotonic() - self._oldest >= self.max_delay)
+
+    def _get_wait_time(self) -> Optional[float]:
+        deadlines: list[float] = []
+
+        if self._oldest is not None:
+            deadlines.append(self._oldest + self.max_delay)
+        if self._unsaved_dataframes or self._unsaved_segments:
+            deadlines.append(self._next_retry)
+
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and not self._is_due():
+                    self._condition.wait(self._get_wait_time())
+
+                buffer: list[Forecasts] = self._buffer
+                self._buffer, self._buffered_rows, self._oldest, self._flush_requested = [], 0, None, False
+                closed: bool = self._closed
+
+            try:
+                with metrics.profiler.section():
+                    self._write(buffer, closed)
+            except Exception as e:
+                # Unsaved rows stay queued for the next retry, and the thread keeps taking new ones
+                print(f"Unexpected error in the writer for {self.file_path}: {e!r}")
+                self._next_retry = time.monotonic() + self.retry_delay
+            finally:
+                with self._condition:
+                    self._written += len(buffer)
+                    self._condition.notify_all()
+
+            if closed:
+                self._report_unsaved()
+                return
+
+    def _write(self, buffer: list[Forecasts], final: bool = False) -> None:
+        retry: str = "" if final else f" for a retry in {self.retry_delay:g} s"
+
+        if buffer:
+            try:
+                self._unsaved_dataframes.append(pd.concat([
+                    convert_forecasts_into_dataframe(forecasts if isinstance(forecasts, list) else [forecasts])
+                    for forecasts in buffer
+                ], ignore_index=True))
+            except Exception as e:
+                print(f"Dropped {len(buffer)} forecast results that could not be converted: {e}")
+
+        # Rows reach a segment before the store, so from then on they survive a crash
+        while self._unsaved_dataframes:
+            dataframe: pd.DataFrame = self._unsaved_dataframes[0]
+
+            try:
+                self._unsaved_segments.append((self._write_segment(dataframe), dataframe))
+            except Exception as e:
+                print(f"Cannot write a write-ahead segment, {len(dataframe)} rows kept in memory{retry}: {e}")
+                break
+
+            self._unsaved_dataframes.pop(0)
+
+        while self._unsaved_segments:
+            segment_path, dataframe = self._unsaved_segments[0]
+
+            store_size: Optional[int] = self._get_store_size()
+
+            try:
+                if self._indexes_stale:
+                    # The failed save may have left a partial line or rows whose keys are not in the index
+                    repair_forecasts_file(self.file_path)
+                    if Path(self.file_path).exists():
+                        rebuild_indexes(self.file_path)
+
+                    self._indexes_stale = False
+
+                save_dataframe(dataframe, self.file_path, self.deduplicate)
+            except Exception as e:
+                # A save that failed before writing anything leaves the store as it was, and needs no rebuild
+                if self._indexes_stale or store_size is None or self._get_store_size() != store_size:
+                    self._indexes_stale = True
+
+                print(f"Cannot save {len(dataframe)} rows into {self.file_path}, kept in {segment_path}{retry}: {e}")
+                break
+
+            segment_path.unlink(missing_ok=True)
+            self._unsaved_segments.pop(0)
+
+        if self._unsaved_dataframes or self._unsaved_segments:
+            self._next_retry = time.monotonic() + self.retry_delay
+
+    def _get_store_size(self) -> Optional[int]:
+        try:
+            return get_store_size(self.file_path)
+        except OSError:
+            return None
+
+    def _report_unsaved(self) -> None:
+        lost_rows: int = sum(len(dataframe) for dataframe in self._unsaved_dataframes)
+
+        if lost_rows > 0:
+            print(f"Lost {lost_rows} rows that could not be written to a segment or to {self.file_path}")
+        if self._unsaved_segments:
+            print(f"{len(self._unsaved_segments)} segments could not be saved into {self.file_path}, "
+                  f"they are replayed on the next start")
+
+    def _write_segment(self, dataframe: pd.DataFrame) -> Path:
+        self.segment_directory.mkdir(parents=True, exist_ok=True)
+        segment_path: Path = self.segment_directory / f"{time.time_ns():020d}.csv"
+        temporary_path: Path = segment_path.with_suffix(".tmp")
+
+        with open(temporary_path, "w", newline="") as file:
+            dataframe.to_csv(file, index=False)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, segment_path)
+
+        return segment_path
+
+
+def _read_segment(segment_path: Path) -> pd.DataFrame:
+    return pd.read_csv(segment_path, parse_dates=["request_datetime", "forecast_datetime"])
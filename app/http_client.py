@@ -0,0 +1,190 @@
+import random
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from app.instrumentation import metrics
+from app.response_cache import ResponseCache, CacheKey, CachedFetch, CacheEntry
+
+RETRY_STATUS_CODES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+
+class HttpClient:
+    def __init__(self,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 15.0,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 10.0,
+                 pool_size: int = 16,
+                 latency_window: int = 1000,
+                 response_cache: Optional[ResponseCache] = None
+                 ) -> None:
+        self.connect_timeout: float = connect_timeout
+        self.read_timeout: float = read_timeout
+        self.max_retries: int = max_retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.pool_size: int = pool_size
+        self.latency_window: int = latency_window
+        self.response_cache: Optional[ResponseCache] = response_cache
+
+        self._sessions: dict[str, requests.Session] = {}
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock: Lock = Lock()
+
+    def get_session(self, host: str) -> requests.Session:
+        with self._lock:
+            session: Optional[requests.Session] = self._sessions.get(host)
+
+            if session is None:
+                # Retries are handled in get(), so the adapter itself never retries
+                adapter: HTTPAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                self._sessions[host] = session
+                self._latencies[host] = deque(maxlen=self.latency_window)
+
+        return session
+
+    def get(self,
+            url: str,
+            params: Optional[dict[str, Any]] = None,
+            headers: Optional[dict[str, str]] = None
+            ) -> Response:
+        host: str = urlsplit(url).netloc
+        session: requests.Session = self.get_session(host)
+
+        attempt: int = 0
+
+        while True:
+            start: float = time.perf_counter()
+
+            try:
+                response: Response = session.get(url, params=params, headers=headers,
+                                                 timeout=(self.connect_timeout, self.read_timeout))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+
+                metrics.increment("http_retries", host=host, status=type(e).__name__)
+                time.sleep(self.get_backoff_delay(attempt))
+                attempt += 1
+                continue
+            finally:
+                # Failed attempts are recorded too, so stuck connections show in the percentiles and the hedge delay
+                self.record_latency(host, time.perf_counter() - start)
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+
+            delay: float = self.get_backoff_delay(attempt, response.headers.get("Retry-After"))
+            response.close()
+
+            metrics.increment("http_retries", host=host, status=response.status_code)
+            time.sleep(delay)
+            attempt += 1
+
+    def get_cached(self,
+                   url: str,
+                   params: Optional[dict[str, Any]] = None,
+                   headers: Optional[dict[str, str]] = None,
+                   cache_key: Optional[CacheKey] = None
+                   ) -> CachedFetch:
+        cache: Optional[ResponseCache] = self.response_cache
+        cached: Optional[tuple[CacheEntry, bytes]] = None
+        request_headers: dict[str, str] = dict(headers or {})
+
+        if cache is not None and cache_key is not None:
+            cached = cache.get(cache_key)
+
+            if cached is not None:
+                entry, body = cached
+
+                if entry.is_fresh():
+                    metrics.increment("response_cache", result="fresh")
+                    return CachedFetch(body, modified=False)
+
+                request_headers.update(entry.get_conditional_headers())
+
+        response: Response = self.get(url, params=params, headers=request_headers)
+
+        if response.status_code == 304 and cached is not None:
+            cache.refresh(cache_key, response.headers)
+            metrics.increment("response_cache", result="not_modified")
+            return CachedFetch(cached[1], modified=False)
+
+        response.raise_for_status()
+
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, response.content, response.headers)
+
+        metrics.increment("response_cache", result="downloaded")
+        return CachedFetch(response.content, modified=True)
+
+    def get_backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        # Full jitter, so retries from many workers do not arrive at the same moment
+        delay: float = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+
+        return delay
+
+    def record_latency(self, host: str, seconds: float) -> None:
+        metrics.observe("http_request", seconds, host=host)
+
+        with self._lock:
+            self._latencies.setdefault(host, deque(maxlen=self.latency_window)).append(seconds)
+
+    def get_latency_percentile(self, host: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies: list[float] = list(self._latencies.get(host, ()))
+
+        if len(latencies) == 0:
+            return None
+
+        return float(np.percentile(latencies, percentile))
+
+    def get_latency_stats(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            hosts: list[str] = list(self._latencies)
+
+        stats: dict[str, dict[str, float]] = {}
+
+        for host in hosts:
+            with self._lock:
+                latencies: list[float] = list(self._latencies[host])
+
+            if len(latencies) == 0:
+                continue
+
+            stats[host] = {
+                "count": len(latencies),
+                "p50": float(np.percentile(latencies, 50)),
+                "p90": float(np.percentile(latencies, 90)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": max(latencies)
+            }
+
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
+
+http_client: HttpClient = HttpClient()
@@ -0,0 +1,280 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Callable, ContextManager, Optional
+
+from app.provider_health import provider_health
+
+Labels = tuple[tuple[str, str], ...]
+
+_DISABLED: ContextManager = nullcontext()  # Shared by every call while instrumentation is off
+
+_BREAKER_STATES: dict[str, int] = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _get_labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    escaped: list[str] = [
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    ]
+
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str, labels: Labels) -> None:
+        self.metrics: Metrics = metrics
+        self.stage: str = stage
+        self.labels: Labels = labels
+        self.start: float = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.metrics.record_time(self.stage, time.perf_counter() - self.start, self.labels)
+
+
+class CycleProfiler:
+    # cProfile only sees the thread it is enabled in, so every worker profiles its own sections and they are merged
+    def __init__(self) -> None:
+        self.active: bool = False
+
+        self._profiles: list[cProfile.Profile] = []
+        self._lock: Lock = Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            self._profiles = []
+            self.active = True
+
+    def section(self) -> ContextManager:
+        if not self.active:
+            return _DISABLED
+
+        return _ProfiledSection(self)
+
+    def add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stop(self, file_path: str) -> int:
+        with self._lock:
+            self.active = False
+            profiles: list[cProfile.Profile] = self._profiles
+            self._profiles = []
+
+        if len(profiles) == 0:
+            return 0
+
+        stats: pstats.Stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(file_path)
+
+        return len(profiles)
+
+
+class _ProfiledSection:
+    __slots__ = ("profiler", "profile")
+
+    def __init__(self, profiler: CycleProfiler) -> None:
+        self.profiler: CycleProfiler = profiler
+        self.profile: Optional[cProfile.Profile] = None
+
+    def __enter__(self) -> "_ProfiledSection":
+        profile: cProfile.Profile = cProfile.Profile()
+
+        try:
+            profile.enable()
+        except ValueError:
+            return self  # Another profiler is already running in this thread
+
+        self.profile = profile
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+            self.profiler.add(self.profile)
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled: bool = enabled
+        self.profiler: CycleProfiler = CycleProfiler()
+
+        self._timers: dict[tuple[str, Labels], list[float]] = {}  # (stage, labels) -> [count, total, max]
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._lock: Lock = Lock()
+
+    def timer(self, stage: str, **labels: Any) -> ContextManager:
+        if not self.enabled:
+            return _DISABLED
+
+        return _Timer(self, stage, _get_labels(labels))
+
+    def timed(self, stage: str, **labels: Any) -> Callable[[Callable], Callable]:
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+
+                with _Timer(self, stage, _get_labels(labels)):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, stage: str, seconds: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+
+        self.record_time(stage, seconds, _get_labels(labels))
+
+    def record_time(self, stage: str, seconds: float, labels: Labels = ()) -> None:
+        key: tuple[str, Labels] = (stage, labels)
+
+        with self._lock:
+            timer: Optional[list[float]] = self._timers.get(key)
+
+            if timer is None:
+                self._timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+
+        key: tuple[str, Labels] = (name, _get_labels(labels))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def get_summary(self) -> dict[str, Any]:
+        with self._lock:
+            timers: list[tuple[tuple[str, Labels], list[float]]] = [(key, list(value))
+                                                                    for key, value in self._timers.items()]
+            counters: list[tuple[tuple[str, Labels], float]] = list(self._counters.items())
+
+        return {
+            "stages": [
+                {"stage": stage, **dict(labels), "count": int(count), "total_seconds": total,
+                 "mean_seconds": total / count, "max_seconds": maximum}
+                for (stage, labels), (count, total, maximum) in sorted(timers, key=lambda item: -item[1][1])
+            ],
+            "counters": [
+                {"name": name, **dict(labels), "value": value} for (name, labels), value in sorted(counters)
+            ],
+            "providers": provider_health.get_metrics()
+        }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            timers: list[tuple[tuple[str, Labels], list[float]]] = sorted((key, list(value))
+                                                                          for key, value in self._timers.items())
+            counters: list[tuple[tuple[str, Labels], float]] = sorted(self._counters.items())
+
+        lines: list[str] = [
+            "# HELP forecast_stage_seconds Time spent in each stage of fetching, parsing, storing and analysing",
+            "# TYPE forecast_stage_seconds summary"
+        ]
+
+        for (stage, labels), (count, total, _) in timers:
+            stage_labels: str = _format_labels((("stage", stage),) + labels)
+            lines.append(f"forecast_stage_seconds_sum{stage_labels} {total}")
+            lines.append(f"forecast_stage_seconds_count{stage_labels} {int(count)}")
+
+        lines += ["# HELP forecast_stage_seconds_max Longest single run of each stage",
+                  "# TYPE forecast_stage_seconds_max gauge"]
+        for (stage, labels), (_, _, maximum) in timers:
+            lines.append(f"forecast_stage_seconds_max{_format_labels((('stage', stage),) + labels)} {maximum}")
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines += [f"# TYPE forecast_{name}_total counter"]
+            lines += [f"forecast_{name}_total{_format_labels(labels)} {value}"
+                      for (counter_name, labels), value in counters if counter_name == name]
+
+        providers: list[tuple[str, dict[str, Any]]] = sorted(provider_health.get_metrics().items())
+
+        if providers:
+            lines += ["# HELP forecast_provider_breaker_state 0 closed, 1 half open, 2 open",
+                      "# TYPE forecast_provider_breaker_state gauge"]
+            lines += [f"forecast_provider_breaker_state{_format_labels((('provider', provider),))} "
+                      f"{_BREAKER_STATES[health['state']]}" for provider, health in providers]
+
+            for name, label, field in (("events", "event", "counters"), ("errors", "category", "errors")):
+                lines += [f"# TYPE forecast_provider_{name}_total counter"]
+                lines += [f"forecast_provider_{name}_total{_format_labels(((label, key), ('provider', provider)))} "
+                          f"{value}"
+                          for provider, health in providers for key, value in sorted(health[field].items())]
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: str) -> None:
+        # Written aside and renamed, so a scraper reading the file never sees half of it
+        path: Path = Path(file_path)
+        temporary_path: Path = path.with_name(path.name + ".tmp")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path.write_text(self.to_prometheus())
+        os.replace(temporary_path, path)
+
+    def print_summary(self) -> None:
+        print(json.dumps(self.get_summary(), indent=1))
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        metrics: Metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body: bytes = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_) -> None:
+                pass
+
+        server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), MetricsHandler)
+        Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+
+        return server
+
+    def clear(self) -> None:
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+
+metrics: Metrics = Metrics()
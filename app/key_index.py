@@ -0,0 +1,139 @@
+import os
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.columnar_storage import is_columnar_store
+
+KEY_COLUMNS: list[str] = ["source", "latitude", "longitude", "request_datetime", "forecast_datetime"]
+
+
+def compute_forecast_keys(dataframe: pd.DataFrame, request_resolution: str = "h") -> np.ndarray:
+    # Requests within one resolution period (an hour by default) count as the same request
+    key_dataframe: pd.DataFrame = pd.DataFrame({
+        "source": dataframe["source"].astype(str).to_numpy(dtype=object),
+        "latitude": dataframe["latitude"].to_numpy(dtype=np.float64).round(6),
+        "longitude": dataframe["longitude"].to_numpy(dtype=np.float64).round(6),
+        "request_datetime": pd.to_datetime(dataframe["request_datetime"]).dt.floor(request_resolution).to_numpy(
+            dtype="datetime64[ns]"),
+        "forecast_datetime": pd.to_datetime(dataframe["forecast_datetime"]).to_numpy(dtype="datetime64[ns]")
+    })
+
+    return pd.util.hash_pandas_object(key_dataframe, index=False).to_numpy().view(np.int64)
+
+
+class ForecastKeyIndex:
+    def __init__(self, path: str, request_resolution: str = "h") -> None:
+        self.path: Path = Path(path)
+        self.request_resolution: str = request_resolution
+        self.lock: RLock = RLock()
+
+        self._keys: set[int] = set()
+        self._read_bytes: int = 0  # Length of the key file already read into _keys
+
+        self._read_appended_keys()
+
+    def _read_appended_keys(self) -> None:
+        # Other processes (a collector next to a cron job) append to the same file, so their keys are picked up
+        # before filtering and appending
+        if not self.path.exists():
+            return
+
+        size: int = self.path.stat().st_size
+        size -= size % 8  # A torn trailing key from an interrupted append is ignored
+
+        if size < self._read_bytes:  # Rebuilt by another process
+            self._keys = set()
+            self._read_bytes = 0
+
+        if size > self._read_bytes:
+            with open(self.path, "rb") as file:
+                file.seek(self._read_bytes)
+                keys: np.ndarray = np.fromfile(file, dtype=np.int64, count=(size - self._read_bytes) // 8)
+
+            self._keys.update(keys.tolist())
+            self._read_bytes = size
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._keys
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def compute_keys(self, dataframe: pd.DataFrame) -> np.ndarray:
+        return compute_forecast_keys(dataframe, self.request_resolution)
+
+    def filter_new(self, dataframe: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+        if len(dataframe) == 0:
+            return dataframe, np.empty(0, dtype=np.int64)
+
+        keys: np.ndarray = self.compute_keys(dataframe)
+
+        with self.lock:
+            self._read_appended_keys()
+            is_new: np.ndarray = np.fromiter((key not in self._keys for key in keys.tolist()), dtype=bool,
+                                             count=len(keys))
+
+        # Duplicates inside the new rows are dropped as well
+        is_new &= ~pd.Series(keys).duplicated().to_numpy()
+
+        return dataframe[is_new], keys[is_new]
+
+    def add(self, keys: np.ndarray) -> None:
+        if len(keys) == 0:
+            return
+
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(self.path, "ab") as file:
+                # Only a torn trailing key is dropped; the rest of the file may hold keys of other processes
+                size: int = file.seek(0, os.SEEK_END)
+                file.truncate(size - size % 8)
+                file.write(np.ascontiguousarray(keys, dtype=np.int64).tobytes())
+
+            self._keys.update(keys.tolist())
+
+    def rebuild(self, keys: np.ndarray) -> None:
+        with self.lock:
+            unique_keys: np.ndarray = np.unique(keys.astype(np.int64))
+            temporary_path: Path = self.path.with_name(self.path.name + ".tmp")
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            unique_keys.tofile(temporary_path)
+            temporary_path.replace(self.path)
+
+            self._keys = set(unique_keys.tolist())
+            self._read_bytes = unique_keys.nbytes
+
+
+_key_indexes: dict[str, ForecastKeyIndex] = {}
+_key_indexes_lock: RLock = RLock()
+
+
+def get_key_index_path(file_path: str) -> Path:
+    path: Path = Path(file_path)
+
+    if not is_columnar_store(file_path):
+        return path.with_name(path.name + ".keys")
+
+    return path / "_keys.bin"
+
+
+def get_key_index(file_path: str) -> ForecastKeyIndex:
+    # One index per store and process, so saves never re-read the key file
+    with _key_indexes_lock:
+        key: str = str(Path(file_path).resolve())
+        index: Optional[ForecastKeyIndex] = _key_indexes.get(key)
+
+        if index is None:
+            index = ForecastKeyIndex(str(get_key_index_path(file_path)))
+            _key_indexes[key] = index
+
+        return index
@@ -1,9 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
+import numpy as np
+import pandas as pd
 
-@dataclass
+
+@dataclass(slots=True)
 class WeatherForecast:
     source: str  # Data source name
     request_datetime: datetime  # Date and time of a request (UTC)
@@ -25,3 +28,115 @@ class WeatherForecast:
     uv_index: Optional[float] = None  # UV Index (index)
     dew_point: Optional[float] = None  # Dew point (Celsius)
     visibility: Optional[float] = None  # Visibility (meters)
+
+
+FORECAST_FIELDS: list[str] = [model_field.name for model_field in fields(WeatherForecast)]
+FEATURE_FIELDS: list[str] = FORECAST_FIELDS[5:]
+
+CIRCULAR_MEAN: str = "circular_mean"  # Aggregation name for angles (degrees), computed from sin/cos means
+
+
+def get_group_by_aggregator() -> dict[str, Any]:
+    return {
+        "temperature": "mean",
+        "wind_speed": "mean",
+        "wind_direction": CIRCULAR_MEAN,
+        "precipitation": "mean",
+        "humidity": "mean",
+        "cloud_cover": "mean",
+        "air_pressure": "mean",
+        "uv_index": "mean",
+        "dew_point": "mean",
+        "visibility": "mean",
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class Location:
+    latitude: float  # Latitude of the location
+    longitude: float  # Longitude of the location
+
+
+@dataclass(slots=True)
+class ForecastBatch:
+    source: str  # Data source name
+    request_datetime: datetime  # Date and time of a request (UTC)
+
+    latitude: float  # Latitude of the location
+    longitude: float  # Longitude of the location
+
+    forecast_datetimes: np.ndarray  # Dates and times of forecasts (UTC, datetime64[ns])
+    features: dict[str, np.ndarray] = field(default_factory=dict)  # Feature columns (float64, NaN when missing)
+
+    def __len__(self) -> int:
+        return len(self.forecast_datetimes)
+
+    def get_feature(self, name: str) -> np.ndarray:
+        values: Optional[np.ndarray] = self.features.get(name)
+
+        if values is None:
+            return np.full(len(self), np.nan)
+
+        return values
+
+    @classmethod
+    def empty(cls, source: str, request_datetime: datetime, latitude: float, longitude: float) -> "ForecastBatch":
+        return cls(source, request_datetime, latitude, longitude, np.empty(0, dtype="datetime64[ns]"))
+
+    @classmethod
+    def from_models(cls, forecasts: list[WeatherForecast]) -> "ForecastBatch":
+        if len(forecasts) == 0:
+            raise ValueError("Cannot build a forecast batch from an empty list")
+
+        first: WeatherForecast = forecasts[0]
+        for forecast in forecasts:
+            if (forecast.source, forecast.request_datetime, forecast.latitude, forecast.longitude) != \
+                    (first.source, first.request_datetime, first.latitude, first.longitude):
+                raise ValueError("Forecasts in a batch must come from a single provider response")
+
+        features: dict[str, np.ndarray] = {
+            name: np.array([getattr(forecast, name) for forecast in forecasts], dtype=np.float64)
+            for name in FEATURE_FIELDS
+        }
+
+        return cls(
+            source=first.source,
+            request_datetime=first.request_datetime,
+            latitude=first.latitude,
+            longitude=first.longitude,
+            forecast_datetimes=np.array([forecast.forecast_datetime for forecast in forecasts],
+                                        dtype="datetime64[ns]"),
+            features=features
+        )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        size: int = len(self)
+
+        columns: dict[str, np.ndarray] = {
+            "source": np.full(size, self.source, dtype=object),
+            "request_datetime": np.full(size, np.datetime64(self.request_datetime, "ns")),
+            "forecast_datetime": self.forecast_datetimes,
+            "latitude": np.full(size, self.latitude, dtype=np.float64),
+            "longitude": np.full(size, self.longitude, dtype=np.float64)
+        }
+        columns.update({name: self.get_feature(name) for name in FEATURE_FIELDS})
+
+        # Feature arrays are wrapped, not copied
+        return pd.DataFrame(columns, copy=False)
+
+    def to_models(self) -> list[WeatherForecast]:
+        forecast_datetimes: list[datetime] = list(pd.DatetimeIndex(self.forecast_datetimes).to_pydatetime())
+        feature_values: list[list[Optional[float]]] = []
+
+        for name in FEATURE_FIELDS:
+            values: np.ndarray = self.get_feature(name)
+            objects: np.ndarray = values.astype(object)
+            objects[np.isnan(values)] = None
+
+            feature_values.append(objects.tolist())
+
+        return [
+            WeatherForecast(self.source, self.request_datetime, forecast_datetime, self.latitude, self.longitude,
+                            *values)
+            for forecast_datetime, *values in zip(forecast_datetimes, *feature_values)
+        ]
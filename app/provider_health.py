@@ -0,0 +1,159 @@
+import time
+from collections import deque, Counter
+from threading import Lock
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+CLOSED: str = "closed"
+OPEN: str = "open"
+HALF_OPEN: str = "half_open"
+
+
+def get_provider_name(fetch_function: Callable) -> str:
+    # fetch_open_meteo_forecast_batch -> open_meteo
+    name: str = getattr(fetch_function, "__name__", str(fetch_function))
+    name = name.removeprefix("fetch_").removesuffix("_async").removesuffix("_batch").removesuffix("_forecast")
+
+    return name
+
+
+class ProviderHealth:
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 cooldown: float = 60.0,
+                 latency_window: int = 200,
+                 min_latency_samples: int = 20
+                 ) -> None:
+        self.name: str = name
+        self.failure_threshold: int = failure_threshold
+        self.cooldown: float = cooldown
+        self.min_latency_samples: int = min_latency_samples
+
+        self.state: str = CLOSED
+        self.consecutive_failures: int = 0
+        self.opened_at: Optional[float] = None
+        self.counters: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.last_error: Optional[str] = None
+
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self._trial_running: bool = False
+        self._lock: Lock = Lock()
+
+    def allow_request(self) -> bool:
+        # Open breakers skip the provider until the cool-down ends, then let a single trial request through
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    self.counters["skipped"] += 1
+                    return False
+
+                self.state = HALF_OPEN
+                self._trial_running = False
+
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    self.counters["skipped"] += 1
+                    return False
+
+                self._trial_running = True
+
+            self.counters["requests"] += 1
+            return True
+
+    def record_success(self, seconds: float) -> None:
+        with self._lock:
+            self.counters["successes"] += 1
+            self._latencies.append(seconds)
+            self.consecutive_failures = 0
+
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.opened_at = None
+                self.counters["breaker_closed"] += 1
+
+    def record_failure(self, category: str, error: Exception) -> None:
+        with self._lock:
+            self.counters["failures"] += 1
+            self.errors[category] += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.consecutive_failures += 1
+
+            if self.state == HALF_OPEN or (self.state == CLOSED and
+                                           self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+                self.counters["breaker_opened"] += 1
+
+    def abort_trial(self) -> None:
+        # A request cancelled before it had an outcome says nothing about the provider, but must free the trial slot
+        with self._lock:
+            self.counters["aborted"] += 1
+            self._trial_running = False
+
+    def record_hedge(self, won: bool) -> None:
+        with self._lock:
+            self.counters["hedged"] += 1
+            if won:
+                self.counters["hedge_wins"] += 1
+
+    def get_latency_percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies: list[float] = list(self._latencies)
+
+        # Too few samples give a meaningless percentile, so hedging waits for enough history
+        if len(latencies) < self.min_latency_samples:
+            return None
+
+        return float(np.percentile(latencies, percentile))
+
+    def get_metrics(self) -> dict[str, Any]:
+        with self._lock:
+            latencies: list[float] = list(self._latencies)
+
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "seconds_until_retry": (max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+                                        if self.state == OPEN else 0.0),
+                "counters": dict(self.counters),
+                "errors": dict(self.errors),
+                "last_error": self.last_error,
+                "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+                "latency_p90": float(np.percentile(latencies, 90)) if latencies else None
+            }
+
+
+class ProviderHealthRegistry:
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0) -> None:
+        self.failure_threshold: int = failure_threshold
+        self.cooldown: float = cooldown
+
+        self._providers: dict[str, ProviderHealth] = {}
+        self._lock: Lock = Lock()
+
+    def get(self, provider: str) -> ProviderHealth:
+        with self._lock:
+            health: Optional[ProviderHealth] = self._providers.get(provider)
+
+            if health is None:
+                health = ProviderHealth(provider, self.failure_threshold, self.cooldown)
+                self._providers[provider] = health
+
+            return health
+
+    def get_metrics(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            providers: list[ProviderHealth] = list(self._providers.values())
+
+        return {health.name: health.get_metrics() for health in providers}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._providers.clear()
+
+
+provider_health: ProviderHealthRegistry = ProviderHealthRegistry()
@@ -0,0 +1,211 @@
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Mapping, Optional
+
+from requests.exceptions import JSONDecodeError
+
+CacheKey = tuple[str, float, float]  # (provider, latitude, longitude)
+
+
+@dataclass
+class CachedFetch:
+    body: bytes
+    modified: bool  # False when the body was served from the cache or revalidated with 304
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body)
+        except json.JSONDecodeError as e:
+            # Raised as requests' own error, like Response.json(), so it is handled as a failed fetch
+            raise JSONDecodeError(e.msg, e.doc, e.pos) from e
+
+
+@dataclass
+class CacheEntry:
+    name: str  # File name stem of the entry
+    size: int  # Body size (bytes)
+    stored_at: float  # Time of the last full download (unix seconds)
+    expires_at: float  # Time after which the entry must be revalidated (unix seconds)
+    accessed_at: float  # Time of the last read (unix seconds)
+    last_modified: Optional[str] = None  # Last-Modified validator
+    etag: Optional[str] = None  # ETag validator
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def get_conditional_headers(self) -> dict[str, str]:
+        headers: dict[str, str] = {}
+
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+
+        return headers
+
+
+class ResponseCache:
+    def __init__(self,
+                 directory: str,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 max_age: float = 24 * 3600,
+                 default_ttls: Optional[dict[str, float]] = None,
+                 default_ttl: float = 3600
+                 ) -> None:
+        self.directory: Path = Path(directory)
+        self.max_bytes: int = max_bytes
+        self.max_age: float = max_age
+        self.default_ttls: dict[str, float] = default_ttls or {}
+        self.default_ttl: float = default_ttl
+
+        self._entries: dict[str, CacheEntry] = {}
+        self._total_bytes: int = 0
+        self._lock: Lock = Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        for meta_path in self.directory.glob("*.meta.json"):
+            try:
+                entry: CacheEntry = CacheEntry(**json.loads(meta_path.read_text()))
+            except (ValueError, TypeError):
+                meta_path.unlink(missing_ok=True)
+                continue
+
+            if self._get_body_path(entry.name).exists():
+                self._entries[entry.name] = entry
+                self._total_bytes += entry.size
+
+        self._evict(time.time())
+
+    def get_entry_name(self, key: CacheKey) -> str:
+        # Exact coordinates as sent in the request: rounding would let nearby sites share a body, and the second
+        # site would then see an unmodified response and never store its own forecasts
+        provider, latitude, longitude = key
+
+        return f"{provider}_{latitude!r}_{longitude!r}"
+
+    def _get_body_path(self, name: str) -> Path:
+        return self.directory / f"{name}.body"
+
+    def _get_meta_path(self, name: str) -> Path:
+        return self.directory / f"{name}.meta.json"
+
+    def get(self, key: CacheKey) -> Optional[tuple[CacheEntry, bytes]]:
+        name: str = self.get_entry_name(key)
+        now: float = time.time()
+
+        with self._lock:
+            entry: Optional[CacheEntry] = self._entries.get(name)
+
+            if entry is None:
+                return None
+
+            if now - entry.stored_at > self.max_age:
+                self._remove(name)
+                return None
+
+            try:
+                body: bytes = self._get_body_path(name).read_bytes()
+            except OSError:
+                self._remove(name)
+                return None
+
+            entry.accessed_at = now
+
+        return entry, body
+
+    def put(self, key: CacheKey, body: bytes, headers: Mapping[str, str]) -> None:
+        name: str = self.get_entry_name(key)
+        now: float = time.time()
+
+        entry: CacheEntry = CacheEntry(
+            name=name,
+            size=len(body),
+            stored_at=now,
+            expires_at=self._get_expiry(key[0], headers, now),
+            accessed_at=now,
+            last_modified=headers.get("Last-Modified"),
+            etag=headers.get("ETag")
+        )
+
+        with self._lock:
+            self._remove(name)
+            self._write_atomically(self._get_body_path(name), body)
+            self._write_atomically(self._get_meta_path(name), json.dumps(asdict(entry)).encode())
+
+            self._entries[name] = entry
+            self._total_bytes += entry.size
+            self._evict(now)
+
+    def refresh(self, key: CacheKey, headers: Mapping[str, str]) -> None:
+        # A 304 response carries new freshness information but no body
+        name: str = self.get_entry_name(key)
+        now: float = time.time()
+
+        with self._lock:
+            entry: Optional[CacheEntry] = self._entries.get(name)
+
+            if entry is None:
+                return
+
+            entry.expires_at = self._get_expiry(key[0], headers, now)
+            entry.last_modified = headers.get("Last-Modified", entry.last_modified)
+            entry.etag = headers.get("ETag", entry.etag)
+
+            self._write_atomically(self._get_meta_path(name), json.dumps(asdict(entry)).encode())
+
+    def _get_expiry(self, provider: str, headers: Mapping[str, str], now: float) -> float:
+        max_age_match: Optional[re.Match] = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+        if max_age_match is not None:
+            return now + int(max_age_match.group(1))
+
+        expires: Optional[str] = headers.get("Expires")
+        if expires is not None:
+            try:
+                return parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                pass
+
+        return now + self.default_ttls.get(provider, self.default_ttl)
+
+    def _evict(self, now: float) -> None:
+        for name in [name for name, entry in self._entries.items() if now - entry.stored_at > self.max_age]:
+            self._remove(name)
+
+        # Least recently read entries go first
+        for name in sorted(self._entries, key=lambda name: self._entries[name].accessed_at):
+            if self._total_bytes <= self.max_bytes:
+                break
+
+            self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        entry: Optional[CacheEntry] = self._entries.pop(name, None)
+
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+        self._get_body_path(name).unlink(missing_ok=True)
+        self._get_meta_path(name).unlink(missing_ok=True)
+
+    @staticmethod
+    def _write_atomically(path: Path, data: bytes) -> None:
+        temporary_path: Path = path.with_name(path.name + ".tmp")
+        temporary_path.write_bytes(data)
+        os.replace(temporary_path, path)
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,259 @@
+import os
+from datetime import date
+from pathlib import Path
+from threading import RLock
+from typing import Any, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from app.columnar_storage import is_columnar_store
+from app.model import get_group_by_aggregator, CIRCULAR_MEAN
+from app.utils import mean_angle_from_components
+
+LOCATION_COLUMNS: list[str] = ["source", "latitude", "longitude", "request_date"]
+
+# Rollup name -> time column the rows are grouped by
+GRANULARITIES: dict[str, str] = {
+    "daily": "forecast_date",
+    "hourly": "forecast_hour"
+}
+
+
+def get_rollup_path(file_path: str, granularity: str) -> Path:
+    path: Path = Path(file_path)
+
+    if not is_columnar_store(file_path):
+        return path.with_name(f"{path.stem}.rollup_{granularity}.csv")
+
+    return path / f"_rollup_{granularity}.csv"
+
+
+def get_rollup_source_columns() -> list[str]:
+    # Stored columns a rollup is computed from
+    return ["source", "latitude", "longitude", "request_datetime", "forecast_datetime"] + \
+        list(get_group_by_aggregator())
+
+
+def _get_circular_features() -> list[str]:
+    return [feature for feature, function in get_group_by_aggregator().items() if function == CIRCULAR_MEAN]
+
+
+def _get_state_columns() -> list[str]:
+    columns: list[str] = []
+
+    for feature in get_group_by_aggregator():
+        if feature in _get_circular_features():
+            columns += [f"{feature}_sin_sum", f"{feature}_cos_sum"]
+        else:
+            columns.append(f"{feature}_sum")
+
+        columns.append(f"{feature}_count")
+
+    return columns
+
+
+def compute_rollup(dataframe: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    # Sums and counts are mergeable, so partial rollups of new rows are simply added to the stored ones
+    time_column: str = GRANULARITIES[granularity]
+    forecast_datetimes: pd.Series = pd.to_datetime(dataframe["forecast_datetime"])
+
+    state: dict[str, Any] = {
+        "source": dataframe["source"].to_numpy(),
+        "latitude": dataframe["latitude"].to_numpy(dtype=np.float64),
+        "longitude": dataframe["longitude"].to_numpy(dtype=np.float64),
+        "request_date": pd.to_datetime(dataframe["request_datetime"]).dt.floor("D").to_numpy(),
+        time_column: (forecast_datetimes.dt.floor("D") if granularity == "daily" else
+                      forecast_datetimes.dt.floor("h")).to_numpy()
+    }
+
+    circular_features: list[str] = _get_circular_features()
+
+    for feature in get_group_by_aggregator():
+        values: np.ndarray = pd.to_numeric(dataframe[feature], errors="coerce").to_numpy(dtype=np.float64)
+        present: np.ndarray = ~np.isnan(values)
+
+        if feature in circular_features:
+            radians: np.ndarray = np.deg2rad(values)
+            state[f"{feature}_sin_sum"] = np.where(present, np.sin(radians), 0.0)
+            state[f"{feature}_cos_sum"] = np.where(present, np.cos(radians), 0.0)
+        else:
+            state[f"{feature}_sum"] = np.where(present, values, 0.0)
+
+        state[f"{feature}_count"] = present.astype(np.int64)
+
+    state_dataframe: pd.DataFrame = pd.DataFrame(state)
+
+    return state_dataframe.groupby(LOCATION_COLUMNS + [time_column], as_index=False, sort=False).sum()
+
+
+def merge_rollups(rollups: list[pd.DataFrame], granularity: str) -> pd.DataFrame:
+    time_column: str = GRANULARITIES[granularity]
+    rollups = [rollup for rollup in rollups if len(rollup) > 0]
+
+    if len(rollups) == 0:
+        return pd.DataFrame(columns=LOCATION_COLUMNS + [time_column] + _get_state_columns())
+
+    return pd.concat(rollups, ignore_index=True).groupby(LOCATION_COLUMNS + [time_column], as_index=False).sum()
+
+
+def finalize_rollup(rollup: pd.DataFrame, group_by_columns: list[str]) -> pd.DataFrame:
+    # Merge the selected state rows per group, then turn sums and counts into means
+    grouped: pd.DataFrame = rollup.groupby(group_by_columns)[_get_state_columns()].sum()
+    circular_features: list[str] = _get_circular_features()
+
+    means: dict[str, np.ndarray] = {}
+
+    for feature in get_group_by_aggregator():
+        counts: np.ndarray = grouped[f"{feature}_count"].to_numpy(dtype=np.float64)
+        counts = np.where(counts > 0, counts, np.nan)
+
+        if feature in circular_features:
+            means[feature] = mean_angle_from_components(grouped[f"{feature}_sin_sum"].to_numpy() / counts,
+                                                        grouped[f"{feature}_cos_sum"].to_numpy() / counts)
+        else:
+            means[feature] = grouped[f"{feature}_sum"].to_numpy() / counts
+
+    return pd.DataFrame(means, index=grouped.index)
+
+
+class ForecastRollups:
+    def __init__(self, file_path: str) -> None:
+        self.file_path: str = file_path
+        self.lock: RLock = RLock()
+
+        self._tables: dict[str, Optional[pd.DataFrame]] = {granularity: None for granularity in GRANULARITIES}
+
+    def exists(self) -> bool:
+        return all(get_rollup_path(self.file_path, granularity).exists() for granularity in GRANULARITIES)
+
+    def get_table(self, granularity: str) -> pd.DataFrame:
+        with self.lock:
+            table: Optional[pd.DataFrame] = self._tables[granularity]
+
+            if table is None:
+                table = self._read_table(granularity)
+                self._tables[granularity] = table
+
+            return table
+
+    def _read_table(self, granularity: str) -> pd.DataFrame:
+        path: Path = get_rollup_path(self.file_path, granularity)
+        time_column: str = GRANULARITIES[granularity]
+
+        if not path.exists():
+            return merge_rollups([], granularity)
+
+        # Appended partial rows are merged on read; the file is rewritten once they outnumber merged rows
+        stored: pd.DataFrame = pd.read_csv(path, parse_dates=["request_date", time_column])
+        table: pd.DataFrame = merge_rollups([stored], granularity)
+
+        if len(table) < len(stored) // 2:
+            self._write_table(granularity, table)
+
+        return table
+
+    def _write_table(self, granularity: str, table: pd.DataFrame) -> None:
+        path: Path = get_rollup_path(self.file_path, granularity)
+        temporary_path: Path = path.with_name(path.name + ".tmp")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table.to_csv(temporary_path, index=False)
+        os.replace(temporary_path, path)
+
+    def update(self, dataframe: pd.DataFrame) -> None:
+        if len(dataframe) == 0:
+            return
+
+        with self.lock:
+            for granularity in GRANULARITIES:
+                partial: pd.DataFrame = compute_rollup(dataframe, granularity)
+                path: Path = get_rollup_path(self.file_path, granularity)
+
+                path.parent.mkdir(parents=True, exist_ok=True)
+                partial.to_csv(path, mode="a", header=not path.exists(), index=False)
+
+                if self._tables[granularity] is not None:
+                    self._tables[granularity] = merge_rollups([self._tables[granularity], partial], granularity)
+
+    def rebuild(self, dataframes: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> None:
+        # Chunks are merged as they arrive, so memory follows the size of the rollups, not of the history
+        if isinstance(dataframes, pd.DataFrame):
+            dataframes = [dataframes]
+
+        with self.lock:
+            tables: dict[str, pd.DataFrame] = {granularity: merge_rollups([], granularity)
+                                               for granularity in GRANULARITIES}
+
+            for dataframe in dataframes:
+                for granularity in GRANULARITIES:
+                    tables[granularity] = merge_rollups([tables[granularity], compute_rollup(dataframe, granularity)],
+                                                        granularity)
+
+            for granularity, table in tables.items():
+                self._write_table(granularity, table)
+                self._tables[granularity] = table
+
+    def _select(self,
+                granularity: str,
+                latitude: float,
+                longitude: float,
+                request_date_start: Optional[date],
+                request_date_end: Optional[date],
+                forecast_date_start: Optional[date] = None,
+                forecast_date_end: Optional[date] = None
+                ) -> pd.DataFrame:
+        table: pd.DataFrame = self.get_table(granularity)
+        time_column: str = GRANULARITIES[granularity]
+        mask: pd.Series = (table["latitude"] == latitude) & (table["longitude"] == longitude)
+
+        if request_date_start is not None:
+            mask &= table["request_date"] >= pd.Timestamp(request_date_start)
+        if request_date_end is not None:
+            mask &= table["request_date"] <= pd.Timestamp(request_date_end)
+        if forecast_date_start is not None:
+            mask &= table[time_column] >= pd.Timestamp(forecast_date_start)
+        if forecast_date_end is not None:
+            mask &= table[time_column] < pd.Timestamp(forecast_date_end) + pd.Timedelta(days=1)
+
+        return table[mask]
+
+    def group_by_forecast_date(self,
+                               latitude: float,
+                               longitude: float,
+                               request_date_start: Optional[date] = None,
+                               request_date_end: Optional[date] = None
+                               ) -> pd.DataFrame:
+        selected: pd.DataFrame = self._select("daily", latitude, longitude, request_date_start, request_date_end)
+        grouped: pd.DataFrame = finalize_rollup(selected, ["source", "forecast_date"]).reset_index()
+        grouped["forecast_date"] = grouped["forecast_date"].dt.date
+
+        return grouped.set_index(["source", "forecast_date"])
+
+    def group_by_forecast_hour(self,
+                               latitude: float,
+                               longitude: float,
+                               forecast_date: date,
+                               request_date: date
+                               ) -> pd.DataFrame:
+        selected: pd.DataFrame = self._select("hourly", latitude, longitude, request_date, request_date,
+                                              forecast_date, forecast_date)
+        grouped: pd.DataFrame = finalize_rollup(selected, ["source", "forecast_hour"])
+
+        return grouped.rename_axis(["source", "forecast_datetime"])
+
+
+_rollups: dict[str, ForecastRollups] = {}
+_rollups_lock: RLock = RLock()
+
+
+def get_rollups(file_path: str) -> ForecastRollups:
+    with _rollups_lock:
+        key: str = str(Path(file_path).resolve())
+        rollups: Optional[ForecastRollups] = _rollups.get(key)
+
+        if rollups is None:
+            rollups = ForecastRollups(file_path)
+            _rollups[key] = rollups
+
+        return rollups
@@ -1,57 +1,329 @@
+import os
+import shutil
+from datetime import date
+from operator import attrgetter
 from pathlib import Path
-from typing import Union
+from typing import Union, Optional, Iterator, Any
 
+import numpy as np
 import pandas as pd
 
-from app.model import WeatherForecast
-from app.utils import float_or_none
+from app.columnar_storage import is_columnar_store, save_dataframe_to_columnar, load_columnar_into_dataframe, \
+    iterate_partitions, read_partition
+from app.instrumentation import metrics
+from app.key_index import ForecastKeyIndex, get_key_index, get_key_index_path, KEY_COLUMNS
+from app.model import WeatherForecast, ForecastBatch, FORECAST_FIELDS
+from app.rollups import ForecastRollups, get_rollups, get_rollup_source_columns, get_rollup_path, GRANULARITIES
 
 
-def save_forecasts(forecasts: Union[WeatherForecast, list[WeatherForecast]],
-                   file_path: str
-                   ) -> None:
+def convert_forecasts_into_dataframe(forecasts: Union[list[WeatherForecast], list[ForecastBatch]]) -> pd.DataFrame:
+    batches: list[ForecastBatch] = [forecast for forecast in forecasts if isinstance(forecast, ForecastBatch)]
+
+    if len(batches) == len(forecasts) and len(batches) > 0:
+        return pd.concat([batch.to_dataframe() for batch in batches], ignore_index=True)
+
+    if len(batches) > 0:
+        raise TypeError("Cannot mix WeatherForecast and ForecastBatch objects in one save")
+
+    get_values: attrgetter = attrgetter(*FORECAST_FIELDS)
+
+    return pd.DataFrame([get_values(forecast) for forecast in forecasts], columns=FORECAST_FIELDS)
+
+
+def _compute_store_keys(file_path: str, key_index: ForecastKeyIndex) -> np.ndarray:
+    keys: list[np.ndarray] = [key_index.compute_keys(chunk)
+                              for chunk in iterate_dataframe_chunks(file_path, columns=KEY_COLUMNS)]
+
+    return np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+
+
+def _get_ingest_key_index(file_path: str) -> ForecastKeyIndex:
+    key_index: ForecastKeyIndex = get_key_index(file_path)
+
+    # Stores written before the index existed are indexed once, on first save
+    if not key_index.exists() and Path(file_path).exists():
+        key_index.rebuild(_compute_store_keys(file_path, key_index))
+
+    return key_index
+
+
+def get_store_rollups(file_path: str) -> ForecastRollups:
+    rollups: ForecastRollups = get_rollups(file_path)
+
+    # Rollups of stores written before they existed are built once, chunk by chunk, on first use
+    if not rollups.exists() and Path(file_path).exists():
+        rollups.rebuild(iterate_dataframe_chunks(file_path, columns=get_rollup_source_columns()))
+
+    return rollups
+
+
+def save_forecasts(forecasts: Union[WeatherForecast, list[WeatherForecast], ForecastBatch, list[ForecastBatch]],
+                   file_path: str,
+                   deduplicate: bool = True,
+                   update_rollups: bool = True
+                   ) -> int:
     if not isinstance(forecasts, list):  # Convert single element to list with one element
         forecasts = [forecasts]
 
+    return save_dataframe(convert_forecasts_into_dataframe(forecasts), file_path, deduplicate, update_rollups)
+
+
+@metrics.timed("store")
+def save_dataframe(dataframe: pd.DataFrame,
+                   file_path: str,
+                   deduplicate: bool = True,
+                   update_rollups: bool = True
+                   ) -> int:
+    rollups: Optional[ForecastRollups] = get_store_rollups(file_path) if update_rollups else None
+
+    if not deduplicate:
+        _write_dataframe(dataframe, file_path)
+        if rollups is not None:
+            rollups.update(dataframe)
+
+        return len(dataframe)
+
+    key_index: ForecastKeyIndex = _get_ingest_key_index(file_path)
+
+    with key_index.lock:
+        dataframe, keys = key_index.filter_new(dataframe)
+
+        if len(dataframe) == 0:
+            return 0
+
+        _write_dataframe(dataframe, file_path)
+        key_index.add(keys)
+
+        if rollups is not None:
+            rollups.update(dataframe)
+
+    return len(dataframe)
+
+
+def _write_dataframe(dataframe: pd.DataFrame, file_path: str) -> None:
+    metrics.increment("stored_rows", len(dataframe))
+
+    if is_columnar_store(file_path):
+        save_dataframe_to_columnar(dataframe, file_path)
+        return
+
     path: Path = Path(file_path)
     path.parent.mkdir(parents=True, exist_ok=True)
 
-    dataframe: pd.DataFrame = pd.DataFrame([forecast.__dict__ for forecast in forecasts])
-
     if path.exists():
         dataframe.to_csv(path, mode="a", header=False, index=False)
     else:
         dataframe.to_csv(path, index=False)
 
 
-def load_forecasts_into_dataframe(file_path: str) -> pd.DataFrame:
-    dataframe: pd.DataFrame = pd.read_csv(file_path, parse_dates=["request_datetime", "forecast_datetime"])
+def compact_forecasts(file_path: str) -> int:
+    key_index: ForecastKeyIndex = get_key_index(file_path)
+
+    with key_index.lock:
+        dataframe: pd.DataFrame = load_forecasts_into_dataframe(file_path)
+        keys: np.ndarray = key_index.compute_keys(dataframe)
+        is_duplicate: np.ndarray = pd.Series(keys).duplicated().to_numpy()
+
+        if is_duplicate.any():
+            dataframe = dataframe[~is_duplicate]
+            path: Path = Path(file_path)
+            compacted_path: Path = path.with_name(f"{path.stem}.compacting{path.suffix}")
+
+            # Write the compacted copy next to the store, then swap it in
+            if compacted_path.exists():
+                _remove_store(compacted_path)
+
+            # The copy's name has a suffix, so its format is chosen here instead of by its path
+            if is_columnar_store(file_path):
+                save_dataframe_to_columnar(dataframe, str(compacted_path))
+                replaced_path: Path = path.with_name(f"{path.stem}.replaced{path.suffix}")
+                path.rename(replaced_path)
+                compacted_path.rename(path)
+                _remove_store(replaced_path)
+            else:
+                dataframe.to_csv(compacted_path, index=False)
+                os.replace(compacted_path, path)
+
+        key_index.rebuild(keys[~is_duplicate])
+        get_rollups(file_path).rebuild(dataframe)
+
+    return int(is_duplicate.sum())
+
+
+def repair_forecasts_file(file_path: str) -> int:
+    # An append interrupted by a crash leaves a partial last line in a CSV; columnar stores commit by row count
+    path: Path = Path(file_path)
+
+    if is_columnar_store(file_path) or not path.exists() or path.stat().st_size == 0:
+        return 0
+
+    with open(path, "rb+") as file:
+        file.seek(-1, os.SEEK_END)
+        if file.read(1) == b"\n":
+            return 0
+
+        size: int = file.seek(0, os.SEEK_END)
+        position: int = size
+
+        # Walk back to the last complete line
+        while position > 0:
+            block_start: int = max(0, position - 65536)
+            file.seek(block_start)
+            block: bytes = file.read(position - block_start)
+            newline: int = block.rfind(b"\n")
+
+            if newline >= 0:
+                position = block_start + newline + 1
+                break
+
+            position = block_start
+
+        file.truncate(position)
+
+    # Not even the header was complete; the next save starts the file again
+    if position == 0:
+        path.unlink()
+
+    return size - position
+
+
+def rebuild_indexes(file_path: str) -> None:
+    # The key index and the rollups are derived from the stored rows and are rebuilt from them chunk by chunk
+    key_index: ForecastKeyIndex = get_key_index(file_path)
+
+    with key_index.lock:
+        key_index.rebuild(_compute_store_keys(file_path, key_index))
+        get_rollups(file_path).rebuild(iterate_dataframe_chunks(file_path, columns=get_rollup_source_columns()))
+
+
+def get_store_size(file_path: str) -> int:
+    # Total size of the rows, the key index and the rollups; any save that wrote something changes it
+    path: Path = Path(file_path)
+    paths: list[Path] = list(path.rglob("*")) if path.is_dir() else [path, get_key_index_path(file_path)] + [
+        get_rollup_path(file_path, granularity) for granularity in GRANULARITIES
+    ]
+
+    return sum(path.stat().st_size for path in paths if path.is_file())
+
+
+def _remove_store(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+@metrics.timed("load")
+def load_forecasts_into_dataframe(file_path: str,
+                                  columns: Optional[list[str]] = None,
+                                  locations: Optional[list[tuple[float, float]]] = None,
+                                  request_date_start: Optional[date] = None,
+                                  request_date_end: Optional[date] = None
+                                  ) -> pd.DataFrame:
+    if is_columnar_store(file_path):
+        # Only the partitions and columns needed by the query are read
+        return load_columnar_into_dataframe(file_path, columns, locations, request_date_start, request_date_end)
+
+    read_columns: Optional[list[str]] = _get_csv_read_columns(columns, locations, request_date_start, request_date_end)
+    parse_dates: list[str] = [column for column in ("request_datetime", "forecast_datetime")
+                              if read_columns is None or column in read_columns]
+    dataframe: pd.DataFrame = pd.read_csv(file_path, usecols=read_columns, parse_dates=parse_dates)
+
+    return _filter_csv_dataframe(dataframe, columns, locations, request_date_start, request_date_end)
+
+
+def _get_csv_read_columns(columns: Optional[list[str]],
+                          locations: Optional[list[tuple[float, float]]],
+                          request_date_start: Optional[date],
+                          request_date_end: Optional[date]
+                          ) -> Optional[list[str]]:
+    if columns is None:
+        return None
+
+    # Filter columns are read even when they are not requested
+    read_columns: list[str] = list(columns)
+    if locations is not None:
+        read_columns += [column for column in ("latitude", "longitude") if column not in read_columns]
+    if (request_date_start is not None or request_date_end is not None) and "request_datetime" not in read_columns:
+        read_columns.append("request_datetime")
+
+    return read_columns
+
+
+def _filter_csv_dataframe(dataframe: pd.DataFrame,
+                          columns: Optional[list[str]],
+                          locations: Optional[list[tuple[float, float]]],
+                          request_date_start: Optional[date],
+                          request_date_end: Optional[date]
+                          ) -> pd.DataFrame:
+    if locations is not None:
+        dataframe = dataframe[pd.MultiIndex.from_arrays([dataframe["latitude"], dataframe["longitude"]])
+                              .isin(locations)]
+    if request_date_start is not None:
+        dataframe = dataframe[dataframe["request_datetime"].dt.date >= request_date_start]
+    if request_date_end is not None:
+        dataframe = dataframe[dataframe["request_datetime"].dt.date <= request_date_end]
+
+    if columns is not None:
+        dataframe = dataframe[columns]
 
     return dataframe
 
 
+def iterate_dataframe_chunks(file_path: str,
+                             chunk_size: int = 100_000,
+                             columns: Optional[list[str]] = None,
+                             locations: Optional[list[tuple[float, float]]] = None,
+                             request_date_start: Optional[date] = None,
+                             request_date_end: Optional[date] = None
+                             ) -> Iterator[pd.DataFrame]:
+    if is_columnar_store(file_path):
+        # Partitions outside the locations and request dates are never opened
+        for partition_path, meta in iterate_partitions(file_path, locations, request_date_start, request_date_end):
+            for start in range(0, meta["rows"], chunk_size):
+                chunk: pd.DataFrame = read_partition(partition_path, meta, columns, start, start + chunk_size,
+                                                     request_date_start, request_date_end)
+                if len(chunk) > 0:
+                    yield chunk
+        return
+
+    read_columns: Optional[list[str]] = _get_csv_read_columns(columns, locations, request_date_start, request_date_end)
+    parse_dates: list[str] = [column for column in ("request_datetime", "forecast_datetime")
+                              if read_columns is None or column in read_columns]
+
+    for chunk in pd.read_csv(file_path, usecols=read_columns, parse_dates=parse_dates, chunksize=chunk_size):
+        chunk = _filter_csv_dataframe(chunk, columns, locations, request_date_start, request_date_end)
+        if len(chunk) > 0:
+            yield chunk
+
+
+def convert_dataframe_into_models(dataframe: pd.DataFrame) -> list[WeatherForecast]:
+    # Convert whole columns into Python objects, then build the models positionally
+    columns: list[list[Any]] = []
+
+    for name in FORECAST_FIELDS:
+        series: pd.Series = dataframe[name]
+
+        if name == "source":
+            columns.append(series.tolist())
+        elif name in ("request_datetime", "forecast_datetime"):
+            columns.append(list(pd.DatetimeIndex(series).to_pydatetime()))
+        else:
+            values: np.ndarray = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            objects: np.ndarray = values.astype(object)
+            objects[np.isnan(values)] = None
+
+            columns.append(objects.tolist())
+
+    return [WeatherForecast(*row) for row in zip(*columns)]
+
+
 def load_forecasts_into_models(file_path: str) -> list[WeatherForecast]:
     dataframe: pd.DataFrame = load_forecasts_into_dataframe(file_path)
 
-    forecasts: list[WeatherForecast] = [
-        WeatherForecast(
-            source=row["source"],
-            request_datetime=row["request_datetime"].to_pydatetime(),
-            forecast_datetime=row["forecast_datetime"].to_pydatetime(),
-            latitude=float_or_none(row["latitude"]),
-            longitude=float_or_none(row["longitude"]),
-            temperature=float_or_none(row["temperature"]),
-            wind_speed=float_or_none(row["wind_speed"]),
-            wind_direction=float_or_none(row["wind_direction"]),
-            precipitation=float_or_none(row["precipitation"]),
-            humidity=float_or_none(row["humidity"]),
-            cloud_cover=float_or_none(row["cloud_cover"]),
-            air_pressure=float_or_none(row["air_pressure"]),
-            uv_index=float_or_none(row["uv_index"]),
-            dew_point=float_or_none(row["dew_point"]),
-            visibility=float_or_none(row["visibility"]),
-        )
-        for _, row in dataframe.iterrows()
-    ]
+    return convert_dataframe_into_models(dataframe)
+
 
-    return forecasts
+def iterate_forecasts_into_models(file_path: str, chunk_size: int = 100_000) -> Iterator[list[WeatherForecast]]:
+    for chunk in iterate_dataframe_chunks(file_path, chunk_size):
+        yield convert_dataframe_into_models(chunk)
@@ -1,35 +1,101 @@
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Optional, Any
+from threading import Lock
+from typing import Optional, Any, Union
 
 import numpy as np
 import pandas as pd
 import pytz
 from timezonefinder import TimezoneFinder
 
+from app.instrumentation import metrics
 
-def mps_to_kmph(speed_in_meters_per_second: Optional[float]) -> Optional[float]:
+
+def mps_to_kmph(speed_in_meters_per_second: Optional[Union[float, np.ndarray]]) -> Optional[Union[float, np.ndarray]]:
     if speed_in_meters_per_second is None:
         return None
     else:
         return speed_in_meters_per_second * 3.6
 
 
-def km_to_m(distance_in_kilometers: float) -> float:
+def km_to_m(distance_in_kilometers: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
     return 1000 * distance_in_kilometers
 
 
-def convert_local_datetime_to_utc(latitude: float, longitude: float, date: str) -> datetime:
-    timezone_finder: TimezoneFinder = TimezoneFinder()
-    timezone_name: Optional[str] = timezone_finder.timezone_at(lat=latitude, lng=longitude)
-    local_timezone = pytz.timezone(timezone_name)
+class TimezoneResolver:
+    def __init__(self, max_size: int = 4096) -> None:
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._timezone_finder: Optional[TimezoneFinder] = None
+        self._timezone_names: OrderedDict[tuple[float, float], Optional[str]] = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def get_timezone_name(self, latitude: float, longitude: float) -> Optional[str]:
+        key: tuple[float, float] = (latitude, longitude)
+
+        with self._lock:
+            if key in self._timezone_names:
+                self.hits += 1
+                self._timezone_names.move_to_end(key)
+                return self._timezone_names[key]
+
+            self.misses += 1
+
+            with metrics.timer("timezone_lookup"):
+                # Polygon data is loaded once per process, on first lookup
+                if self._timezone_finder is None:
+                    self._timezone_finder = TimezoneFinder()
+
+                timezone_name: Optional[str] = self._timezone_finder.timezone_at(lat=latitude, lng=longitude)
+
+            self._timezone_names[key] = timezone_name
+            if len(self._timezone_names) > self.max_size:
+                self._timezone_names.popitem(last=False)
+
+        return timezone_name
+
+    @metrics.timed("timezone_conversion")
+    def convert_local_datetimes_to_utc(self, latitude: float, longitude: float, dates: list[str]) -> list[datetime]:
+        local_timezone = pytz.timezone(self.get_timezone_name(latitude, longitude))
+
+        utc_datetimes: list[datetime] = []
+
+        for date in dates:
+            local_datetime = datetime.strptime(date, "%Y-%m-%d %H%M")
+            local_datetime = local_timezone.localize(local_datetime)
 
-    local_datetime = datetime.strptime(date, "%Y-%m-%d %H%M")
-    local_datetime = local_timezone.localize(local_datetime)
+            utc_datetime = local_datetime.astimezone(pytz.utc)
+            utc_datetimes.append(utc_datetime.replace(tzinfo=None))
 
-    utc_datetime = local_datetime.astimezone(pytz.utc)
-    utc_datetime = utc_datetime.replace(tzinfo=None)
+        return utc_datetimes
 
-    return utc_datetime
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._timezone_names),
+                "max_size": self.max_size
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._timezone_names.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+timezone_resolver: TimezoneResolver = TimezoneResolver()
+
+
+def convert_local_datetime_to_utc(latitude: float, longitude: float, date: str) -> datetime:
+    return timezone_resolver.convert_local_datetimes_to_utc(latitude, longitude, [date])[0]
+
+
+def convert_local_datetimes_to_utc(latitude: float, longitude: float, dates: list[str]) -> list[datetime]:
+    return timezone_resolver.convert_local_datetimes_to_utc(latitude, longitude, dates)
 
 
 def get_utc_time_without_offset() -> datetime:
@@ -55,6 +121,15 @@ def mean_angle(angles: list[float]) -> float:
     return mean_angle_deg
 
 
+def mean_angle_from_components(mean_sin: Union[float, np.ndarray],
+                               mean_cos: Union[float, np.ndarray]) -> np.ndarray:
+    # Vectorized form of the last step of mean_angle, for per-group means of sin and cos
+    mean_angle_deg: np.ndarray = np.rad2deg(np.arctan2(mean_sin, mean_cos)) % 360
+    mean_angle_deg = np.where(mean_angle_deg >= 360, 0.0, mean_angle_deg)
+
+    return mean_angle_deg
+
+
 def float_or_none(value: Any) -> Optional[Any]:
     if isinstance(value, float) and np.isnan(value):
         return None
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import time
+
+from app import api_clients
+from app.api_clients import fetch_wttr_forecast, fetch_open_meteo_forecast, fetch_met_no_forecast
+from app.async_api_clients import fetch_wttr_forecast_async, fetch_open_meteo_forecast_async, \
+    fetch_met_no_forecast_async, async_http_client
+from app.forecast_service import BatchForecastFetcher, fetch_forecasts_for_locations_async
+from app.model import Location
+from benchmarks.replay_server import ReplayServer, load_payloads
+
+
+def get_locations(count: int) -> list[Location]:
+    # Spread sites over a small area of central Europe, so they share one timezone
+    return [Location(latitude=round(49.0 + (i % 50) * 0.05, 4), longitude=round(19.0 + (i // 50) * 0.05, 4))
+            for i in range(count)]
+
+
+def run_threads(locations: list[Location], max_workers: int) -> tuple[float, int]:
+    start: float = time.perf_counter()
+    forecast_count: int = 0
+
+    with BatchForecastFetcher(max_workers=max_workers, default_provider_concurrency=max_workers) as fetcher:
+        for _, _, forecasts in fetcher.fetch(locations, [fetch_wttr_forecast, fetch_open_meteo_forecast,
+                                                         fetch_met_no_forecast]):
+            forecast_count += len(forecasts)
+
+    return time.perf_counter() - start, forecast_count
+
+
+async def _run_asyncio(locations: list[Location]) -> int:
+    forecast_count: int = 0
+
+    try:
+        async for _, forecasts in fetch_forecasts_for_locations_async(
+                locations, [fetch_wttr_forecast_async, fetch_open_meteo_forecast_async, fetch_met_no_forecast_async]):
+            forecast_count += len(forecasts)
+    finally:
+        await async_http_client.close()
+
+    return forecast_count
+
+
+def run_asyncio(locations: list[Location]) -> tuple[float, int]:
+    start: float = time.perf_counter()
+    forecast_count: int = asyncio.run(_run_asyncio(locations))
+
+    return time.perf_counter() - start, forecast_count
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Compare thread and asyncio fetch modes")
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server-side delay per response (seconds)")
+    parser.add_argument("--max-workers", type=int, default=32)
+    parser.add_argument("--payloads", default=None, help="Directory with recorded <provider>.json responses")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    locations: list[Location] = get_locations(arguments.locations)
+
+    with ReplayServer(load_payloads(arguments.payloads), latency=arguments.latency) as server:
+        api_clients.provider_urls.update(server.get_provider_urls())
+
+        for mode, run in (("threads", lambda: run_threads(locations, arguments.max_workers)),
+                          ("asyncio", lambda: run_asyncio(locations))):
+            elapsed, forecast_count = run()
+            requests_per_second: float = 3 * len(locations) / elapsed
+
+            print(f"{mode:>8}: {elapsed:7.3f} s, {requests_per_second:8.1f} requests/s, {forecast_count} forecasts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import timeit
+from typing import Any, Callable
+
+from app.api_clients import parse_wttr_forecast_batch, parse_wttr_forecast, parse_open_meteo_forecast_batch, \
+    parse_open_meteo_forecast, parse_met_no_forecast_batch, parse_met_no_forecast
+from benchmarks.replay_server import load_payloads
+
+PARSERS: dict[str, tuple[Callable, Callable]] = {
+    "wttr": (parse_wttr_forecast_batch, parse_wttr_forecast),
+    "open_meteo": (parse_open_meteo_forecast_batch, parse_open_meteo_forecast),
+    "met_no": (parse_met_no_forecast_batch, parse_met_no_forecast)
+}
+
+
+def time_call(function: Callable[[], Any], repeat: int, number: int) -> float:
+    # Best of several runs, in microseconds per call
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1e6
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Measure provider response parse cost")
+    parser.add_argument("--payloads", default=None, help="Directory with recorded <provider>.json responses")
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments: argparse.Namespace = parser.parse_args()
+
+    payloads: dict[str, bytes] = load_payloads(arguments.payloads)
+    latitude: float = 52.23
+    longitude: float = 21.01
+
+    print(f"{'provider':>10} {'rows':>6} {'json decode':>12} {'batch parse':>12} {'model parse':>12}  [us/call]")
+
+    for provider, (parse_batch, parse_models) in PARSERS.items():
+        body: bytes = payloads[provider]
+        payload: dict[str, Any] = json.loads(body)
+        rows: int = len(parse_batch(payload, latitude, longitude))
+
+        decode_time: float = time_call(lambda: json.loads(body), arguments.repeat, arguments.number)
+        batch_time: float = time_call(lambda: parse_batch(payload, latitude, longitude), arguments.repeat,
+                                      arguments.number)
+        models_time: float = time_call(lambda: parse_models(payload, latitude, longitude), arguments.repeat,
+                                       arguments.number)
+
+        print(f"{provider:>10} {rows:>6} {decode_time:>12.1f} {batch_time:>12.1f} {models_time:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
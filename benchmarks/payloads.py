@@ -0,0 +1,100 @@
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Any
+
+
+def _series(rng: random.Random, hours: int, mean: float, amplitude: float, noise: float) -> list[float]:
+    return [
+        round(mean + amplitude * math.sin(2 * math.pi * hour / 24) + rng.uniform(-noise, noise), 1)
+        for hour in range(hours)
+    ]
+
+
+def build_wttr_payload(start: datetime, seed: int = 0, days: int = 3) -> dict[str, Any]:
+    rng: random.Random = random.Random(seed)
+    weather: list[dict[str, Any]] = []
+
+    for day_offset in range(days):
+        day: datetime = start + timedelta(days=day_offset)
+        temperatures: list[float] = _series(rng, 8, 15, 6, 1)
+        hourly: list[dict[str, str]] = [
+            {
+                "time": str(hour * 300),
+                "tempC": str(round(temperatures[hour])),
+                "windspeedKmph": str(rng.randint(0, 30)),
+                "winddirDegree": str(rng.randint(0, 359)),
+                "precipMM": f"{max(0.0, rng.uniform(-1, 1)):.1f}",
+                "humidity": str(rng.randint(40, 95)),
+                "pressure": str(rng.randint(995, 1030)),
+                "visibility": str(rng.randint(5, 10))
+            }
+            for hour in range(8)
+        ]
+
+        weather.append({"date": day.strftime("%Y-%m-%d"), "hourly": hourly})
+
+    return {"weather": weather}
+
+
+def build_open_meteo_payload(start: datetime, seed: int = 0, days: int = 7) -> dict[str, Any]:
+    rng: random.Random = random.Random(seed)
+    hours: int = days * 24
+
+    return {
+        "hourly": {
+            "time": [(start + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M") for hour in range(hours)],
+            "temperature_2m": _series(rng, hours, 15, 6, 1),
+            "precipitation": [round(max(0.0, rng.uniform(-1, 1)), 1) for _ in range(hours)],
+            "relative_humidity_2m": [rng.randint(40, 95) for _ in range(hours)],
+            "windspeed_10m": [round(rng.uniform(0, 30), 1) for _ in range(hours)],
+            "winddirection_10m": [rng.randint(0, 359) for _ in range(hours)],
+            "cloudcover": [rng.randint(0, 100) for _ in range(hours)],
+            "surface_pressure": _series(rng, hours, 1010, 5, 1),
+            "dew_point_2m": _series(rng, hours, 9, 3, 1),
+            "uv_index": [round(max(0.0, 6 * math.sin(math.pi * ((hour % 24) - 6) / 12)), 2) for hour in range(hours)],
+            "visibility": [rng.randint(5000, 50000) for _ in range(hours)]
+        }
+    }
+
+
+def build_met_no_payload(start: datetime, seed: int = 0, hourly_steps: int = 60,
+                         six_hourly_steps: int = 20) -> dict[str, Any]:
+    rng: random.Random = random.Random(seed)
+
+    # Hourly steps for the near term, then 6-hourly steps without next_1_hours, like the real API
+    offsets: list[int] = list(range(hourly_steps)) + [hourly_steps + 6 * step for step in range(six_hourly_steps)]
+    temperatures: list[float] = _series(rng, offsets[-1] + 1, 15, 6, 1)
+    timeseries: list[dict[str, Any]] = []
+
+    for offset in offsets:
+        entry_data: dict[str, Any] = {
+            "instant": {
+                "details": {
+                    "air_pressure_at_sea_level": round(rng.uniform(995, 1030), 1),
+                    "air_temperature": temperatures[offset],
+                    "cloud_area_fraction": round(rng.uniform(0, 100), 1),
+                    "relative_humidity": round(rng.uniform(40, 95), 1),
+                    "wind_from_direction": round(rng.uniform(0, 359), 1),
+                    "wind_speed": round(rng.uniform(0, 10), 1)
+                }
+            }
+        }
+
+        if offset < hourly_steps:
+            entry_data["next_1_hours"] = {"details": {"precipitation_amount": round(max(0.0, rng.uniform(-1, 1)), 1)}}
+
+        timeseries.append({
+            "time": (start + timedelta(hours=offset)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "data": entry_data
+        })
+
+    return {"properties": {"timeseries": timeseries}}
+
+
+def build_payloads(start: datetime, seed: int = 0) -> dict[str, dict[str, Any]]:
+    return {
+        "wttr": build_wttr_payload(start, seed),
+        "open_meteo": build_open_meteo_payload(start, seed),
+        "met_no": build_met_no_payload(start, seed)
+    }
@@ -0,0 +1,75 @@
+import argparse
+import time
+from calendar import monthrange
+from datetime import date
+from typing import Callable
+
+import pandas as pd
+
+from app.analysis.functions import filter_forecasts_by_latitude_and_longitude, filter_forecasts_by_forecast_date, \
+    filter_forecasts_by_request_date, filter_forecasts_by_forecast_date_range
+from app.analysis.query import ForecastQuery
+from benchmarks.synthetic_history import generate_history
+
+
+def measure(function: Callable[[], pd.DataFrame], repeat: int) -> tuple[float, pd.DataFrame]:
+    best: float = float("inf")
+    result: pd.DataFrame = pd.DataFrame()
+
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Compare full-scan filters with ForecastQuery")
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments: argparse.Namespace = parser.parse_args()
+
+    dataframe: pd.DataFrame = generate_history(arguments.sites, arguments.days)
+    latitude, longitude = dataframe["latitude"].iloc[0], dataframe["longitude"].iloc[0]
+    day: date = dataframe["forecast_datetime"].iloc[len(dataframe) // 2].date()
+    month_end: date = date(day.year, day.month, monthrange(day.year, day.month)[1])
+
+    start: float = time.perf_counter()
+    query: ForecastQuery = ForecastQuery(dataframe)
+    build_time: float = time.perf_counter() - start
+
+    print(f"{len(dataframe)} rows, index built in {build_time:.3f} s")
+
+    cases: dict[str, tuple[Callable[[], pd.DataFrame], Callable[[], pd.DataFrame]]] = {
+        "day view": (
+            lambda: filter_forecasts_by_request_date(filter_forecasts_by_forecast_date(
+                filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude), day), day),
+            lambda: query.select(latitude, longitude, day, day, day, day)
+        ),
+        "month view": (
+            lambda: (lambda filtered: filtered[
+                (filtered["forecast_datetime"].dt.year == day.year) &
+                (filtered["forecast_datetime"].dt.month == day.month)
+                ])(filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude)),
+            lambda: query.select(latitude, longitude, date(day.year, day.month, 1), month_end)
+        ),
+        "sources view": (
+            lambda: filter_forecasts_by_forecast_date_range(
+                filter_forecasts_by_latitude_and_longitude(dataframe, latitude, longitude), day, month_end),
+            lambda: query.select(latitude, longitude, request_date_start=day, request_date_end=month_end)
+        )
+    }
+
+    for name, (scan, indexed) in cases.items():
+        scan_time, expected = measure(scan, arguments.repeat)
+        indexed_time, result = measure(indexed, arguments.repeat)
+
+        identical: bool = expected.equals(result) and expected.index.equals(result.index)
+        print(f"{name:>12}: scan {scan_time * 1000:9.2f} ms, indexed {indexed_time * 1000:7.2f} ms, "
+              f"speedup {scan_time / indexed_time:7.1f}x, {len(result)} rows, identical={identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from threading import Thread
+from typing import Any, Optional
+
+from benchmarks.payloads import build_payloads
+
+
+def load_payloads(directory: Optional[str] = None) -> dict[str, bytes]:
+    # Recorded responses are stored as <provider>.json; synthetic ones are used when none are recorded
+    payloads: dict[str, Any] = build_payloads(datetime(2025, 8, 31))
+
+    if directory is not None:
+        for path in Path(directory).glob("*.json"):
+            payloads[path.stem] = json.loads(path.read_text())
+
+    return {provider: json.dumps(payload).encode() for provider, payload in payloads.items()}
+
+
+class ReplayServer:
+    def __init__(self, payloads: dict[str, bytes], latency: float = 0.0, host: str = "127.0.0.1",
+                 port: int = 0) -> None:
+        server: ReplayServer = self
+        self.payloads: dict[str, bytes] = payloads
+        self.latency: float = latency
+        self.request_count: int = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                server.request_count += 1
+                provider: str = self.path.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+                body: Optional[bytes] = server.payloads.get(provider)
+
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_) -> None:
+                pass
+
+        self._server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+
+        return f"http://{host}:{port}"
+
+    def get_provider_urls(self) -> dict[str, str]:
+        return {provider: f"{self.base_url}/{provider}" for provider in self.payloads}
+
+    def start(self) -> "ReplayServer":
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from app import api_clients
+from app.analysis.forecast_sources_comparison import get_source_comparison
+from app.analysis.functions import group_forecasts, get_comparable_features
+from app.analysis.single_day_forecast_plot import get_day_forecasts
+from app.analysis.single_month_forecast_plot import get_month_aggregates
+from app.api_clients import fetch_wttr_forecast_batch, fetch_open_meteo_forecast_batch, fetch_met_no_forecast_batch
+from app.forecast_service import fetch_forecasts
+from app.instrumentation import metrics
+from app.model import WeatherForecast
+from app.provider_health import provider_health
+from app.storage import save_forecasts, load_forecasts_into_dataframe, load_forecasts_into_models, \
+    convert_dataframe_into_models
+from benchmarks.replay_server import ReplayServer, load_payloads
+from benchmarks.synthetic_history import PROVIDERS, generate_history, get_site_coordinates
+
+
+def _count(result: Any) -> Optional[int]:
+    if isinstance(result, int):  # Rows written
+        return result
+    if isinstance(result, dict):
+        return sum(len(value) for value in result.values())
+    if hasattr(result, "features") and isinstance(result.features, dict):  # AlignedForecasts
+        return sum(values.size for values in result.features.values())
+    if hasattr(result, "__len__"):
+        return len(result)
+
+    return None
+
+
+def run_case(name: str,
+             function: Callable[[Any], Any],
+             repeat: int,
+             setup: Callable[[], Any] = lambda: None
+             ) -> dict[str, Any]:
+    # Setup runs before every repetition and is not timed; its result is the argument of the timed call
+    seconds: list[float] = []
+    result: Any = None
+
+    for _ in range(repeat):
+        argument: Any = setup()
+
+        start: float = time.perf_counter()
+        result = function(argument)
+        seconds.append(time.perf_counter() - start)
+
+    case: dict[str, Any] = {
+        "name": name,
+        "seconds": seconds,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "items": _count(result)
+    }
+    print(f"{name:>40}: best {case['best'] * 1000:10.2f} ms, median {case['median'] * 1000:10.2f} ms, "
+          f"{case['items']} items")
+
+    return case
+
+
+def benchmark_fetch(locations: list[tuple[float, float]], latency: float, repeat: int,
+                    payloads_directory: Optional[str]) -> dict[str, Any]:
+    fetch_functions: list = [fetch_wttr_forecast_batch, fetch_open_meteo_forecast_batch, fetch_met_no_forecast_batch]
+    provider_urls: dict[str, str] = dict(api_clients.provider_urls)
+
+    def fetch_all(_) -> list[WeatherForecast]:
+        forecasts: list[WeatherForecast] = []
+        for latitude, longitude in locations:
+            forecasts += fetch_forecasts(latitude, longitude, fetch_functions)
+
+        return forecasts
+
+    try:
+        with ReplayServer(load_payloads(payloads_directory), latency=latency) as server:
+            api_clients.provider_urls.update(server.get_provider_urls())
+            provider_health.clear()
+
+            return run_case("fetch_forecasts", fetch_all, repeat)
+    finally:
+        api_clients.provider_urls.update(provider_urls)
+
+
+def benchmark_storage(history: pd.DataFrame, directory: Path, store_format: str, repeat: int) -> list[dict[str, Any]]:
+    suffix: str = ".csv" if store_format == "csv" else ""
+    models: list[WeatherForecast] = convert_dataframe_into_models(history)
+    paths: list[str] = []
+
+    def new_store() -> str:
+        # Every save starts from an empty store, with its own key index and rollups
+        paths.append(str(directory / f"save_{len(paths)}{suffix}"))
+        return paths[-1]
+
+    results: list[dict[str, Any]] = [
+        run_case(f"save_forecasts[{store_format}]", lambda path: save_forecasts(models, path), repeat,
+                 new_store)
+    ]
+
+    file_path: str = paths[-1]
+    results.append(run_case(f"load_forecasts_into_dataframe[{store_format}]",
+                            lambda _: load_forecasts_into_dataframe(file_path), repeat))
+    results.append(run_case(f"load_forecasts_into_models[{store_format}]",
+                            lambda _: load_forecasts_into_models(file_path), repeat))
+
+    return results
+
+
+def benchmark_analysis(history: pd.DataFrame, repeat: int) -> list[dict[str, Any]]:
+    latitude, longitude = history["latitude"].iloc[0], history["longitude"].iloc[0]
+    middle_day: date = history["request_datetime"].iloc[len(history) // 2].date()
+    first_day: date = history["request_datetime"].min().date()
+    features: list[str] = get_comparable_features()
+
+    return [
+        run_case("group_forecasts", lambda _: group_forecasts(history, ["source", "forecast_datetime"]), repeat),
+        run_case("day view", lambda _: get_day_forecasts(history, latitude, longitude, middle_day, middle_day),
+                 repeat),
+        # The month view caches its aggregates per dataframe, so every repetition gets a fresh copy
+        run_case("month view", lambda dataframe: get_month_aggregates(dataframe, latitude, longitude,
+                                                                      middle_day.year, middle_day.month, features),
+                 repeat, history.copy),
+        run_case("sources view", lambda _: get_source_comparison(history, latitude, longitude, first_day,
+                                                                  middle_day), repeat)
+    ]
+
+
+def compare_results(results: dict[str, Any], baseline_path: str) -> None:
+    baseline: dict[str, dict[str, Any]] = {case["name"]: case
+                                           for case in json.loads(Path(baseline_path).read_text())["results"]}
+
+    print(f"\nCompared with {baseline_path} (best times, >1 is slower):")
+    for case in results["results"]:
+        previous: Optional[dict[str, Any]] = baseline.get(case["name"])
+
+        if previous is not None:
+            print(f"{case['name']:>40}: {case['best'] / previous['best']:6.2f}x")
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Time the main fetch, storage and "
+                                                                          "analysis paths on synthetic data")
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--providers", nargs="+", default=list(PROVIDERS), choices=list(PROVIDERS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fetch-locations", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Server-side delay per response (seconds)")
+    parser.add_argument("--payloads", default=None, help="Directory with recorded <provider>.json responses")
+    parser.add_argument("--stores", nargs="+", default=["csv"], choices=["csv", "columnar"])
+    parser.add_argument("--metrics", action="store_true", help="Enable instrumentation and add its summary")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmark_<UTC time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare against")
+    arguments: argparse.Namespace = parser.parse_args()
+
+    created: datetime = datetime.now(tz=timezone.utc)
+    metrics.enabled = arguments.metrics
+
+    history: pd.DataFrame = generate_history(arguments.sites, arguments.days, arguments.providers,
+                                             seed=arguments.seed)
+    print(f"{len(history)} synthetic rows ({arguments.sites} sites x {arguments.days} days x "
+          f"{len(arguments.providers)} providers)")
+
+    results: list[dict[str, Any]] = [
+        benchmark_fetch(get_site_coordinates(arguments.fetch_locations, arguments.seed), arguments.latency,
+                        arguments.repeat, arguments.payloads)
+    ]
+
+    directory: Path = Path(tempfile.mkdtemp(prefix="forecast_benchmark_"))
+    try:
+        for store_format in arguments.stores:
+            results += benchmark_storage(history, directory, store_format, arguments.repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results += benchmark_analysis(history, arguments.repeat)
+
+    report: dict[str, Any] = {
+        "created": created.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "parameters": {key: value for key, value in vars(arguments).items() if key not in ("output", "compare")},
+        "rows": len(history),
+        "results": results
+    }
+    if arguments.metrics:
+        report["metrics"] = metrics.get_summary()
+
+    output: str = arguments.output or f"benchmark_{created:%Y%m%dT%H%M%SZ}.json"
+    Path(output).write_text(json.dumps(report, indent=1))
+    print(f"Wrote {output}")
+
+    if arguments.compare is not None:
+        compare_results(report, arguments.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.model import FORECAST_FIELDS
+
+# Time step between forecast points (hours) and features each provider reports
+PROVIDERS: dict[str, tuple[int, list[str]]] = {
+    "wttr": (3, ["temperature", "wind_speed", "wind_direction", "precipitation", "humidity", "air_pressure",
+                 "visibility"]),
+    "open_meteo": (1, ["temperature", "wind_speed", "wind_direction", "precipitation", "humidity", "cloud_cover",
+                       "air_pressure", "uv_index", "dew_point", "visibility"]),
+    "met_no": (1, ["temperature", "wind_speed", "wind_direction", "precipitation", "humidity", "air_pressure",
+                   "dew_point", "cloud_cover", "visibility"])
+}
+
+FEATURE_RANGES: dict[str, tuple[float, float]] = {
+    "temperature": (-10, 35),
+    "wind_speed": (0, 60),
+    "wind_direction": (0, 360),
+    "precipitation": (0, 5),
+    "humidity": (20, 100),
+    "cloud_cover": (0, 100),
+    "air_pressure": (980, 1040),
+    "uv_index": (0, 9),
+    "dew_point": (-15, 25),
+    "visibility": (1000, 50000)
+}
+
+
+def get_site_coordinates(sites: int, seed: int = 0) -> list[tuple[float, float]]:
+    rng: np.random.Generator = np.random.default_rng(seed)
+    latitudes: np.ndarray = np.round(rng.uniform(49.0, 54.5, sites), 2)
+    longitudes: np.ndarray = np.round(rng.uniform(14.5, 24.0, sites), 2)
+
+    return list(zip(latitudes.tolist(), longitudes.tolist()))
+
+
+def generate_history(sites: int,
+                     days: int,
+                     providers: Optional[list[str]] = None,
+                     start: datetime = datetime(2025, 1, 1),
+                     horizon_hours: int = 168,
+                     seed: int = 0
+                     ) -> pd.DataFrame:
+    # One request per site, provider and day, each forecasting horizon_hours ahead
+    rng: np.random.Generator = np.random.default_rng(seed)
+    providers = providers or list(PROVIDERS)
+    coordinates: np.ndarray = np.array(get_site_coordinates(sites, seed))
+    request_offsets: np.ndarray = np.arange(days) * 24 + 6
+    request_seconds: np.ndarray = rng.integers(0, 60, (sites, days))
+
+    dataframes: list[pd.DataFrame] = []
+
+    for source in providers:
+        step, features = PROVIDERS[source]
+        lead_hours: np.ndarray = np.arange(0, horizon_hours, step)
+
+        site_index, day_index, lead_hour = (array.ravel() for array in np.meshgrid(
+            np.arange(sites), np.arange(days), lead_hours, indexing="ij"))
+        size: int = len(site_index)
+        request_hour: np.ndarray = request_offsets[day_index]
+
+        start_ns: np.datetime64 = np.datetime64(start, "ns")
+        request_datetimes: np.ndarray = start_ns + (
+                request_hour * 3600 + request_seconds[site_index, day_index]).astype("timedelta64[s]")
+        forecast_datetimes: np.ndarray = start_ns + (request_hour + lead_hour).astype("timedelta64[h]")
+
+        columns: dict[str, np.ndarray] = {
+            "source": np.full(size, source, dtype=object),
+            "request_datetime": request_datetimes,
+            "forecast_datetime": forecast_datetimes,
+            "latitude": coordinates[site_index, 0],
+            "longitude": coordinates[site_index, 1]
+        }
+
+        for feature in FORECAST_FIELDS[5:]:
+            if feature in features:
+                low, high = FEATURE_RANGES[feature]
+                columns[feature] = np.round(rng.uniform(low, high, size), 1)
+            else:
+                columns[feature] = np.full(size, np.nan)
+
+        dataframes.append(pd.DataFrame(columns))
+
+    return pd.concat(dataframes, ignore_index=True)